@@ -0,0 +1,84 @@
+"""
+Benchmark do pré-filtro de termos bloqueados (Aho-Corasick).
+
+Gera listas de termos e mensagens sintéticas de tamanhos crescentes e compara o
+tempo de verificação do autômato com a busca ingênua (um `in` por termo sobre o
+texto normalizado). Nenhuma chamada de rede é feita.
+
+Uso:
+    python benchmarks/bench_blocked_terms.py [repeticoes]
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from blocked_terms import BlockedTermsMatcher
+from cache import normalizar_texto
+
+REPETICOES = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+TAMANHOS_LISTA = (10, 1_000, 10_000, 50_000)
+TAMANHOS_MENSAGEM = (200, 5_000, 50_000)
+
+
+def palavra(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+
+
+def gerar_termos(rng: random.Random, n: int, vocabulario):
+    return [" ".join(rng.choices(vocabulario, k=rng.randint(1, 3))) for _ in range(n)]
+
+
+def gerar_mensagem(rng: random.Random, tamanho: int, vocabulario) -> str:
+    partes, total = [], 0
+    while total < tamanho:
+        partes.append(rng.choice(vocabulario))
+        total += len(partes[-1]) + 1
+    return " ".join(partes)
+
+
+def busca_ingenua(termos, texto: str) -> bool:
+    normalizado = f" {normalizar_texto(texto)} "
+    return any(f" {termo} " in normalizado for termo in termos)
+
+
+def cronometrar(funcao, repeticoes: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - inicio) / repeticoes
+
+
+def main():
+    rng = random.Random(42)
+    # Vocabulários disjuntos: as mensagens não contêm termos (pior caso, o texto
+    # inteiro é percorrido), mas compartilham prefixos com eles
+    vocabulario = sorted({palavra(rng) for _ in range(40_000)})
+    rng.shuffle(vocabulario)
+    vocab_termos, vocab_mensagens = vocabulario[::2], vocabulario[1::2]
+    mensagens = {tamanho: gerar_mensagem(rng, tamanho, vocab_mensagens)
+                 for tamanho in TAMANHOS_MENSAGEM}
+
+    print(f"{'termos':>7} {'mensagem':>9} {'compilação':>11} "
+          f"{'aho-corasick':>13} {'ingênua':>11} {'ganho':>7}")
+    for n_termos in TAMANHOS_LISTA:
+        termos = gerar_termos(rng, n_termos, vocab_termos)
+        inicio = time.perf_counter()
+        matcher = BlockedTermsMatcher(termos)
+        compilacao = time.perf_counter() - inicio
+        normalizados = matcher.termos
+
+        for tamanho, mensagem in mensagens.items():
+            assert not matcher.contem(mensagem) and not busca_ingenua(normalizados, mensagem)
+            t_ac = cronometrar(lambda: matcher.contem(mensagem), REPETICOES)
+            t_ing = cronometrar(lambda: busca_ingenua(normalizados, mensagem),
+                                max(1, REPETICOES // 10))
+            print(f"{n_termos:>7} {tamanho:>9} {compilacao * 1e3:>8.1f} ms "
+                  f"{t_ac * 1e6:>10.0f} µs {t_ing * 1e6:>8.0f} µs {t_ing / t_ac:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
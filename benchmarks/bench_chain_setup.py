@@ -0,0 +1,67 @@
+"""
+Micro-benchmark do custo de preparação (setup) das chains por requisição.
+
+Compara o comportamento anterior, em que cada nó criava um ChatPromptTemplate e um
+ChatOpenAI (com seu próprio pool HTTP) a cada chamada, com o ChainRegistry, que
+compila as chains uma única vez. Nenhuma chamada de rede é feita.
+
+Uso:
+    python benchmarks/bench_chain_setup.py [n_requisicoes]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+
+import server
+
+N_REQUISICOES = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+NOS_POR_REQUISICAO = ("categorize", "handle_technical")
+
+
+def setup_por_requisicao() -> int:
+    """Comportamento anterior: template e cliente recriados em cada nó."""
+    objetos = 0
+    for nome in NOS_POR_REQUISICAO:
+        prompt = ChatPromptTemplate.from_template(server.ChainRegistry.PROMPTS[nome])
+        llm = ChatOpenAI(temperature=0, model=server.LLM_MODEL)
+        _ = prompt | llm
+        objetos += 2
+    return objetos
+
+
+def setup_com_registro(registry: server.ChainRegistry) -> int:
+    """Comportamento atual: chains obtidas do registro já compilado."""
+    for nome in NOS_POR_REQUISICAO:
+        registry.get(nome)
+    return 0
+
+
+def medir(funcao, *args) -> tuple:
+    objetos = 0
+    inicio = time.perf_counter()
+    for _ in range(N_REQUISICOES):
+        objetos += funcao(*args)
+    decorrido = time.perf_counter() - inicio
+    return decorrido / N_REQUISICOES * 1e6, objetos / N_REQUISICOES
+
+
+if __name__ == "__main__":
+    registry = server.ChainRegistry()
+    inicio = time.perf_counter()
+    registry.build()
+    build_ms = (time.perf_counter() - inicio) * 1e3
+
+    antes_us, antes_obj = medir(setup_por_requisicao)
+    depois_us, depois_obj = medir(setup_com_registro, registry)
+
+    print(f"Requisições simuladas: {N_REQUISICOES} (nós: {', '.join(NOS_POR_REQUISICAO)})")
+    print(f"Build único do registro: {build_ms:.1f} ms")
+    print(f"Antes : {antes_us:10.1f} µs/req, {antes_obj:.0f} objetos (templates + clientes) por req")
+    print(f"Depois: {depois_us:10.1f} µs/req, {depois_obj:.0f} objetos por req")
+    print(f"Redução: {antes_us / max(depois_us, 1e-9):.0f}x")
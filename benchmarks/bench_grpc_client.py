@@ -0,0 +1,113 @@
+"""
+Benchmark do custo fixo por pergunta no cliente gRPC: canal por chamada versus
+canais persistentes (`GRPCClient`).
+
+O caminho antigo reproduz o comportamento anterior da interface: `asyncio.run`
+cria um event loop e abre um canal (com handshake HTTP/2) a cada pergunta. O
+servidor de teste apenas ecoa a pergunta, de modo que a medição isola o custo do
+cliente. São reportadas a latência média por chamada em uma sessão e a vazão com
+N sessões simultâneas. Com várias sessões, o caminho antigo mantém vários event
+loops do gRPC aio ativos ao mesmo tempo e pode registrar erros de callback
+(BlockingIOError) do próprio gRPC.
+
+Uso:
+    python benchmarks/bench_grpc_client.py [chamadas] [sessoes]
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from grpc import aio
+
+import genai_pb2
+import genai_pb2_grpc
+from grpc_client import GRPCClient
+
+N_CHAMADAS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+N_SESSOES = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+
+class EcoServicer(genai_pb2_grpc.GenAiServiceServicer):
+    async def AskQuestion(self, request, context):
+        return genai_pb2.AnswerResponse(answer=request.question)
+
+
+def iniciar_servidor():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    async def iniciar():
+        server = aio.server()
+        genai_pb2_grpc.add_GenAiServiceServicer_to_server(EcoServicer(), server)
+        port = server.add_insecure_port("localhost:0")
+        await server.start()
+        return server, port
+
+    # O servidor é encerrado se não houver referência a ele
+    return asyncio.run_coroutine_threadsafe(iniciar(), loop).result()
+
+
+def chamada_antiga(port: int):
+    async def perguntar():
+        async with aio.insecure_channel(f"localhost:{port}") as channel:
+            stub = genai_pb2_grpc.GenAiServiceStub(channel)
+            return (await stub.AskQuestion(genai_pb2.QuestionRequest(question="oi"))).answer
+
+    return lambda: asyncio.run(perguntar())
+
+
+def chamada_persistente(port: int):
+    client = GRPCClient(port=port)
+    return lambda: client.ask_question_sync("oi")
+
+
+def medir_latencia(chamar) -> float:
+    chamar()  # Aquecimento
+    duracoes = []
+    for _ in range(N_CHAMADAS):
+        inicio = time.perf_counter()
+        chamar()
+        duracoes.append(time.perf_counter() - inicio)
+    return statistics.mean(duracoes) * 1000
+
+
+def medir_vazao(chamar) -> float:
+    barreira = threading.Barrier(N_SESSOES + 1)
+
+    def sessao():
+        barreira.wait()
+        for _ in range(N_CHAMADAS):
+            chamar()
+
+    threads = [threading.Thread(target=sessao) for _ in range(N_SESSOES)]
+    for thread in threads:
+        thread.start()
+    barreira.wait()
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return N_SESSOES * N_CHAMADAS / (time.perf_counter() - inicio)
+
+
+def main():
+    logging.disable(logging.WARNING)
+    server, port = iniciar_servidor()
+    print(f"{N_CHAMADAS} chamadas por sessão, {N_SESSOES} sessões simultâneas")
+    base = None
+    for nome, fabrica in (("canal/chamada", chamada_antiga), ("persistente", chamada_persistente)):
+        chamar = fabrica(port)
+        latencia = medir_latencia(chamar)
+        vazao = medir_vazao(chamar)
+        base = base or latencia
+        print(f"{nome:>14}: {latencia:6.2f} ms/chamada ({base / latencia:.1f}x), "
+              f"{vazao:7.0f} chamadas/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark da verificação de cota de mensagens: contador no banco versus `QuotaService`.
+
+O caminho antigo lê `message_limit.counter` e o incrementa no SQLite a cada
+mensagem; o `QuotaService` verifica a cota em memória e grava os incrementos em
+lote. São reportadas as verificações por segundo de cada caminho e os commits
+gerados.
+
+Uso:
+    python benchmarks/bench_quota.py [usuarios] [verificacoes_por_usuario]
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+_TMP = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_FILE", os.path.join(_TMP, "database.db"))
+os.environ.setdefault("AUTH_LOG_FILE", os.path.join(_TMP, "autheticate.log"))
+
+from authenticate import DatabaseManager
+from quota import QuotaService
+
+N_USUARIOS = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+VERIFICACOES = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+LIMITE = N_USUARIOS * VERIFICACOES  # Nenhuma verificação é negada
+
+
+def preparar(nome: str):
+    db = DatabaseManager(os.path.join(_TMP, f"{nome}.db"))
+    emails = [f"usuario{n}@bench.com" for n in range(N_USUARIOS)]
+    for email in emails:
+        db.add_user(email)
+        db.initialize_message_limit(email)
+    instrucoes = []
+    with db.get_connection() as conn:
+        conn.set_trace_callback(instrucoes.append)
+    return db, emails, instrucoes
+
+
+def commits(instrucoes) -> int:
+    return sum(1 for sql in instrucoes if sql.strip().upper() == "COMMIT")
+
+
+def medir_banco() -> tuple:
+    db, emails, instrucoes = preparar("banco")
+    inicio = time.perf_counter()
+    for _ in range(VERIFICACOES):
+        for email in emails:
+            _, contador = db.get_message_limit(email)
+            if contador < LIMITE:
+                db.update_message_counter(email)
+    decorrido = time.perf_counter() - inicio
+    return N_USUARIOS * VERIFICACOES / decorrido, commits(instrucoes)
+
+
+def medir_quota() -> tuple:
+    db, emails, instrucoes = preparar("quota")
+    quota = QuotaService(limite=LIMITE, storage=db)
+
+    async def executar():
+        quota.iniciar()
+        for _ in range(VERIFICACOES):
+            for email in emails:
+                await quota.verificar(email)
+        await quota.aclose()
+
+    inicio = time.perf_counter()
+    asyncio.run(executar())
+    decorrido = time.perf_counter() - inicio
+    assert db.get_message_limit(emails[0])[1] == VERIFICACOES
+    return N_USUARIOS * VERIFICACOES / decorrido, commits(instrucoes)
+
+
+def main():
+    logging.disable(logging.WARNING)
+    print(f"{N_USUARIOS} usuários x {VERIFICACOES} verificações")
+    base = None
+    for nome, medir in (("banco", medir_banco), ("QuotaService", medir_quota)):
+        vazao, n_commits = medir()
+        base = base or vazao
+        print(f"{nome:>12}: {vazao:9.0f} verificações/s ({vazao / base:.1f}x), {n_commits} commits")
+
+
+if __name__ == "__main__":
+    main()
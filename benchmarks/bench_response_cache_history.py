@@ -0,0 +1,110 @@
+"""
+Benchmark da taxa de acertos do cache de respostas em conversas com histórico.
+
+Simula conversas com perguntas sorteadas de `data/consultas_rotuladas.jsonl` e
+compara as políticas de cache:
+
+- ignorar o histórico (comportamento anterior ao histórico nos prompts; pode
+  devolver respostas que dependiam de outra conversa);
+- usar o cache apenas sem histórico (só o primeiro turno de cada conversa);
+- indexar pelo resumo da janela (`contexto_historico`);
+- indexar pelo resumo da janela e reaproveitar, para consultas informais curtas,
+  as respostas 'simples' geradas sem histórico (política atual do `ResponseCache`).
+
+Também reporta o custo de uma consulta ao cache com uma janela no orçamento máximo.
+
+Uso:
+    python benchmarks/bench_response_cache_history.py [conversas] [turnos_por_conversa]
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from cache import ResponseCache
+from conversation import ConversationWindow
+
+N_CONVERSAS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+TURNOS = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+DADOS = os.path.join(os.path.dirname(__file__), "data", "consultas_rotuladas.jsonl")
+
+
+def carregar_consultas():
+    with open(DADOS, encoding="utf-8") as arquivo:
+        return [json.loads(linha) for linha in arquivo if linha.strip()]
+
+
+def simular(consultas, buscar, armazenar) -> float:
+    """Executa as conversas e retorna a fração de perguntas respondidas pelo cache."""
+    sorteio = random.Random(42)
+    acertos = total = 0
+    for _ in range(N_CONVERSAS):
+        janela = ConversationWindow()
+        for _ in range(TURNOS):
+            item = sorteio.choice(consultas)
+            historico = janela.texto()
+            resposta = buscar(item["query"], historico)
+            total += 1
+            if resposta is None:
+                resposta = f"Resposta para: {item['query']}"
+                armazenar(item["query"], item["categoria"], resposta, historico)
+            else:
+                acertos += 1
+            janela.adicionar("user", item["query"])
+            janela.adicionar("assistant", resposta)
+    return acertos / total
+
+
+def politicas():
+    ignorar = ResponseCache()
+    sem_historico = ResponseCache()
+    janela = ResponseCache(max_palavras_autocontida=0)
+    atual = ResponseCache()
+    return [
+        ("ignorar o histórico", lambda c, h: ignorar.get(c),
+         lambda c, cat, r, h: ignorar.set(c, cat, r)),
+        ("só sem histórico", lambda c, h: None if h else sem_historico.get(c),
+         lambda c, cat, r, h: None if h else sem_historico.set(c, cat, r)),
+        ("resumo da janela", lambda c, h: janela.get(c, historico=h),
+         lambda c, cat, r, h: janela.set(c, cat, r, h)),
+        ("janela + informais", lambda c, h: atual.get(c, historico=h),
+         lambda c, cat, r, h: atual.set(c, cat, r, h)),
+    ]
+
+
+def medir_consulta(repeticoes: int = 20000) -> tuple:
+    """Microssegundos por consulta ao cache e tamanho da janela de histórico (cheia)."""
+    janela = ConversationWindow()
+    for _ in range(40):  # Mais que o orçamento: a janela fica cheia
+        janela.adicionar("user", "Uma pergunta razoavelmente longa sobre um assunto qualquer " * 3)
+        janela.adicionar("assistant", "Uma resposta igualmente longa, com alguns detalhes a mais " * 5)
+    historico = janela.texto()
+    cache = ResponseCache()
+    cache.set("Obrigado!", "simples", "De nada!")
+
+    async def executar():
+        for _ in range(repeticoes):
+            await cache.aget("Qual a capital da França?", historico=historico)
+
+    inicio = time.perf_counter()
+    asyncio.run(executar())
+    return (time.perf_counter() - inicio) / repeticoes * 1e6, len(historico)
+
+
+def main():
+    logging.disable(logging.WARNING)
+    consultas = carregar_consultas()
+    print(f"{N_CONVERSAS} conversas x {TURNOS} turnos ({len(consultas)} consultas distintas)")
+    for nome, buscar, armazenar in politicas():
+        print(f"{nome:>20}: {simular(consultas, buscar, armazenar):6.1%} de acertos")
+    micros, tamanho = medir_consulta()
+    print(f"Consulta com histórico de {tamanho} caracteres: {micros:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark do contexto de pesquisa enviado ao prompt de 'handle_web_search':
+resultados concatenados (comportamento anterior) versus `SearchContextBuilder`
+(deduplicação, ranking BM25 e corte no orçamento de tokens).
+
+Cada consulta recebe 10 resultados sintéticos no formato do DuckDuckGo, com a
+composição típica de picos de notícias: matérias distintas sobre o tema, cópias
+da mesma matéria replicada por outros sites (com pequenas alterações), a mesma
+URL com variações (http/https, www, barra final) e resultados fora do tema. São
+reportados os tokens do contexto e o tempo de montagem por consulta.
+
+Uso:
+    python benchmarks/bench_search_context.py [orcamento...]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from conversation import contar_tokens
+from search import formatar_resultados
+from search_context import SEARCH_CONTEXT_TOKEN_BUDGET, SearchContextBuilder
+
+ORCAMENTOS = [int(n) for n in sys.argv[1:]] or [SEARCH_CONTEXT_TOKEN_BUDGET, 400, 250]
+REPETICOES = 500
+SEMENTE = 42
+
+TEMAS = {
+    "qual foi a decisão do Copom sobre a taxa Selic?": (
+        ["Copom", "Selic", "juros", "Banco Central", "inflação", "decisão", "taxa"],
+        "O Copom decidiu manter a taxa Selic em 10,5% ao ano, em decisão unânime, citando "
+        "a inflação de serviços e as expectativas desancoradas.",
+    ),
+    "resultado do jogo do Brasil na Copa ontem": (
+        ["Brasil", "Copa", "jogo", "gols", "seleção", "resultado", "partida"],
+        "A seleção brasileira venceu por 2 a 1 na partida de ontem pela Copa, com gols no "
+        "segundo tempo e atuação destacada do goleiro.",
+    ),
+    "previsão do tempo para São Paulo no fim de semana": (
+        ["previsão", "tempo", "São Paulo", "chuva", "temperatura", "fim de semana", "frente fria"],
+        "A previsão para São Paulo no fim de semana indica chuva forte no sábado e queda de "
+        "temperatura com a chegada de uma frente fria no domingo.",
+    ),
+}
+FORA_DO_TEMA = [
+    "Receita de bolo de cenoura com cobertura de chocolate, fácil e rápida de preparar.",
+    "Veja os melhores destinos de viagem para as férias de julho com a família.",
+    "Aprenda a configurar o roteador Wi-Fi em poucos passos simples.",
+]
+PALAVRAS = ("analistas", "mercado", "segundo", "especialistas", "dados", "semana", "governo",
+            "projeção", "cenário", "impacto", "consumidores", "relatório", "economia", "regiões")
+
+
+def gerar_resultados(consulta: str, rng: random.Random):
+    termos, materia = TEMAS[consulta]
+    resultados = []
+    for i in range(4):
+        corpo = " ".join(rng.choice(termos + list(PALAVRAS)) for _ in range(45))
+        resultados.append({"title": f"{termos[i]}: análise {i}", "body": corpo,
+                           "href": f"https://portal{i}.com.br/noticia-{i}"})
+    for i in range(3):
+        # Matéria de agência replicada com pequenas edições
+        corpo = materia.replace("ontem", "nesta terça") if i else materia
+        resultados.append({"title": f"{termos[0]} - agência {i}", "body": corpo + " " * i,
+                           "href": f"https://site{i}.com/agencia"})
+    resultados.append({"title": "Portal 0 (cópia)", "body": resultados[0]["body"],
+                       "href": "http://www.portal0.com.br/noticia-0/"})
+    for texto in rng.sample(FORA_DO_TEMA, 2):
+        resultados.append({"title": texto.split(",")[0], "body": texto, "href": "https://outros.com"
+                           + f"/{rng.randint(0, 999)}"})
+    rng.shuffle(resultados)
+    return resultados
+
+
+def medir(funcao) -> float:
+    duracoes = []
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        funcao()
+        duracoes.append(time.perf_counter() - inicio)
+    return statistics.mean(duracoes) * 1e6
+
+
+def main():
+    rng = random.Random(SEMENTE)
+    conjuntos = [(consulta, gerar_resultados(consulta, rng)) for consulta in TEMAS]
+    brutos = [contar_tokens(formatar_resultados(resultados)) for _, resultados in conjuntos]
+    print(f"{len(conjuntos)} consultas, 10 resultados cada; "
+          f"contexto bruto: {statistics.mean(brutos):.0f} tokens em média")
+    for orcamento in ORCAMENTOS:
+        builder = SearchContextBuilder(orcamento=orcamento)
+        tokens, tempos = [], []
+        for consulta, resultados in conjuntos:
+            tokens.append(contar_tokens(builder.construir(consulta, resultados)))
+            tempos.append(medir(lambda: builder.construir(consulta, resultados)))
+        reducao = 1 - statistics.mean(tokens) / statistics.mean(brutos)
+        print(f"  orçamento {orcamento:>4}: {statistics.mean(tokens):5.0f} tokens "
+              f"(-{reducao:.0%}), {statistics.mean(tempos):7.1f} µs/consulta")
+
+
+if __name__ == "__main__":
+    main()
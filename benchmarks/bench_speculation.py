@@ -0,0 +1,90 @@
+"""
+Benchmark da moderação em paralelo com a categorização/geração (SPECULATION_MODE).
+
+Usa um LLM e uma moderação falsos, com latências aleatórias, e mede p50/p95 da
+latência de AskQuestion para cada modo de especulação. Nenhuma chamada de rede é feita.
+
+Uso:
+    python benchmarks/bench_speculation.py [n_requisicoes]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import genai_pb2
+import server
+from cache import ResponseCache
+
+N_REQUISICOES = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+CONCORRENCIA = 10
+LATENCIA_LLM = (0.05, 0.15)
+LATENCIA_MODERACAO = (0.08, 0.20)
+TAXA_BLOQUEIO = 0.1
+
+
+class FakeLLM(BaseChatModel):
+    @property
+    def _llm_type(self) -> str:
+        return "fake-bench"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(random.uniform(*LATENCIA_LLM))
+        texto = "simples" if "'simples' ou 'complexa'" in messages[-1].content else "resposta"
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=texto))])
+
+
+async def fake_moderacao(consulta, bot, pergunta=""):
+    await asyncio.sleep(random.uniform(*LATENCIA_MODERACAO))
+    return not consulta.startswith("bloquear")
+
+
+async def medir(modo: str):
+    server.SPECULATION_MODE = modo
+    server.response_cache = ResponseCache()
+    servicer = server.GenAiServiceServicer()
+    semaforo = asyncio.Semaphore(CONCORRENCIA)
+
+    async def uma(i: int) -> float:
+        prefixo = "bloquear" if random.random() < TAXA_BLOQUEIO else "pergunta"
+        async with semaforo:
+            inicio = time.perf_counter()
+            await servicer.AskQuestion(
+                genai_pb2.QuestionRequest(question=f"{prefixo} {modo} {i}"), None
+            )
+            return time.perf_counter() - inicio
+
+    latencias = sorted(await asyncio.gather(*[uma(i) for i in range(N_REQUISICOES)]))
+    p50 = statistics.median(latencias)
+    p95 = latencias[int(0.95 * (len(latencias) - 1))]
+    return p50, p95
+
+
+async def main():
+    random.seed(42)
+    server.chain_registry = server.ChainRegistry(llm=FakeLLM())
+    server.guard_moderation_async = fake_moderacao
+
+    print(f"{N_REQUISICOES} requisições, concorrência {CONCORRENCIA}, "
+          f"{TAXA_BLOQUEIO:.0%} bloqueadas")
+    base = None
+    for modo in ("off", "categorize", "full"):
+        p50, p95 = await medir(modo)
+        base = base or (p50, p95)
+        print(f"{modo:>10}: p50 {p50 * 1e3:6.0f} ms ({p50 / base[0]:.0%})  "
+              f"p95 {p95 * 1e3:6.0f} ms ({p95 / base[1]:.0%})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
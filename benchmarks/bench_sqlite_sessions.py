@@ -0,0 +1,78 @@
+"""
+Benchmark do acesso ao SQLite com N sessões simultâneas do Streamlit.
+
+Cada sessão é uma thread que executa turnos de chat com a mesma sequência de
+operações de `main.py` (limite de mensagens, histórico, duas mensagens salvas e
+a atualização do contador), comparando uma conexão por operação com journal
+padrão (DB_POOL_SIZE=0) e o pool de conexões persistentes em WAL.
+
+Uso:
+    python benchmarks/bench_sqlite_sessions.py [sessoes] [turnos_por_sessao]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+_TMP = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_FILE", os.path.join(_TMP, "database.db"))
+os.environ.setdefault("AUTH_LOG_FILE", os.path.join(_TMP, "autheticate.log"))
+
+import logging
+
+import authenticate
+from authenticate import DatabaseManager, MessageService
+
+N_SESSOES = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+TURNOS = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+
+def turno(db: DatabaseManager, servico: MessageService, email: str, i: int) -> None:
+    db.get_message_limit(email)
+    db.load_messages(email)
+    servico.save_message(email, "user", f"pergunta {i}")
+    servico.save_message(email, "assistant", f"resposta {i} " * 20)
+    db.update_message_counter(email)
+
+
+def medir(modo: str, tamanho_pool: int) -> float:
+    authenticate.DB_POOL_SIZE = tamanho_pool
+    db_file = os.path.join(_TMP, f"{modo}.db")
+    db = DatabaseManager(db_file)
+    servico = MessageService(db)
+    emails = [f"sessao{n}@bench.com" for n in range(N_SESSOES)]
+    for email in emails:
+        db.add_user(email)
+        db.initialize_message_limit(email)
+
+    barreira = threading.Barrier(N_SESSOES + 1)
+
+    def sessao(email: str) -> None:
+        barreira.wait()
+        for i in range(TURNOS):
+            turno(db, servico, email, i)
+
+    threads = [threading.Thread(target=sessao, args=(email,)) for email in emails]
+    for thread in threads:
+        thread.start()
+    barreira.wait()
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return N_SESSOES * TURNOS / (time.perf_counter() - inicio)
+
+
+def main():
+    logging.disable(logging.WARNING)
+    print(f"{N_SESSOES} sessões x {TURNOS} turnos")
+    base = medir("conexao_por_operacao", 0)
+    print(f"conexão por operação : {base:8.0f} turnos/s")
+    pool = medir("pool_wal", N_SESSOES)
+    print(f"pool persistente WAL : {pool:8.0f} turnos/s ({pool / base:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark de vazão dos backends de armazenamento (SQLite e PostgreSQL).
+
+Executa, com N sessões simultâneas, turnos de chat completos (limite de mensagens,
+página recente do histórico e `record_turn`) contra cada backend disponível. O
+PostgreSQL é incluído quando POSTGRES_TEST_DSN está definido (p. ex., um container
+local: `docker run --rm -e POSTGRES_PASSWORD=postgres -p 5432:5432 postgres:16`).
+
+Uso:
+    python benchmarks/bench_storage.py [sessoes] [turnos_por_sessao]
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+_TMP = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_FILE", os.path.join(_TMP, "database.db"))
+os.environ.setdefault("AUTH_LOG_FILE", os.path.join(_TMP, "autheticate.log"))
+
+from authenticate import DatabaseManager
+from storage import ChatStorage
+
+N_SESSOES = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+TURNOS = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+POSTGRES_TEST_DSN = os.getenv("POSTGRES_TEST_DSN")
+
+
+def medir(storage: ChatStorage) -> float:
+    emails = [f"sessao{n}@bench.com" for n in range(N_SESSOES)]
+    for email in emails:
+        storage.add_user(email)
+        storage.initialize_message_limit(email)
+    barreira = threading.Barrier(N_SESSOES + 1)
+
+    def sessao(email: str) -> None:
+        barreira.wait()
+        for i in range(TURNOS):
+            storage.get_message_limit(email)
+            storage.load_messages(email, limit=50)
+            storage.record_turn(email, f"pergunta {i}", f"resposta {i} " * 20)
+
+    threads = [threading.Thread(target=sessao, args=(email,)) for email in emails]
+    for thread in threads:
+        thread.start()
+    barreira.wait()
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return N_SESSOES * TURNOS / (time.perf_counter() - inicio)
+
+
+def main():
+    logging.disable(logging.WARNING)
+    print(f"{N_SESSOES} sessões x {TURNOS} turnos")
+    print(f"sqlite   : {medir(DatabaseManager(os.path.join(_TMP, 'bench.db'))):8.0f} turnos/s")
+
+    if not POSTGRES_TEST_DSN:
+        print("postgres : ignorado (defina POSTGRES_TEST_DSN)")
+        return
+    from postgres_storage import PostgresStorage
+
+    schema = f"bench_{uuid.uuid4().hex[:8]}"
+    storage = PostgresStorage(POSTGRES_TEST_DSN, schema=schema, max_size=N_SESSOES)
+    try:
+        print(f"postgres : {medir(storage):8.0f} turnos/s")
+    finally:
+        storage._run(storage._pool.execute(f'DROP SCHEMA "{schema}" CASCADE'))
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark da montagem do histórico dos prompts conforme a conversa cresce:
+histórico completo, janela compactada e resumo incremental com os últimos turnos.
+
+- completo: todas as mensagens do usuário são lidas do banco e formatadas a cada
+  pergunta (o prompt cresce com a conversa);
+- janela: `ConversationWindow` limitada em tokens, com as mensagens antigas
+  truncadas (sem resumo);
+- resumo: `ConversationStore` com `ConversationSummarizer`; o prompt recebe o
+  resumo em memória e os últimos SUMMARY_RECENT_TURNS turnos.
+
+O LLM de resumo é falso (apenas concatena e trunca o texto), de modo que a
+medição isola a montagem do prompt; também são reportados os tokens enviados ao
+LLM de resumo pela atualização incremental e por um resumo refeito do zero a cada
+turno.
+
+Uso:
+    python benchmarks/bench_summary.py [turnos...]
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+_TMP = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_FILE", os.path.join(_TMP, "database.db"))
+os.environ.setdefault("AUTH_LOG_FILE", os.path.join(_TMP, "autheticate.log"))
+
+from authenticate import DatabaseManager
+from conversation import (
+    SUMMARY_MAX_TOKENS,
+    SUMMARY_RECENT_TURNS,
+    ConversationStore,
+    ConversationSummarizer,
+    ConversationWindow,
+    contar_tokens,
+    formatar_mensagens,
+)
+
+TURNOS = [int(n) for n in sys.argv[1:]] or [10, 50, 200, 1000]
+REPETICOES = 200
+USUARIO = "a@x.com"
+PERGUNTA = "Pode detalhar melhor o ponto {i} sobre o planejamento da viagem e os custos envolvidos?"
+RESPOSTA = ("Claro. No ponto {i}, o ideal é reservar a hospedagem com antecedência, comparar "
+            "as tarifas aéreas em datas flexíveis e separar uma reserva para imprevistos.")
+
+
+class ResumidorFalso:
+    """LLM de resumo falso: mantém o final do texto acumulado e conta os tokens recebidos."""
+
+    def __init__(self):
+        self.tokens_enviados = 0
+
+    async def __call__(self, resumo: str, mensagens: str) -> str:
+        self.tokens_enviados += contar_tokens(resumo) + contar_tokens(mensagens)
+        return (resumo + "\n" + mensagens)[-SUMMARY_MAX_TOKENS * 4:]
+
+
+def medir(funcao) -> float:
+    duracoes = []
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        funcao()
+        duracoes.append(time.perf_counter() - inicio)
+    return statistics.mean(duracoes) * 1000
+
+
+async def medir_async(corrotina) -> float:
+    duracoes = []
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        await corrotina()
+        duracoes.append(time.perf_counter() - inicio)
+    return statistics.mean(duracoes) * 1000
+
+
+async def executar(turnos: int) -> None:
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(), "chat.db"))
+    db.add_user(USUARIO)
+    db.initialize_message_limit(USUARIO)
+
+    resumir = ResumidorFalso()
+    resumidor = ConversationSummarizer(resumir, db)
+    store = ConversationStore(
+        storage=db, resumidor=resumidor,
+        criar_janela=partial(ConversationWindow, max_mensagens_recentes=2 * SUMMARY_RECENT_TURNS),
+    )
+    janela = ConversationWindow()
+    tokens_acumulados = [0]  # tokens das mensagens formatadas, acumulados por mensagem
+    tokens_do_zero = 0
+    for i in range(turnos):
+        pergunta, resposta = PERGUNTA.format(i=i), RESPOSTA.format(i=i)
+        db.record_turn(USUARIO, pergunta, resposta)
+        janela.adicionar("user", pergunta)
+        janela.adicionar("assistant", resposta)
+        await store.registrar_turno("c1", pergunta, resposta, USUARIO)
+        await store.historico("c1", USUARIO)  # A pergunta seguinte agenda o resumo
+        tarefa = resumidor._tarefas.get(USUARIO)
+        if tarefa is not None:
+            await tarefa
+        # Sem estado incremental, o resumo seria refeito com todas as mensagens antigas
+        for papel, texto in (("user", pergunta), ("assistant", resposta)):
+            linha = formatar_mensagens([{"role": papel, "content": texto}])
+            tokens_acumulados.append(tokens_acumulados[-1] + contar_tokens(linha) + 1)
+        antigas = max(len(tokens_acumulados) - 1 - 2 * SUMMARY_RECENT_TURNS, 0)
+        tokens_do_zero += tokens_acumulados[antigas]
+
+    completo = formatar_mensagens(db.load_messages(USUARIO))
+    resumo = await store.historico("c1", USUARIO)
+    tempos = {
+        "completo": medir(lambda: formatar_mensagens(db.load_messages(USUARIO))),
+        "janela": medir(janela.texto),
+        "resumo": await medir_async(lambda: store.historico("c1", USUARIO)),
+    }
+    tokens = {"completo": contar_tokens(completo), "janela": contar_tokens(janela.texto()),
+              "resumo": contar_tokens(resumo)}
+
+    print(f"{turnos} turnos:")
+    for nome in ("completo", "janela", "resumo"):
+        print(f"  {nome:>8}: {tokens[nome]:7d} tokens no prompt, {tempos[nome]:7.3f} ms/montagem")
+    print(f"  tokens enviados ao LLM de resumo: {resumir.tokens_enviados} (incremental) "
+          f"vs {tokens_do_zero} (refeito a cada turno)")
+
+
+def main():
+    logging.disable(logging.WARNING)
+    for turnos in TURNOS:
+        asyncio.run(executar(turnos))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark da gravação de um turno de chat: caminho antigo versus `record_turn`.
+
+O caminho antigo salva a pergunta e a resposta com `MessageService.save_message`
+(cada uma incrementa a cota) e chama `update_message_counter`; `record_turn` grava
+tudo em uma única transação. São reportados os commits e incrementos de cota por
+turno e a vazão com N sessões simultâneas.
+
+Uso:
+    python benchmarks/bench_turn_commits.py [sessoes] [turnos_por_sessao]
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+_TMP = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_FILE", os.path.join(_TMP, "database.db"))
+os.environ.setdefault("AUTH_LOG_FILE", os.path.join(_TMP, "autheticate.log"))
+
+from authenticate import DatabaseManager, MessageService
+
+N_SESSOES = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+TURNOS = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+
+def turno_antigo(db: DatabaseManager, servico: MessageService, email: str, i: int) -> None:
+    servico.save_message(email, "user", f"pergunta {i}")
+    servico.save_message(email, "assistant", f"resposta {i}")
+    db.update_message_counter(email)
+
+
+def turno_atomico(db: DatabaseManager, servico: MessageService, email: str, i: int) -> None:
+    servico.record_turn(email, f"pergunta {i}", f"resposta {i}")
+
+
+def preparar(nome: str):
+    db = DatabaseManager(os.path.join(_TMP, f"{nome}.db"))
+    servico = MessageService(db)
+    emails = [f"sessao{n}@bench.com" for n in range(N_SESSOES)]
+    for email in emails:
+        db.add_user(email)
+        db.initialize_message_limit(email)
+    return db, servico, emails
+
+
+def contar_commits(turno) -> tuple:
+    """Executa um turno isolado, contando os COMMITs e o incremento da cota."""
+    db, servico, (email, *_) = preparar(f"{turno.__name__}_commits")
+    instrucoes = []
+    with db.get_connection() as conn:
+        conn.set_trace_callback(instrucoes.append)
+    turno(db, servico, email, 0)
+    with db.get_connection() as conn:
+        conn.set_trace_callback(None)
+    commits = sum(1 for sql in instrucoes if sql.strip().upper() == "COMMIT")
+    return commits, db.get_message_limit(email)[1]
+
+
+def medir_vazao(turno) -> float:
+    db, servico, emails = preparar(f"{turno.__name__}_vazao")
+    barreira = threading.Barrier(N_SESSOES + 1)
+
+    def sessao(email: str) -> None:
+        barreira.wait()
+        for i in range(TURNOS):
+            turno(db, servico, email, i)
+
+    threads = [threading.Thread(target=sessao, args=(email,)) for email in emails]
+    for thread in threads:
+        thread.start()
+    barreira.wait()
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return N_SESSOES * TURNOS / (time.perf_counter() - inicio)
+
+
+def main():
+    logging.disable(logging.WARNING)
+    print(f"{N_SESSOES} sessões x {TURNOS} turnos")
+    base = None
+    for nome, turno in (("antigo", turno_antigo), ("record_turn", turno_atomico)):
+        commits, cota = contar_commits(turno)
+        vazao = medir_vazao(turno)
+        base = base or vazao
+        print(f"{nome:>12}: {commits} commits/turno, cota +{cota}/turno, "
+              f"{vazao:7.0f} turnos/s ({vazao / base:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Avaliação offline do pré-classificador local contra as decisões do LLM.
+
+Lê um conjunto de consultas rotuladas (JSONL com 'query' e 'categoria', em que a
+categoria é a decisão do LLM de 'categorize') e informa a cobertura (fração decidida
+sem o LLM), a concordância nas consultas decididas, as divergências e o tempo médio
+da classificação local.
+
+Uso:
+    python benchmarks/eval_classifier.py [arquivo.jsonl] [--modelo treino.jsonl] [--llm]
+
+Com --llm, os rótulos são recalculados chamando o LLM real (requer OPENAI_API_KEY),
+e a latência média dessa chamada é reportada para estimar a economia.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from classifier import NaiveBayesClassifier, QueryPreClassifier, avaliar
+
+ARQUIVO_PADRAO = os.path.join(os.path.dirname(__file__), "data", "consultas_rotuladas.jsonl")
+
+
+async def rotular_com_llm(consultas):
+    """Obtém a categoria do LLM para cada consulta, medindo a latência média."""
+    import server
+
+    chain = server.chain_registry.get("categorize")
+    rotulos, inicio = [], time.perf_counter()
+    for consulta in consultas:
+        resposta = await chain.ainvoke({"history": "", "query": consulta})
+        rotulos.append(resposta.content.strip().lower())
+    return rotulos, (time.perf_counter() - inicio) / max(len(consultas), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("arquivo", nargs="?", default=ARQUIVO_PADRAO)
+    parser.add_argument("--modelo", help="JSONL para treinar o modelo local opcional")
+    parser.add_argument("--llm", action="store_true", help="rotula as consultas com o LLM real")
+    args = parser.parse_args()
+
+    with open(args.arquivo, encoding="utf-8") as arquivo:
+        registros = [json.loads(linha) for linha in arquivo if linha.strip()]
+    consultas = [r["query"] for r in registros]
+    rotulos = [r["categoria"] for r in registros]
+
+    latencia_llm = None
+    if args.llm:
+        rotulos, latencia_llm = asyncio.run(rotular_com_llm(consultas))
+
+    modelo = NaiveBayesClassifier.from_jsonl(args.modelo) if args.modelo else None
+    pre_classificador = QueryPreClassifier(modelo=modelo)
+
+    inicio = time.perf_counter()
+    resultado = avaliar(pre_classificador, list(zip(consultas, rotulos)))
+    tempo_local = (time.perf_counter() - inicio) / max(len(consultas), 1)
+
+    print(f"Consultas avaliadas : {resultado['total']}")
+    print(f"Cobertura local     : {resultado['cobertura']:.1%}")
+    print(f"Concordância c/ LLM : {resultado['concordancia']:.1%}")
+    print(f"Divergências        : {resultado['divergencias']}")
+    print(f"Tempo local médio   : {tempo_local * 1e6:.1f} µs/consulta")
+    if latencia_llm is not None:
+        economia = resultado["cobertura"] * latencia_llm
+        print(f"Latência média LLM  : {latencia_llm * 1e3:.0f} ms/consulta")
+        print(f"Economia estimada   : {economia * 1e3:.0f} ms/consulta")
+
+    for consulta, esperado in zip(consultas, rotulos):
+        categoria, fonte = pre_classificador.classificar(consulta)
+        if categoria is not None and categoria != esperado:
+            print(f"  divergência ({fonte}): {consulta!r} -> {categoria} (LLM: {esperado})")
+
+
+if __name__ == "__main__":
+    main()
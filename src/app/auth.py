@@ -2,7 +2,8 @@
 
 import logging
 import re
-from authenticate import UserAuthenticator, DatabaseManager
+import uuid
+from authenticate import UserAuthenticator, create_storage
 
 class AuthManager:
     """Gerencia a autenticação de usuários no aplicativo Chat X.
@@ -19,7 +20,7 @@ class AuthManager:
         self.thread_key = None
         self.logger = logging.getLogger(__name__)
         self.logger.debug("AuthManager inicializado.")
-        self.db_manager = DatabaseManager()
+        self.db_manager = create_storage()
         self.authenticator = UserAuthenticator(self.db_manager)
 
     def is_valid_email(self, email: str) -> bool:
@@ -54,6 +55,7 @@ class AuthManager:
         try:
             if self.authenticator.register_user(email):
                 self.user_email = email
+                self.thread_key = self.ensure_thread_key(email)
                 self.logger.info(f"Usuário {email} registrado com sucesso.")
                 return True
             else:
@@ -63,6 +65,25 @@ class AuthManager:
             self.logger.error(f"Erro ao registrar o usuário {email}: {e}", exc_info=True)
             return False
 
+    def ensure_thread_key(self, email: str) -> str:
+        """Obtém a chave da thread do usuário, criando-a caso ainda não exista.
+
+        A chave identifica a conversa do usuário no servidor gRPC, que mantém o
+        histórico usado nos prompts.
+
+        Args:
+            email (str): O e-mail do usuário.
+
+        Returns:
+            str: A chave da thread.
+        """
+        thread_key = self.db_manager.get_thread_key(email)
+        if not thread_key:
+            thread_key = uuid.uuid4().hex
+            self.db_manager.set_thread_key(email, thread_key)
+            self.logger.info(f"Chave de thread criada para o usuário {email}.")
+        return thread_key
+
     def login_user(self, email: str) -> bool:
         """Autentica um usuário existente no sistema.
 
@@ -82,7 +103,7 @@ class AuthManager:
         try:
             if self.authenticator.authenticate_user(email):
                 self.user_email = email
-                self.thread_key = self.db_manager.get_thread_key(email)
+                self.thread_key = self.ensure_thread_key(email)
                 self.logger.info(f"Usuário {email} autenticado com sucesso.")
                 return True
             self.logger.warning(f"Autenticação falhou para o usuário {email}.")
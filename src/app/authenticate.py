@@ -1,19 +1,34 @@
 import sqlite3
+import queue
+import threading
 from contextlib import contextmanager
 from typing import List, Optional, Tuple, Dict
 import streamlit as st
 import pandas as pd
 import logging
 import os
+from storage import MESSAGE_LIMIT, ChatStorage, DatabaseError
 
 # Constantes
-DATABASE_FILE = "database.db"
-LOG_FILE = "logs/autheticate.log"
-MESSAGE_LIMIT = 20  # Defina o limite de mensagens aqui
+DATABASE_FILE = os.getenv("DATABASE_FILE", "database.db")
+LOG_FILE = os.getenv("AUTH_LOG_FILE", "logs/autheticate.log")
+
+# Backend de armazenamento: 'sqlite' (padrão) ou 'postgres' (requer asyncpg)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").lower()
+POSTGRES_DSN = os.getenv("POSTGRES_DSN", "postgresql://localhost/chat_x")
+
+# Pool de conexões SQLite (DB_POOL_SIZE=0 abre uma conexão por operação)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))  # segundos
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "128"))
 
 # Configuração do Logging
 def setup_logging(log_file: str = LOG_FILE):
     """Configura o sistema de logging."""
+    if os.path.dirname(log_file):
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
@@ -28,75 +43,229 @@ setup_logging()
 logger = logging.getLogger(__name__)
 
 
-class DatabaseError(Exception):
-    """Exceção personalizada para erros de banco de dados."""
-    pass
+class ConnectionPool:
+    """Pool thread-safe de conexões SQLite persistentes.
+
+    Cada conexão é aberta uma única vez, em modo WAL (leitores não bloqueiam o
+    escritor), com `synchronous` e `cache_size` ajustados, e mantém o cache de
+    instruções preparadas do módulo sqlite3 entre as operações. Uma conexão é
+    emprestada com exclusividade a uma thread por vez; acima de `tamanho` conexões,
+    as threads aguardam uma conexão livre.
+    """
 
+    def __init__(self, db_file: str, tamanho: int = DB_POOL_SIZE):
+        self.db_file = db_file
+        self.tamanho = tamanho
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._livres: queue.LifoQueue = queue.LifoQueue()
+        self._criadas = 0
+        self._lock = threading.Lock()
+
+    def _conectar(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=DB_BUSY_TIMEOUT,
+            check_same_thread=False,  # Uso exclusivo garantido pelo pool
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        self.logger.debug(f"Nova conexão aberta para {self.db_file}.")
+        return conn
+
+    def _obter(self) -> sqlite3.Connection:
+        try:
+            return self._livres.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            criar = self._criadas < self.tamanho
+            if criar:
+                self._criadas += 1
+        if criar:
+            try:
+                return self._conectar()
+            except sqlite3.Error:
+                with self._lock:
+                    self._criadas -= 1
+                raise
+        return self._livres.get()
 
-class DatabaseManager:
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão exclusiva durante o bloco `with`."""
+        conn = self._obter()
+        try:
+            yield conn
+        finally:
+            # Não devolve ao pool uma transação aberta por um erro no meio do bloco
+            if conn.in_transaction:
+                conn.rollback()
+            self._livres.put(conn)
+
+    def close(self):
+        """Fecha as conexões livres do pool."""
+        while True:
+            try:
+                conn = self._livres.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._criadas -= 1
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_file: str) -> ConnectionPool:
+    """Obtém o pool de conexões do arquivo, compartilhado por todo o processo."""
+    with _pools_lock:
+        pool = _pools.get(db_file)
+        if pool is None:
+            pool = _pools[db_file] = ConnectionPool(db_file)
+        return pool
+
+
+# Migrações de esquema: (versão, instruções), aplicadas em ordem crescente
+SCHEMA_MIGRATIONS: List[Tuple[int, List[str]]] = [
+    (1, [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            useremail TEXT PRIMARY KEY
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS thread_save (
+            useremail TEXT PRIMARY KEY,
+            thread_key TEXT,
+            FOREIGN KEY (useremail) REFERENCES users(useremail)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS message_limit (
+            useremail TEXT PRIMARY KEY,
+            counter INTEGER DEFAULT 0,
+            FOREIGN KEY (useremail) REFERENCES users(useremail)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            useremail TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (useremail) REFERENCES users(useremail)
+        )
+        """,
+    ]),
+    # Histórico por usuário em ordem de inserção: atende à paginação por id
+    # (keyset) sem varredura da tabela nem ordenação
+    (2, [
+        "CREATE INDEX IF NOT EXISTS idx_messages_useremail_id ON messages (useremail, id)",
+    ]),
+    # Resumo incremental da conversa, atualizado pelo servidor (ver `conversation.ConversationSummarizer`)
+    (3, [
+        "ALTER TABLE thread_save ADD COLUMN summary TEXT",
+        "ALTER TABLE thread_save ADD COLUMN summary_message_id INTEGER NOT NULL DEFAULT 0",
+    ]),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+# Arquivos cujo esquema já foi conferido neste processo: novas instâncias de
+# DatabaseManager (p. ex., a cada rerun do Streamlit) não repetem as migrações
+_migrated_databases = set()
+_migrated_databases_lock = threading.Lock()
+
+
+class DatabaseManager(ChatStorage):
     """Gerencia as operações de banco de dados SQLite."""
 
     def __init__(self, db_file: str = DATABASE_FILE):
         self.db_file = db_file
         self.logger = logging.getLogger(self.__class__.__name__)
-        self.initialize_database()
+        # Compartilhado entre instâncias: as conexões sobrevivem aos reruns do Streamlit
+        self.pool = get_pool(db_file) if DB_POOL_SIZE > 0 else None
+        self.ensure_schema()
+
+    @property
+    def storage_key(self) -> str:
+        return self.db_file
 
     @contextmanager
     def get_connection(self):
         """Context manager para conexões com o banco de dados."""
+        if self.pool is None:
+            conn = None
+            try:
+                conn = sqlite3.connect(self.db_file)
+                yield conn
+            except sqlite3.Error as e:
+                self.logger.error(f"Erro ao conectar ao banco de dados: {e}")
+                raise DatabaseError(f"Erro no banco de dados: {e}")
+            finally:
+                if conn is not None:
+                    conn.close()
+            return
+
         try:
-            conn = sqlite3.connect(self.db_file)
-            yield conn
+            with self.pool.connection() as conn:
+                yield conn
         except sqlite3.Error as e:
             self.logger.error(f"Erro ao conectar ao banco de dados: {e}")
             raise DatabaseError(f"Erro no banco de dados: {e}")
-        finally:
-            conn.close()
-
-    def initialize_database(self):
-        """Cria as tabelas necessárias no banco de dados SQLite."""
-        create_table_queries = [
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                useremail TEXT PRIMARY KEY
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS thread_save (
-                useremail TEXT PRIMARY KEY,
-                thread_key TEXT,
-                FOREIGN KEY (useremail) REFERENCES users(useremail)
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS message_limit (
-                useremail TEXT PRIMARY KEY,
-                counter INTEGER DEFAULT 0,
-                FOREIGN KEY (useremail) REFERENCES users(useremail)
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                useremail TEXT NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (useremail) REFERENCES users(useremail)
-            )
-            """
-        ]
 
+    def ensure_schema(self):
+        """Executa `initialize_database` uma única vez por processo para cada arquivo."""
+        with _migrated_databases_lock:
+            if self.db_file in _migrated_databases:
+                return
+            if self.initialize_database():
+                _migrated_databases.add(self.db_file)
+
+    def initialize_database(self) -> bool:
+        """Aplica ao banco de dados SQLite as migrações de esquema pendentes.
+
+        A versão do esquema é registrada em `PRAGMA user_version`; cada migração é
+        aplicada uma única vez, junto com o registro da versão, em uma transação
+        explícita: no modo legado do sqlite3 as instruções DDL não abrem transação
+        implícita e seriam confirmadas uma a uma. Uma falha desfaz a migração inteira.
+
+        Returns:
+            bool: True se o esquema estiver na versão atual.
+        """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                for query in create_table_queries:
-                    cursor.execute(query)
-                conn.commit()
-            self.logger.info("Banco de dados inicializado com sucesso.")
+                version = cursor.execute("PRAGMA user_version").fetchone()[0]
+                for target, queries in SCHEMA_MIGRATIONS:
+                    if target <= version:
+                        continue
+                    # BEGIN IMMEDIATE bloqueia a escrita de outros processos; a versão
+                    # é relida dentro da transação para não aplicar a migração duas vezes
+                    cursor.execute("BEGIN IMMEDIATE")
+                    try:
+                        if cursor.execute("PRAGMA user_version").fetchone()[0] >= target:
+                            conn.rollback()
+                            continue
+                        for query in queries:
+                            cursor.execute(query)
+                        cursor.execute(f"PRAGMA user_version = {target}")
+                        conn.commit()
+                    except sqlite3.Error:
+                        conn.rollback()
+                        raise
+                    self.logger.info(f"Migração de esquema aplicada: versão {target}.")
+            self.logger.info(f"Banco de dados inicializado com sucesso (esquema v{SCHEMA_VERSION}).")
+            return True
         except DatabaseError as e:
             self.logger.error(f"Falha ao inicializar o banco de dados: {e}")
             st.error("Erro ao inicializar o banco de dados.")
+            return False
 
     # Métodos de Usuário
     def add_user(self, useremail: str) -> bool:
@@ -163,6 +332,41 @@ class DatabaseManager:
             st.error("Erro ao definir chave da thread.")
             return False
 
+    def get_thread_summary(self, useremail: str) -> Tuple[str, int]:
+        """Obtém o resumo da thread e o id da última mensagem resumida."""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT summary, summary_message_id FROM thread_save WHERE useremail = ?",
+                    (useremail,)
+                )
+                result = cursor.fetchone()
+            if not result or result[0] is None:
+                return "", 0
+            return result[0], result[1]
+        except DatabaseError as e:
+            self.logger.error(f"Erro ao obter resumo da thread para {useremail}: {e}")
+            return "", 0
+
+    def set_thread_summary(self, useremail: str, summary: str, message_id: int) -> bool:
+        """Grava o resumo da thread de um usuário (chamado pelo servidor, sem interface)."""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO thread_save (useremail, summary, summary_message_id)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(useremail) DO UPDATE SET
+                        summary=excluded.summary, summary_message_id=excluded.summary_message_id
+                """, (useremail, summary, message_id))
+                conn.commit()
+            self.logger.debug(f"Resumo da thread atualizado para {useremail} (até {message_id}).")
+            return True
+        except DatabaseError as e:
+            self.logger.error(f"Erro ao gravar resumo da thread para {useremail}: {e}")
+            return False
+
     # Métodos de Limite de Mensagens
     def get_message_limit(self, useremail: str) -> Tuple[bool, int]:
         """Obtém o status do limite de mensagens para um usuário."""
@@ -210,11 +414,10 @@ class DatabaseManager:
                     UPDATE message_limit
                     SET counter = counter + ?
                     WHERE useremail = ?
+                    RETURNING counter
                 """, (increment, useremail))
-                conn.commit()
-
-                cursor.execute("SELECT counter FROM message_limit WHERE useremail = ?", (useremail,))
                 result = cursor.fetchone()
+                conn.commit()
             new_counter = result[0] if result else None
             self.logger.info(f"Contador de mensagens atualizado para {useremail}: {new_counter}")
             return new_counter
@@ -223,6 +426,24 @@ class DatabaseManager:
             st.error("Erro ao atualizar contador de mensagens.")
             return None
 
+    def adjust_message_counters(self, deltas: Dict[str, int]) -> bool:
+        """Aplica em lote, em uma única transação, ajustes aos contadores de mensagens."""
+        if not deltas:
+            return True
+        try:
+            with self.get_connection() as conn:
+                conn.executemany("""
+                    UPDATE message_limit
+                    SET counter = MAX(counter + ?, 0)
+                    WHERE useremail = ?
+                """, [(delta, useremail) for useremail, delta in deltas.items()])
+                conn.commit()
+            self.logger.debug(f"Contadores de mensagens ajustados para {len(deltas)} usuários.")
+            return True
+        except DatabaseError as e:
+            self.logger.error(f"Erro ao ajustar contadores de mensagens: {e}")
+            return False
+
     # Métodos de Mensagens
     def save_message(self, useremail: str, role: str, content: str) -> bool:
         """Salva uma mensagem no banco de dados."""
@@ -234,6 +455,7 @@ class DatabaseManager:
                     VALUES (?, ?, ?)
                 """, (useremail, role, content))
                 conn.commit()
+            self._record_message_id(useremail, cursor.lastrowid)
             self.logger.info(f"Mensagem salva para {useremail}: {role} - {content[:50]}...")
             return True
         except DatabaseError as e:
@@ -241,28 +463,133 @@ class DatabaseManager:
             st.error("Erro ao salvar mensagem.")
             return False
 
-    def load_messages(self, useremail: str) -> List[Dict[str, str]]:
-        """Carrega todas as mensagens de um usuário."""
+    def record_turn(self, useremail: str, user_message: str, assistant_message: str,
+                    increment: int = 1) -> Optional[int]:
+        """Grava um turno completo (pergunta, resposta e cota) em uma única transação.
+
+        As duas mensagens e o incremento do contador são confirmados juntos, com um
+        único commit: ou o turno inteiro é gravado, ou nada é. O novo valor do contador
+        é obtido pelo próprio UPDATE (RETURNING), sem uma leitura adicional.
+
+        Returns:
+            Optional[int]: Novo valor do contador, ou None em caso de erro ou se o
+            limite de mensagens do usuário não estiver inicializado.
+        """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                # Reserva a escrita já no início: evita falhas de lock ao promover a transação
+                cursor.execute("BEGIN IMMEDIATE")
                 cursor.execute("""
-                    SELECT role, content FROM messages
+                    UPDATE message_limit
+                    SET counter = counter + ?
                     WHERE useremail = ?
-                    ORDER BY timestamp ASC
-                """, (useremail,))
+                    RETURNING counter
+                """, (increment, useremail))
+                result = cursor.fetchone()
+                if result is None:
+                    conn.rollback()
+                    self.logger.warning(f"Limite de mensagens não inicializado para {useremail}.")
+                    return None
+                message_ids = []
+                for role, content in (("user", user_message), ("assistant", assistant_message)):
+                    cursor.execute("""
+                        INSERT INTO messages (useremail, role, content)
+                        VALUES (?, ?, ?)
+                    """, (useremail, role, content))
+                    message_ids.append(cursor.lastrowid)
+                conn.commit()
+            self._record_message_id(useremail, max(message_ids))
+            self.logger.info(f"Turno gravado para {useremail}. Contador: {result[0]}")
+            return result[0]
+        except DatabaseError as e:
+            self.logger.error(f"Erro ao gravar turno para {useremail}: {e}")
+            st.error("Erro ao salvar mensagem.")
+            return None
+
+    def load_messages(self, useremail: str, before_id: Optional[int] = None,
+                      limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict]:
+        """Carrega as mensagens de um usuário em ordem cronológica.
+
+        A paginação é feita por id (keyset): `limit` retorna as mensagens mais
+        recentes, `before_id` restringe às anteriores a uma mensagem já carregada e
+        `after_id` às posteriores. Sem argumentos, carrega todo o histórico.
+        """
+        query = "SELECT id, role, content FROM messages WHERE useremail = ?"
+        params: list = [useremail]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        if after_id is not None:
+            query += " AND id > ?"
+            params.append(after_id)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit if limit is not None else -1)
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, params)
                 messages = cursor.fetchall()
             self.logger.debug(f"{len(messages)} mensagens carregadas para {useremail}.")
-            return [{"role": role, "content": content} for role, content in messages]
+            return [
+                {"id": message_id, "role": role, "content": content}
+                for message_id, role, content in reversed(messages)
+            ]
         except DatabaseError as e:
             self.logger.error(f"Erro ao carregar mensagens para {useremail}: {e}")
             return []
 
+    def get_latest_message_id(self, useremail: str) -> int:
+        """Consulta o id da última mensagem do usuário (0 se não houver mensagens)."""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT MAX(id) FROM messages WHERE useremail = ?", (useremail,))
+                result = cursor.fetchone()
+            latest = result[0] or 0
+            self._record_message_id(useremail, latest)
+            return latest
+        except DatabaseError as e:
+            self.logger.error(f"Erro ao consultar a última mensagem de {useremail}: {e}")
+            return 0
+
+
+_storages: Dict[Tuple[str, str], ChatStorage] = {}
+_storages_lock = threading.Lock()
+
+
+def create_storage(db_file: Optional[str] = None) -> ChatStorage:
+    """Obtém o armazenamento configurado em STORAGE_BACKEND.
+
+    A instância é compartilhada por todo o processo (uma por arquivo SQLite ou por
+    DSN do PostgreSQL), de modo que os reruns do Streamlit reaproveitam o mesmo
+    gerenciador, com seus pools de conexões, em vez de recriá-lo.
+
+    Args:
+        db_file (Optional[str]): Arquivo SQLite; por padrão, DATABASE_FILE.
+    """
+    if STORAGE_BACKEND == "postgres":
+        key = ("postgres", POSTGRES_DSN)
+    else:
+        key = ("sqlite", db_file or DATABASE_FILE)
+    with _storages_lock:
+        storage = _storages.get(key)
+        if storage is None:
+            if key[0] == "postgres":
+                # Dependência opcional: só é importada quando o backend é selecionado
+                from postgres_storage import PostgresStorage
+
+                storage = PostgresStorage(POSTGRES_DSN)
+            else:
+                storage = DatabaseManager(key[1])
+            _storages[key] = storage
+        return storage
+
 
 class UserAuthenticator:
     """Gerencia a autenticação de usuários."""
 
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: ChatStorage):
         self.db_manager = db_manager
         self.logger = logging.getLogger(self.__class__.__name__)
 
@@ -286,7 +613,7 @@ class UserAuthenticator:
 class MessageService:
     """Serviço para gerenciar mensagens dos usuários."""
 
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: ChatStorage):
         self.db_manager = db_manager
         self.logger = logging.getLogger(self.__class__.__name__)
 
@@ -301,15 +628,27 @@ class MessageService:
                 self.logger.warning(f"Usuário {useremail} atingiu o limite de mensagens.")
         return False
 
-    def load_messages(self, useremail: str) -> List[Dict[str, str]]:
-        """Carrega as mensagens do usuário."""
-        messages = self.db_manager.load_messages(useremail)
+    def record_turn(self, useremail: str, user_message: str, assistant_message: str,
+                    increment: int = 1) -> bool:
+        """Grava pergunta e resposta e contabiliza o turno uma única vez na cota."""
+        new_count = self.db_manager.record_turn(useremail, user_message, assistant_message, increment)
+        if new_count is not None and new_count <= MESSAGE_LIMIT:
+            self.logger.info(f"Turno registrado para {useremail}. Contador: {new_count}/{MESSAGE_LIMIT}")
+            return True
+        if new_count is not None:
+            self.logger.warning(f"Usuário {useremail} atingiu o limite de mensagens.")
+        return False
+
+    def load_messages(self, useremail: str, before_id: Optional[int] = None,
+                      limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict]:
+        """Carrega as mensagens do usuário (ver `DatabaseManager.load_messages`)."""
+        messages = self.db_manager.load_messages(useremail, before_id, limit, after_id)
         self.logger.debug(f"Mensagens carregadas para {useremail}: {len(messages)}")
         return messages
 
 
 # Inicialização dos componentes
-db_manager = DatabaseManager()
+db_manager = create_storage()
 authenticator = UserAuthenticator(db_manager)
 message_service = MessageService(db_manager)
 
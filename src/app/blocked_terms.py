@@ -0,0 +1,160 @@
+# blocked_terms.py
+
+import logging
+import os
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+from cache import normalizar_texto
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+BLOCKED_TERMS_FILE = os.getenv(
+    "BLOCKED_TERMS_FILE",
+    os.path.join(os.getenv("RAILS_CONFIG_PATH", "./config"), "rails", "blocked_terms.txt"),
+)
+
+
+class BlockedTermsMatcher:
+    """Busca simultânea de vários termos bloqueados com o algoritmo de Aho-Corasick.
+
+    O autômato é compilado uma única vez a partir da lista de termos, usando palavras
+    normalizadas como alfabeto: cada verificação percorre as palavras da mensagem uma
+    só vez, em tempo linear no tamanho do texto, independentemente da quantidade de
+    termos. Como as transições são feitas por palavra, apenas ocorrências de palavras
+    inteiras são consideradas (p. ex., "puta" não casa com "computador").
+    """
+
+    def __init__(self, termos: Iterable[str], caminho: Optional[str] = None):
+        """
+        Args:
+            termos (Iterable[str]): Termos a serem bloqueados.
+            caminho (Optional[str]): Arquivo de origem dos termos, usado por `recarregar`.
+        """
+        self.caminho = caminho
+        self._compilar_termos(termos)
+
+    @classmethod
+    def from_file(cls, caminho: str) -> "BlockedTermsMatcher":
+        """Carrega os termos de um arquivo texto (um por linha, '#' para comentários)."""
+        return cls(cls._ler_termos(caminho), caminho=caminho)
+
+    @staticmethod
+    def _ler_termos(caminho: str) -> List[str]:
+        if not os.path.exists(caminho):
+            logger.warning("Lista de termos bloqueados não encontrada: %s", caminho)
+            return []
+        with open(caminho, encoding="utf-8") as arquivo:
+            termos = [
+                linha.strip() for linha in arquivo
+                if linha.strip() and not linha.lstrip().startswith("#")
+            ]
+        logger.info("%d termos bloqueados carregados de %s.", len(termos), caminho)
+        return termos
+
+    def recarregar(self) -> None:
+        """Relê o arquivo de origem e recompila o autômato."""
+        if self.caminho:
+            self._compilar_termos(self._ler_termos(self.caminho))
+
+    def _compilar_termos(self, termos: Iterable[str]) -> None:
+        self._transicoes: List[Dict[str, int]] = [{}]
+        self._falhas: List[int] = [0]
+        self._saidas: List[List[str]] = [[]]
+        self.termos = sorted({normalizar_texto(t) for t in termos if normalizar_texto(t)})
+        for termo in self.termos:
+            self._inserir(termo)
+        self._vocabulario = {palavra for termo in self.termos for palavra in termo.split(" ")}
+        self._compilar()
+
+    def _inserir(self, termo: str) -> None:
+        estado = 0
+        for palavra in termo.split(" "):
+            proximo = self._transicoes[estado].get(palavra)
+            if proximo is None:
+                proximo = len(self._transicoes)
+                self._transicoes[estado][palavra] = proximo
+                self._transicoes.append({})
+                self._falhas.append(0)
+                self._saidas.append([])
+            estado = proximo
+        self._saidas[estado].append(termo)
+
+    def _compilar(self) -> None:
+        """Calcula os links de falha em largura (BFS) e propaga as saídas."""
+        fila = deque(self._transicoes[0].values())
+        while fila:
+            estado = fila.popleft()
+            for palavra, proximo in self._transicoes[estado].items():
+                fila.append(proximo)
+                falha = self._falhas[estado]
+                while falha and palavra not in self._transicoes[falha]:
+                    falha = self._falhas[falha]
+                destino = self._transicoes[falha].get(palavra, 0)
+                self._falhas[proximo] = destino if destino != proximo else 0
+                herdadas = self._saidas[self._falhas[proximo]]
+                if herdadas:
+                    self._saidas[proximo] = self._saidas[proximo] + herdadas
+
+    def buscar(self, texto: str, primeira: bool = False) -> List[str]:
+        """
+        Procura os termos bloqueados presentes no texto.
+
+        Args:
+            texto (str): Texto a ser verificado.
+            primeira (bool): Interrompe a busca na primeira ocorrência.
+
+        Returns:
+            List[str]: Termos encontrados (normalizados), na ordem em que terminam no texto.
+        """
+        if not self.termos:
+            return []
+        transicoes, falhas, saidas = self._transicoes, self._falhas, self._saidas
+        vocabulario = self._vocabulario
+        encontrados = []
+        estado = 0
+        for palavra in normalizar_texto(texto).split(" "):
+            if palavra not in vocabulario:
+                # Palavra fora de qualquer termo: nenhuma transição possível
+                estado = 0
+                continue
+            while estado and palavra not in transicoes[estado]:
+                estado = falhas[estado]
+            estado = transicoes[estado].get(palavra, 0)
+            if saidas[estado]:
+                encontrados.extend(saidas[estado])
+                if primeira:
+                    return encontrados
+        return encontrados
+
+    def contem(self, texto: str) -> bool:
+        """Indica se o texto contém algum termo bloqueado."""
+        return bool(self.buscar(texto, primeira=True))
+
+
+blocked_terms = BlockedTermsMatcher.from_file(BLOCKED_TERMS_FILE)
+
+
+async def check_blocked_terms(context: Optional[dict] = None) -> bool:
+    """
+    Ação do NeMo Guardrails usada pelo subflow 'check blocked terms'.
+
+    Verifica a mensagem do bot (rail de saída) ou, na ausência dela, a do usuário.
+
+    Args:
+        context (Optional[dict]): Contexto da execução fornecido pelo NeMo Guardrails.
+
+    Returns:
+        bool: True se a mensagem contiver algum termo bloqueado.
+    """
+    context = context or {}
+    texto = context.get("bot_message") or context.get("user_message") or ""
+    bloqueado = blocked_terms.contem(texto)
+    if bloqueado:
+        metrics.inc("chat_x_blocked_terms_matches_total", labels={"origem": "rails"})
+    return bloqueado
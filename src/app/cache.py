@@ -0,0 +1,326 @@
+# cache.py
+
+import asyncio
+import hashlib
+import logging
+import math
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CATEGORIAS = ("simples", "complexa")
+
+
+def _remover_acentos(texto: str) -> str:
+    if texto.isascii():
+        return texto
+    texto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def normalizar_texto(texto: str) -> str:
+    """Normaliza um texto para comparação por palavras (tokenização, ranking, termos).
+
+    Converte para minúsculas, remove acentos e pontuação e colapsa espaços, de modo
+    que "Qual a capital da França?" e "qual a capital da franca" fiquem iguais. Para
+    chaves de cache, use `chave_consulta`, que preserva operadores e símbolos.
+
+    Args:
+        texto (str): Texto original.
+
+    Returns:
+        str: Texto normalizado.
+    """
+    texto = _remover_acentos(texto.lower())
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return " ".join(texto.split())
+
+
+# Pontuação de frase; ponto, vírgula e dois-pontos só contam no fim de uma palavra
+# (preservando "2.5", "10,5" e "10:30")
+_PONTUACAO_FRASE = re.compile(r"[?!¿¡…\"“”'‘’«»()\[\]{}]|[.,;:](?=\s|$)")
+
+
+def chave_consulta(texto: str) -> str:
+    """Normaliza uma consulta para uso como chave de cache.
+
+    Ignora caixa, acentos, espaços e pontuação de frase, mas preserva operadores e
+    símbolos: "quanto é 2+2?" e "quanto é 2*2?", ou "C++" e "C#", geram chaves distintas.
+
+    Args:
+        texto (str): Consulta original.
+
+    Returns:
+        str: Chave normalizada.
+    """
+    texto = _PONTUACAO_FRASE.sub(" ", _remover_acentos(texto.lower()))
+    return " ".join(texto.split())
+
+
+def termos_literais(chave: str) -> Tuple[str, ...]:
+    """Termos da chave com dígitos ou símbolos ("2+2", "c++", "5%"), que não admitem aproximação."""
+    return tuple(sorted(t for t in chave.split() if not t.isalpha()))
+
+
+# Palavras que retomam a conversa ("e ela?", "explique isso"): a consulta depende do histórico
+REFERENCIAS_AO_HISTORICO = frozenset({
+    "e", "mas", "ele", "ela", "eles", "elas", "dele", "dela", "deles", "delas", "nele", "nela",
+    "isso", "isto", "disso", "disto", "nisso", "nisto", "esse", "essa", "este", "esta",
+    "desse", "dessa", "deste", "desta", "aquilo", "mesmo", "mesma", "anterior", "acima",
+    "antes", "outro", "outra", "mais", "melhor", "tambem", "entao", "porque", "continue",
+    "continua", "resuma", "repita", "explique",
+})
+
+
+def consulta_autocontida(chave: str, max_palavras: int = 4) -> bool:
+    """Indica se uma consulta é curta e não retoma a conversa ("oi", "bom dia", "obrigado").
+
+    Args:
+        chave (str): Consulta normalizada (ver `chave_consulta`).
+        max_palavras (int): Número máximo de palavras da consulta.
+
+    Returns:
+        bool: True se a resposta da consulta independer do histórico.
+    """
+    palavras = chave.split()
+    return (0 < len(palavras) <= max_palavras and not termos_literais(chave)
+            and REFERENCIAS_AO_HISTORICO.isdisjoint(palavras))
+
+
+def contexto_historico(historico: str) -> str:
+    """Resumo (digest) da janela de histórico usado nas chaves do cache ('' sem histórico)."""
+    if not historico:
+        return ""
+    return hashlib.blake2b(historico.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class TTLCache:
+    """Cache LRU em memória com tempo de expiração (TTL) por entrada.
+
+    Quando o número de entradas excede `max_entries`, a entrada usada há mais tempo é
+    descartada. Entradas expiradas são removidas no momento da leitura.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0,
+                 relogio: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            max_entries (int): Número máximo de entradas mantidas.
+            ttl (float): Tempo de vida padrão das entradas, em segundos.
+            relogio (Callable[[], float]): Fonte de tempo (injetável para testes).
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._relogio = relogio
+        self._dados: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._dados)
+
+    def get(self, chave: Hashable) -> Optional[Any]:
+        """Retorna o valor associado à chave, ou None se ausente ou expirado."""
+        item = self._dados.get(chave)
+        if item is None:
+            return None
+        expira_em, valor = item
+        if expira_em <= self._relogio():
+            del self._dados[chave]
+            self.expirations += 1
+            return None
+        self._dados.move_to_end(chave)
+        return valor
+
+    def set(self, chave: Hashable, valor: Any, ttl: Optional[float] = None):
+        """Armazena um valor, com TTL opcional diferente do padrão."""
+        ttl = self.ttl if ttl is None else ttl
+        self._dados[chave] = (self._relogio() + ttl, valor)
+        self._dados.move_to_end(chave)
+        while len(self._dados) > self.max_entries:
+            self._dados.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, chave: Hashable):
+        """Remove a chave, caso exista."""
+        self._dados.pop(chave, None)
+
+    def clear(self):
+        """Remove todas as entradas."""
+        self._dados.clear()
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Lista as entradas não expiradas (da menos para a mais recente)."""
+        agora = self._relogio()
+        return [(k, v) for k, (expira_em, v) in self._dados.items() if expira_em > agora]
+
+
+class HashingEmbedder:
+    """Embedding local leve, usado como substituto de um modelo de embeddings.
+
+    Projeta os trigramas de caracteres de cada palavra em um vetor de dimensão fixa
+    por hashing (feature hashing) e normaliza o resultado. Não depende de rede nem de
+    modelos externos, mas captura variações superficiais como plural e pontuação.
+    """
+
+    def __init__(self, dimensao: int = 256):
+        self.dimensao = dimensao
+
+    def __call__(self, texto: str) -> List[float]:
+        vetor = [0.0] * self.dimensao
+        for palavra in normalizar_texto(texto).split():
+            palavra = f"#{palavra}#"
+            for i in range(max(len(palavra) - 2, 1)):
+                trigrama = palavra[i:i + 3].encode("utf-8")
+                indice = int.from_bytes(hashlib.blake2b(trigrama, digest_size=4).digest(), "little")
+                vetor[indice % self.dimensao] += 1.0
+        norma = math.sqrt(sum(v * v for v in vetor)) or 1.0
+        return [v / norma for v in vetor]
+
+
+def similaridade_cosseno(a: List[float], b: List[float]) -> float:
+    """Similaridade de cosseno entre vetores já normalizados."""
+    return sum(x * y for x, y in zip(a, b))
+
+
+class ResponseCache:
+    """Cache de respostas do fluxo de suporte, indexado pela consulta e pela categoria.
+
+    Possui uma camada exata, indexada pela consulta normalizada (`chave_consulta`), e uma
+    camada semântica opcional, que reaproveita a resposta de uma consulta anterior com os
+    mesmos números e símbolos cujo embedding tenha similaridade acima de `limiar_semantico`. Respostas 'complexa' dependem do momento
+    da pergunta e, por isso, usam um TTL próprio (mais curto).
+
+    As respostas geradas com histórico são indexadas também pelo resumo da janela
+    (`contexto_historico`) e só valem para a mesma janela; não são compartilhadas, pois
+    podem citar a conversa. Em uma conversa em andamento, consultas informais curtas
+    (`consulta_autocontida`) também reaproveitam as respostas 'simples' geradas sem
+    histórico.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_simples: float = 3600.0,
+                 ttl_complexa: float = 300.0,
+                 embedder: Optional[Callable[[str], List[float]]] = None,
+                 limiar_semantico: float = 0.92,
+                 max_palavras_autocontida: int = 4,
+                 relogio: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            max_entries (int): Número máximo de respostas mantidas.
+            ttl_simples (float): TTL, em segundos, de respostas 'simples'.
+            ttl_complexa (float): TTL, em segundos, de respostas 'complexa'.
+            embedder (Optional[Callable]): Função de embedding; habilita a camada semântica.
+            limiar_semantico (float): Similaridade mínima para um acerto semântico.
+            max_palavras_autocontida (int): Tamanho máximo, em palavras, das consultas
+                informais respondidas sem histórico em uma conversa (0 desabilita).
+            relogio (Callable[[], float]): Fonte de tempo (injetável para testes).
+        """
+        self.ttls = {"simples": ttl_simples, "complexa": ttl_complexa}
+        self.embedder = embedder
+        self.limiar_semantico = limiar_semantico
+        self.max_palavras_autocontida = max_palavras_autocontida
+        self._entradas = TTLCache(max_entries=max_entries, ttl=ttl_complexa, relogio=relogio)
+
+    def _buscar_exata(self, chave: str, categorias, contexto: str) -> Optional[Dict[str, str]]:
+        for cat in categorias:
+            entrada = self._entradas.get((chave, cat, contexto))
+            if entrada is not None:
+                tier = "history" if contexto else "exact"
+                metrics.inc("chat_x_response_cache_hits_total", labels={"tier": tier, "categoria": cat})
+                return {"categoria": cat, "resposta": entrada["resposta"]}
+        return None
+
+    def _buscar_sem_semantica(self, chave: str, categorias, contexto: str) -> Optional[Dict[str, str]]:
+        encontrada = self._buscar_exata(chave, categorias, contexto)
+        if (encontrada is None and contexto and "simples" in categorias
+                and consulta_autocontida(chave, self.max_palavras_autocontida)):
+            encontrada = self._buscar_exata(chave, ("simples",), "")
+        return encontrada
+
+    def _candidatos(self, chave: str, categorias, contexto: str) -> List[Tuple[str, Dict[str, Any]]]:
+        # Só consultas com os mesmos números e símbolos podem ser equivalentes:
+        # "quanto é 2+2" nunca reaproveita a resposta de "quanto é 2+3"
+        literais = termos_literais(chave)
+        return [(cat, entrada) for (_, cat, ctx), entrada in self._entradas.items()
+                if ctx == contexto and cat in categorias and entrada["literais"] == literais]
+
+    def _melhor_candidato(self, chave: str, candidatos) -> Optional[Dict[str, str]]:
+        vetor = self.embedder(chave)
+        melhor, melhor_score = None, self.limiar_semantico
+        for cat, entrada in candidatos:
+            score = similaridade_cosseno(vetor, entrada["embedding"])
+            if score >= melhor_score:
+                melhor, melhor_score = {"categoria": cat, "resposta": entrada["resposta"]}, score
+        if melhor is not None:
+            logger.debug("Acerto semântico no cache (similaridade %.3f).", melhor_score)
+        return melhor
+
+    def _registrar(self, encontrada: Optional[Dict[str, str]], tier: str) -> Optional[Dict[str, str]]:
+        if encontrada is None:
+            metrics.inc("chat_x_response_cache_misses_total")
+        elif tier == "semantic":
+            metrics.inc("chat_x_response_cache_hits_total",
+                        labels={"tier": "semantic", "categoria": encontrada["categoria"]})
+        return encontrada
+
+    def get(self, consulta: str, categoria: Optional[str] = None,
+            historico: str = "") -> Optional[Dict[str, str]]:
+        """Procura uma resposta armazenada para a consulta.
+
+        Args:
+            consulta (str): Consulta do usuário.
+            categoria (Optional[str]): Categoria da rota. Se omitida, todas são consultadas.
+            historico (str): Janela de histórico da conversa usada nos prompts.
+
+        Returns:
+            Optional[Dict[str, str]]: Dicionário com 'categoria' e 'resposta', ou None.
+        """
+        chave, contexto = chave_consulta(consulta), contexto_historico(historico)
+        categorias = (categoria,) if categoria else CATEGORIAS
+        encontrada = self._buscar_sem_semantica(chave, categorias, contexto)
+        if encontrada is not None:
+            return encontrada
+        if self.embedder is not None:
+            candidatos = self._candidatos(chave, categorias, contexto)
+            if candidatos:
+                return self._registrar(self._melhor_candidato(chave, candidatos), "semantic")
+        return self._registrar(None, "")
+
+    async def aget(self, consulta: str, categoria: Optional[str] = None,
+                   historico: str = "") -> Optional[Dict[str, str]]:
+        """Versão assíncrona de `get`: a comparação semântica (embedding e varredura das
+        entradas) roda em uma thread, fora do event loop."""
+        chave, contexto = chave_consulta(consulta), contexto_historico(historico)
+        categorias = (categoria,) if categoria else CATEGORIAS
+        encontrada = self._buscar_sem_semantica(chave, categorias, contexto)
+        if encontrada is not None:
+            return encontrada
+        if self.embedder is not None:
+            # A seleção dos candidatos lê o LRU e, por isso, fica no event loop
+            candidatos = self._candidatos(chave, categorias, contexto)
+            if candidatos:
+                melhor = await asyncio.to_thread(self._melhor_candidato, chave, candidatos)
+                return self._registrar(melhor, "semantic")
+        return self._registrar(None, "")
+
+    def set(self, consulta: str, categoria: str, resposta: str, historico: str = ""):
+        """Armazena a resposta de uma consulta para a categoria e a janela de histórico informadas."""
+        if not resposta or categoria not in self.ttls:
+            return
+        chave = chave_consulta(consulta)
+        entrada = {"resposta": resposta, "literais": termos_literais(chave)}
+        if self.embedder is not None:
+            entrada["embedding"] = self.embedder(chave)
+        self._entradas.set((chave, categoria, contexto_historico(historico)), entrada,
+                           ttl=self.ttls[categoria])
+        metrics.set("chat_x_response_cache_entries", len(self._entradas))
+
+    def clear(self):
+        """Remove todas as respostas armazenadas."""
+        self._entradas.clear()
@@ -15,6 +15,7 @@ import asyncio
 from grpc import aio
 import genai_pb2
 import genai_pb2_grpc
+from storage import MESSAGE_LIMIT
 
 USER_AVATAR = "🧑‍⚕️"
 BOT_AVATAR = "🤖"
@@ -76,7 +77,7 @@ if st.session_state.is_logged_in:
         st.session_state.thread_key = key
     st.sidebar.text("Usuário: " + st.session_state.useremail)
     counter, value = get_limit_message(st.session_state.useremail)
-    st.sidebar.text(f"Sua cota de prompt é: {20 - value}")
+    st.sidebar.text(f"Sua cota de prompt é: {MESSAGE_LIMIT - value}")
 
     # Load messages from the database
     st.session_state.messages = load_messages(st.session_state.useremail)
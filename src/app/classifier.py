@@ -0,0 +1,160 @@
+# classifier.py
+
+import json
+import logging
+import math
+import re
+from collections import Counter
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cache import normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+# Expressões de conversa informal; a mensagem inteira precisa ser composta por elas
+TERMOS_CONVERSA = (
+    "oi+", "ola", "opa", "e ai", "eai", "hey", "hello", "hi", "bom dia", "boa tarde",
+    "boa noite", "tudo bem", "tudo bom", "como vai", "como voce esta", "beleza",
+    "obrigad[oa]", "muito obrigad[oa]", "valeu", "vlw", "tchau", "ate logo", "ate mais",
+    "ok", "certo", "entendi", "legal", "show", "blz", "k{2,}", "(ha)+",
+)
+_ALTERNATIVAS_CONVERSA = "|".join(TERMOS_CONVERSA)
+PADRAO_CONVERSA = re.compile(
+    rf"^({_ALTERNATIVAS_CONVERSA})( ({_ALTERNATIVAS_CONVERSA}))*$"
+)
+
+# Termos relacionados a tempo ou a fatos recentes (consultados após normalização)
+TERMOS_COMPLEXA = (
+    "dia", "dias", "hora", "horas", "mes", "meses", "ano", "anos", "hoje", "ontem",
+    "amanha", "agora", "semana", "data", "datas", "atual", "atualmente", "recente",
+    "recentemente", "ultimo", "ultima", "ultimos", "ultimas", "noticia", "noticias",
+    "cotacao", "previsao", "placar", "eleicao", "eleicoes", "lancamento", "calendario",
+    "feriado", "horario",
+)
+PADRAO_COMPLEXA = re.compile(r"\b(" + "|".join(TERMOS_COMPLEXA) + r")\b")
+PADRAO_ANO = re.compile(r"\b(19|20)\d{2}\b")
+
+
+class NaiveBayesClassifier:
+    """Modelo local minúsculo (Naive Bayes multinomial sobre palavras normalizadas).
+
+    Treinado a partir de consultas rotuladas, roda inteiramente em memória e serve de
+    segunda opinião para consultas que as regras não conseguem decidir.
+    """
+
+    def __init__(self):
+        self._contagens: Dict[str, Counter] = {}
+        self._documentos: Counter = Counter()
+        self._vocabulario: set = set()
+
+    def treinar(self, exemplos: Iterable[Tuple[str, str]]) -> "NaiveBayesClassifier":
+        """Treina o modelo com pares (consulta, categoria)."""
+        for consulta, categoria in exemplos:
+            palavras = normalizar_texto(consulta).split()
+            self._contagens.setdefault(categoria, Counter()).update(palavras)
+            self._documentos[categoria] += 1
+            self._vocabulario.update(palavras)
+        return self
+
+    @classmethod
+    def from_jsonl(cls, caminho: str) -> "NaiveBayesClassifier":
+        """Treina o modelo a partir de um arquivo JSONL com campos 'query' e 'categoria'."""
+        with open(caminho, encoding="utf-8") as arquivo:
+            exemplos = [json.loads(linha) for linha in arquivo if linha.strip()]
+        return cls().treinar((e["query"], e["categoria"]) for e in exemplos)
+
+    def prever(self, consulta: str) -> Tuple[str, float]:
+        """Retorna a categoria mais provável e sua probabilidade."""
+        palavras = normalizar_texto(consulta).split()
+        total_docs = sum(self._documentos.values())
+        vocab = len(self._vocabulario) + 1
+        log_probs = {}
+        for categoria, contagens in self._contagens.items():
+            total = sum(contagens.values())
+            log_p = math.log(self._documentos[categoria] / total_docs)
+            for palavra in palavras:
+                log_p += math.log((contagens[palavra] + 1) / (total + vocab))
+            log_probs[categoria] = log_p
+        maximo = max(log_probs.values())
+        normalizador = sum(math.exp(v - maximo) for v in log_probs.values())
+        categoria = max(log_probs, key=log_probs.get)
+        return categoria, 1.0 / normalizador
+
+
+class QueryPreClassifier:
+    """Pré-classificador local que evita a chamada ao LLM de categorização.
+
+    Aplica as mesmas regras do prompt de 'categorize' de forma lexical: termos de tempo
+    e anos recentes resultam em 'complexa'; mensagens de conversa informal resultam em
+    'simples'. Quando nenhuma regra se aplica, consulta o modelo local (se houver) e só
+    decide se a probabilidade superar `confianca_minima`; caso contrário, devolve None
+    para que a decisão fique com o LLM.
+    """
+
+    def __init__(self, modelo: Optional[NaiveBayesClassifier] = None,
+                 confianca_minima: float = 0.9, ano_atual: Optional[int] = None):
+        """
+        Args:
+            modelo (Optional[NaiveBayesClassifier]): Modelo local opcional.
+            confianca_minima (float): Probabilidade mínima para aceitar a decisão do modelo.
+            ano_atual (Optional[int]): Ano de referência para "últimos 2 anos" (padrão: hoje).
+        """
+        self.modelo = modelo
+        self.confianca_minima = confianca_minima
+        self.ano_atual = ano_atual
+
+    def _ano_recente(self, normalizada: str) -> bool:
+        ano_atual = self.ano_atual or date.today().year
+        return any(
+            ano_atual - 2 <= int(m.group(0)) for m in PADRAO_ANO.finditer(normalizada)
+        )
+
+    def classificar(self, consulta: str) -> Tuple[Optional[str], str]:
+        """Classifica a consulta localmente.
+
+        Args:
+            consulta (str): Consulta do usuário.
+
+        Returns:
+            Tuple[Optional[str], str]: Categoria ('simples', 'complexa' ou None quando
+            incerto) e a origem da decisão ('regras', 'modelo' ou 'indefinido').
+        """
+        normalizada = normalizar_texto(consulta)
+        if PADRAO_CONVERSA.match(normalizada):
+            return "simples", "regras"
+        if PADRAO_COMPLEXA.search(normalizada) or self._ano_recente(normalizada):
+            return "complexa", "regras"
+        if self.modelo is not None:
+            categoria, probabilidade = self.modelo.prever(consulta)
+            if probabilidade >= self.confianca_minima:
+                return categoria, "modelo"
+        return None, "indefinido"
+
+
+def avaliar(pre_classificador: QueryPreClassifier,
+            exemplos: List[Tuple[str, str]]) -> Dict[str, float]:
+    """Compara as decisões do pré-classificador com rótulos de referência (do LLM).
+
+    Args:
+        pre_classificador (QueryPreClassifier): Classificador avaliado.
+        exemplos (List[Tuple[str, str]]): Pares (consulta, categoria do LLM).
+
+    Returns:
+        Dict[str, float]: Cobertura (fração decidida localmente), concordância nas
+        decisões tomadas e contagem de divergências.
+    """
+    decididas = concordantes = 0
+    for consulta, esperado in exemplos:
+        categoria, _ = pre_classificador.classificar(consulta)
+        if categoria is None:
+            continue
+        decididas += 1
+        concordantes += categoria == esperado
+    total = len(exemplos) or 1
+    return {
+        "total": len(exemplos),
+        "cobertura": decididas / total,
+        "concordancia": concordantes / decididas if decididas else 0.0,
+        "divergencias": decididas - concordantes,
+    }
@@ -1,18 +1,31 @@
 import asyncio
+import os
+import sys
+
 import grpc
 from grpc import aio
 
 import genai_pb2
 import genai_pb2_grpc
 
-async def main():
+# E-mail de um usuário registrado: o servidor recusa perguntas sem ele (UNAUTHENTICATED)
+CLIENT_USER_EMAIL = os.getenv("CLIENT_USER_EMAIL", "")
+
+async def main(user_email: str = CLIENT_USER_EMAIL):
         async with aio.insecure_channel("localhost:50051") as channel:
             stub = genai_pb2_grpc.GenAiServiceStub(channel)
             user_question = "Qual a capital da França?"
-            request = genai_pb2.QuestionRequest(question=user_question)
+            request = genai_pb2.QuestionRequest(question=user_question, user_email=user_email)
             # Faz chamada assíncrona ao servidor
-            response = await stub.AskQuestion(request)
+            try:
+                response = await stub.AskQuestion(request)
+            except grpc.RpcError as e:
+                if e.code() != grpc.StatusCode.UNAUTHENTICATED:
+                    raise
+                print("Pergunta recusada pelo servidor:", e.details())
+                return
             print("Resposta do servidor:", response.answer)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # Uso: python client.py [email]  (ou CLIENT_USER_EMAIL no ambiente)
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else CLIENT_USER_EMAIL))
@@ -0,0 +1,491 @@
+# conversation.py
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from cache import TTLCache
+from metrics import metrics
+from storage import ChatStorage
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - dependência opcional
+    tiktoken = None
+
+# Janela de histórico por conversa, limitada em tokens
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Fração do orçamento reservada às mensagens antigas compactadas
+HISTORY_COMPACT_SHARE = float(os.getenv("HISTORY_COMPACT_SHARE", "0.3"))
+HISTORY_COMPACT_MESSAGE_TOKENS = int(os.getenv("HISTORY_COMPACT_MESSAGE_TOKENS", "40"))
+# Mensagens lidas do banco quando a conversa não está em memória (p. ex., após reinício)
+HISTORY_HYDRATE_MESSAGES = int(os.getenv("HISTORY_HYDRATE_MESSAGES", "20"))
+CONVERSATION_CACHE_MAX_ENTRIES = int(os.getenv("CONVERSATION_CACHE_MAX_ENTRIES", "1024"))
+CONVERSATION_CACHE_TTL = float(os.getenv("CONVERSATION_CACHE_TTL", "3600"))  # inatividade, em segundos
+TOKENIZER_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+
+# Resumo incremental: o prompt recebe o resumo mantido em segundo plano e os
+# últimos SUMMARY_RECENT_TURNS turnos na íntegra
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+SUMMARY_RECENT_TURNS = int(os.getenv("SUMMARY_RECENT_TURNS", "4"))
+# Mensagens novas (fora dos turnos recentes) necessárias para atualizar o resumo
+SUMMARY_MIN_MESSAGES = int(os.getenv("SUMMARY_MIN_MESSAGES", "4"))
+SUMMARY_BATCH_MESSAGES = int(os.getenv("SUMMARY_BATCH_MESSAGES", "40"))  # por chamada ao LLM
+# Mensagens pendentes resumidas por atualização; as mais antigas além disso ficam fora do resumo
+SUMMARY_MAX_BACKLOG = int(os.getenv("SUMMARY_MAX_BACKLOG", "120"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+
+PAPEIS = {"user": "Usuário", "assistant": "Assistente"}
+RETICENCIAS = "…"
+CABECALHO_COMPACTADAS = "Mensagens anteriores (resumidas):"
+CABECALHO_RESUMO = "Resumo da conversa até aqui:"
+
+
+class TokenCounter:
+    """Contagem de tokens com o tokenizador do modelo (tiktoken).
+
+    O vocabulário do tiktoken é baixado na primeira utilização; sem ele (p. ex., em
+    ambientes sem rede), usa-se a estimativa de ~4 caracteres por token.
+    """
+
+    def __init__(self, modelo: str = TOKENIZER_MODEL):
+        self.modelo = modelo
+        self._encoding = None
+        self._carregado = False
+
+    def _carregar(self) -> None:
+        self._carregado = True
+        if tiktoken is None:
+            return
+        try:
+            self._encoding = tiktoken.encoding_for_model(self.modelo)
+        except KeyError:
+            self._encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning("Tokenizador indisponível (%s); usando estimativa por caracteres.", e)
+
+    def __call__(self, texto: str) -> int:
+        if not self._carregado:
+            try:
+                self._carregar()
+            except Exception as e:
+                logger.warning("Tokenizador indisponível (%s); usando estimativa por caracteres.", e)
+        if not texto:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(texto, disallowed_special=()))
+        return math.ceil(len(texto) / 4)
+
+    def truncar(self, texto: str, max_tokens: int) -> str:
+        """Corta o texto em `max_tokens` tokens, indicando o corte com reticências."""
+        if self(texto) <= max_tokens:
+            return texto
+        if self._encoding is not None:
+            tokens = self._encoding.encode(texto, disallowed_special=())
+            return self._encoding.decode(tokens[:max_tokens]) + RETICENCIAS
+        return texto[:max_tokens * 4] + RETICENCIAS
+
+
+contar_tokens = TokenCounter()
+
+
+class Mensagem:
+    __slots__ = ("papel", "texto", "tokens")
+
+    def __init__(self, papel: str, texto: str, tokens: int):
+        self.papel = papel
+        self.texto = texto
+        self.tokens = tokens
+
+    def linha(self) -> str:
+        return f"{PAPEIS.get(self.papel, self.papel)}: {self.texto}"
+
+
+class ConversationWindow:
+    """Janela de histórico de uma conversa, limitada a um orçamento de tokens.
+
+    As mensagens mais recentes são mantidas na íntegra. Quando excedem sua parcela do
+    orçamento, as mais antigas são compactadas (truncadas em
+    `tokens_por_mensagem_compactada`) e, quando as compactadas excedem a parcela
+    delas, as mais antigas são descartadas. O texto resultante fica limitado a
+    `orcamento` tokens, qualquer que seja o tamanho da conversa.
+
+    Com um resumo da conversa (`definir_resumo`), a parcela das mensagens antigas
+    passa a conter o resumo; as compactadas ficam apenas com o espaço restante,
+    cobrindo as mensagens que o resumo ainda não incorporou.
+    """
+
+    def __init__(self, orcamento: int = HISTORY_TOKEN_BUDGET,
+                 fracao_compactada: float = HISTORY_COMPACT_SHARE,
+                 tokens_por_mensagem_compactada: int = HISTORY_COMPACT_MESSAGE_TOKENS,
+                 contar: Callable[[str], int] = contar_tokens,
+                 max_mensagens_recentes: int = 0):
+        """
+        Args:
+            orcamento (int): Número máximo de tokens do histórico.
+            fracao_compactada (float): Fração do orçamento para mensagens antigas.
+            tokens_por_mensagem_compactada (int): Tamanho de cada mensagem compactada.
+            contar (Callable[[str], int]): Contador de tokens.
+            max_mensagens_recentes (int): Máximo de mensagens na íntegra (0 = só o orçamento).
+        """
+        reservado = int(orcamento * fracao_compactada)
+        self.orcamento_recentes = orcamento - reservado
+        self.tokens_por_mensagem_compactada = tokens_por_mensagem_compactada
+        self.max_mensagens_recentes = max_mensagens_recentes
+        self._contar = contar
+        # O cabeçalho e a linha em branco de cada seção também ocupam o orçamento
+        self.orcamento_compactadas = max(reservado - contar(CABECALHO_COMPACTADAS) - 2, 0)
+        self.orcamento_resumo = max(reservado - contar(CABECALHO_RESUMO) - 2, 0)
+        self.recentes: Deque[Mensagem] = deque()
+        self.compactadas: Deque[Mensagem] = deque()
+        self.tokens_recentes = 0
+        self.tokens_compactadas = 0
+        self.resumo = ""
+        self.tokens_resumo = 0
+        self._resumo_recebido = ""
+
+    @property
+    def tokens(self) -> int:
+        """Tokens das mensagens e do resumo mantidos na janela."""
+        return self.tokens_recentes + self.tokens_compactadas + self.tokens_resumo
+
+    def _truncar(self, texto: str, max_tokens: int) -> str:
+        if self._contar(texto) <= max_tokens:
+            return texto
+        truncar = getattr(self._contar, "truncar", None)
+        return truncar(texto, max_tokens) if truncar else texto[:max_tokens * 4] + RETICENCIAS
+
+    def _contar_linha(self, mensagem: Mensagem) -> int:
+        # A contagem inclui o rótulo do papel e a quebra de linha, como no prompt
+        return self._contar(mensagem.linha()) + 1
+
+    def _mensagem(self, papel: str, texto: str, max_tokens: int) -> Mensagem:
+        mensagem = Mensagem(papel, texto, 0)
+        mensagem.tokens = self._contar_linha(mensagem)
+        if mensagem.tokens > max_tokens:
+            rotulo = self._contar(f"{PAPEIS.get(papel, papel)}: ") + 2
+            mensagem.texto = self._truncar(texto, max(max_tokens - rotulo, 0))
+            mensagem.tokens = self._contar_linha(mensagem)
+        return mensagem
+
+    def adicionar(self, papel: str, texto: str) -> None:
+        """Acrescenta uma mensagem ('user' ou 'assistant') e reajusta a janela."""
+        mensagem = self._mensagem(papel, texto, self.orcamento_recentes)
+        self.recentes.append(mensagem)
+        self.tokens_recentes += mensagem.tokens
+        while self._excede_recentes() and len(self.recentes) > 1:
+            antiga = self.recentes.popleft()
+            self.tokens_recentes -= antiga.tokens
+            self._compactar(antiga)
+
+    def _excede_recentes(self) -> bool:
+        if self.max_mensagens_recentes and len(self.recentes) > self.max_mensagens_recentes:
+            return True
+        return self.tokens_recentes > self.orcamento_recentes
+
+    def _compactar(self, mensagem: Mensagem) -> None:
+        compactada = self._mensagem(mensagem.papel, mensagem.texto, self.tokens_por_mensagem_compactada)
+        limite = self.orcamento_compactadas - self.tokens_resumo
+        if compactada.tokens > limite:
+            return
+        self.compactadas.append(compactada)
+        self.tokens_compactadas += compactada.tokens
+        while self.tokens_compactadas > limite:
+            self.tokens_compactadas -= self.compactadas.popleft().tokens
+
+    def definir_resumo(self, resumo: str) -> None:
+        """
+        Substitui as mensagens compactadas pelo resumo da conversa.
+
+        O resumo cobre as mensagens anteriores aos turnos recentes, inclusive as que
+        estavam compactadas; ele é truncado para caber na parcela das mensagens antigas.
+
+        Args:
+            resumo (str): Resumo mais recente ('' mantém a janela sem resumo).
+        """
+        if not resumo or resumo == self._resumo_recebido:
+            return
+        self._resumo_recebido = resumo
+        self.resumo = self._truncar(resumo, self.orcamento_resumo)
+        self.tokens_resumo = self._contar(CABECALHO_RESUMO) + self._contar(self.resumo) + 2
+        self.compactadas.clear()
+        self.tokens_compactadas = 0
+
+    def texto(self) -> str:
+        """Histórico formatado para os prompts (vazio se não houver mensagens)."""
+        partes: List[str] = []
+        if self.resumo:
+            partes.extend((CABECALHO_RESUMO, self.resumo, ""))
+        if self.compactadas:
+            partes.append(CABECALHO_COMPACTADAS)
+            partes.extend(m.linha() for m in self.compactadas)
+            partes.append("")
+        partes.extend(m.linha() for m in self.recentes)
+        return "\n".join(partes)
+
+
+class ResumoConversa:
+    __slots__ = ("texto", "ate_id")
+
+    def __init__(self, texto: str, ate_id: int):
+        self.texto = texto
+        self.ate_id = ate_id
+
+
+def formatar_mensagens(mensagens: List[Dict]) -> str:
+    """Formata mensagens do armazenamento (role, content) como no histórico dos prompts."""
+    return "\n".join(Mensagem(m["role"], m["content"], 0).linha() for m in mensagens)
+
+
+class ConversationSummarizer:
+    """Resumo incremental (rolling summary) da conversa de cada usuário.
+
+    O resumo cobre as mensagens gravadas até `ate_id`, exceto os últimos
+    `turnos_recentes` turnos, que o prompt recebe na íntegra. A cada pergunta,
+    `agendar` dispara em segundo plano a atualização: apenas as mensagens novas
+    são enviadas a `resumir`, junto com o resumo anterior, e o resultado é gravado
+    em `thread_save`. Assim, montar o prompt custa a leitura de um resumo em
+    memória, qualquer que seja o tamanho da conversa, e o LLM de resumo fica fora
+    do caminho da resposta.
+
+    Cada atualização lê no máximo as `max_pendentes` mensagens mais recentes ainda
+    não resumidas: em uma conversa longa sem resumo (por exemplo, ao ativar o
+    recurso), as mais antigas são puladas em vez de gerar uma rajada de chamadas.
+    """
+
+    def __init__(self, resumir: Optional[Callable[[str, str], Awaitable[str]]] = None,
+                 storage: Optional[ChatStorage] = None,
+                 turnos_recentes: int = SUMMARY_RECENT_TURNS,
+                 minimo_mensagens: int = SUMMARY_MIN_MESSAGES,
+                 lote: int = SUMMARY_BATCH_MESSAGES,
+                 max_pendentes: int = SUMMARY_MAX_BACKLOG,
+                 max_tokens: int = SUMMARY_MAX_TOKENS,
+                 contar: Callable[[str], int] = contar_tokens,
+                 max_entries: int = CONVERSATION_CACHE_MAX_ENTRIES,
+                 ttl: float = CONVERSATION_CACHE_TTL):
+        """
+        Args:
+            resumir (Callable): Corrotina (resumo anterior, novas mensagens) -> novo resumo.
+            storage (Optional[ChatStorage]): Armazenamento das mensagens e dos resumos.
+            turnos_recentes (int): Turnos mantidos fora do resumo.
+            minimo_mensagens (int): Mensagens novas necessárias para atualizar o resumo.
+            lote (int): Máximo de mensagens por chamada a `resumir`.
+            max_pendentes (int): Máximo de mensagens resumidas por atualização.
+            max_tokens (int): Tamanho máximo do resumo gravado.
+            contar (Callable[[str], int]): Contador de tokens.
+            max_entries (int): Número máximo de resumos em memória.
+            ttl (float): Tempo de inatividade, em segundos, após o qual o resumo é relido.
+        """
+        self.resumir = resumir
+        self.storage = storage
+        self.mensagens_recentes = 2 * turnos_recentes
+        self.minimo_mensagens = max(minimo_mensagens, 1)
+        self.lote = max(lote, 1)
+        self.max_pendentes = max(max_pendentes, self.minimo_mensagens)
+        self.max_tokens = max_tokens
+        self._contar = contar
+        self._resumos = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._tarefas: Dict[str, asyncio.Task] = {}
+        self._repetir: Set[str] = set()
+
+    @property
+    def ativo(self) -> bool:
+        return self.resumir is not None and self.storage is not None
+
+    def conectar(self, storage: ChatStorage,
+                 resumir: Optional[Callable[[str, str], Awaitable[str]]] = None) -> None:
+        """Define o armazenamento (e, opcionalmente, o LLM de resumo)."""
+        self.storage = storage
+        if resumir is not None:
+            self.resumir = resumir
+
+    async def _obter(self, user_email: str) -> ResumoConversa:
+        resumo = self._resumos.get(user_email)
+        if resumo is None:
+            texto, ate_id = await asyncio.to_thread(self.storage.get_thread_summary, user_email)
+            resumo = ResumoConversa(texto, ate_id)
+            self._resumos.set(user_email, resumo)
+        return resumo
+
+    async def resumo(self, user_email: str) -> str:
+        """Resumo atual da conversa do usuário ('' se ainda não houver)."""
+        if not self.ativo or not user_email:
+            return ""
+        return (await self._obter(user_email)).texto
+
+    async def atualizar(self, user_email: str) -> bool:
+        """
+        Incorpora ao resumo as mensagens gravadas desde a última atualização.
+
+        Args:
+            user_email (str): Usuário dono da conversa.
+
+        Returns:
+            bool: True se o resumo foi atualizado.
+        """
+        if not self.ativo or not user_email:
+            return False
+        resumo = await self._obter(user_email)
+        mensagens = await asyncio.to_thread(
+            self.storage.load_messages, user_email, None,
+            self.max_pendentes + self.mensagens_recentes, resumo.ate_id
+        )
+        novas = mensagens[:max(len(mensagens) - self.mensagens_recentes, 0)]
+        if len(novas) < self.minimo_mensagens:
+            return False
+        for inicio in range(0, len(novas), self.lote):
+            lote = novas[inicio:inicio + self.lote]
+            comeco = time.perf_counter()
+            try:
+                texto = await self.resumir(resumo.texto, formatar_mensagens(lote))
+            except Exception as e:
+                metrics.inc("chat_x_summary_failures_total")
+                logger.warning("Falha ao atualizar o resumo de %s: %s", user_email, e)
+                return inicio > 0
+            truncar = getattr(self._contar, "truncar", None)
+            if truncar is not None:
+                texto = truncar(texto, self.max_tokens)
+            resumo = ResumoConversa(texto, lote[-1]["id"])
+            await asyncio.to_thread(self.storage.set_thread_summary, user_email, texto, resumo.ate_id)
+            self._resumos.set(user_email, resumo)
+            metrics.inc("chat_x_summary_updates_total")
+            metrics.inc("chat_x_summary_messages_total", len(lote))
+            metrics.set("chat_x_summary_seconds_last", time.perf_counter() - comeco)
+            logger.debug("Resumo de %s atualizado até a mensagem %d.", user_email, resumo.ate_id)
+        return True
+
+    def agendar(self, user_email: str) -> Optional[asyncio.Task]:
+        """
+        Agenda a atualização do resumo em segundo plano, no event loop corrente.
+
+        Se já houver uma atualização em andamento para o usuário, outra é executada
+        ao final dela, cobrindo as mensagens gravadas nesse intervalo.
+        """
+        if not self.ativo or not user_email:
+            return None
+        tarefa = self._tarefas.get(user_email)
+        if tarefa is not None and not tarefa.done():
+            self._repetir.add(user_email)
+            return tarefa
+        tarefa = asyncio.create_task(self._executar(user_email))
+        self._tarefas[user_email] = tarefa
+        return tarefa
+
+    async def _executar(self, user_email: str) -> None:
+        try:
+            while True:
+                await self.atualizar(user_email)
+                if user_email not in self._repetir:
+                    break
+                self._repetir.discard(user_email)
+        except Exception as e:
+            metrics.inc("chat_x_summary_failures_total")
+            logger.error("Erro na atualização do resumo de %s: %s", user_email, e)
+        finally:
+            self._tarefas.pop(user_email, None)
+
+    async def aclose(self) -> None:
+        """Cancela as atualizações em andamento."""
+        tarefas = list(self._tarefas.values())
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+        self._tarefas.clear()
+        self._repetir.clear()
+
+
+class ConversationStore:
+    """Janelas de histórico por conversa, mantidas em memória no servidor.
+
+    A conversa é identificada pelo `conversation_id` da requisição, sempre associado
+    ao usuário (conversas de usuários distintos nunca se misturam). Quando ela não
+    está em memória (primeira pergunta após reinício do servidor ou expiração), as
+    últimas mensagens do usuário são lidas do armazenamento, se conectado.
+
+    Com um `resumidor`, o histórico traz o resumo da conversa do usuário (a thread
+    de `thread_save`) seguido dos turnos recentes, e cada pergunta agenda a
+    atualização do resumo. A atualização é verificada na pergunta seguinte, e não ao
+    registrar o turno: os turnos são gravados pela interface (`record_turn`) só
+    depois de a resposta ser entregue.
+    """
+
+    def __init__(self, storage: Optional[ChatStorage] = None,
+                 max_entries: int = CONVERSATION_CACHE_MAX_ENTRIES,
+                 ttl: float = CONVERSATION_CACHE_TTL,
+                 criar_janela: Callable[[], ConversationWindow] = ConversationWindow,
+                 resumidor: Optional[ConversationSummarizer] = None):
+        """
+        Args:
+            storage (Optional[ChatStorage]): Armazenamento das mensagens já gravadas.
+            max_entries (int): Número máximo de conversas em memória.
+            ttl (float): Tempo de inatividade, em segundos, após o qual a janela expira.
+            criar_janela (Callable): Fábrica das janelas de novas conversas.
+            resumidor (Optional[ConversationSummarizer]): Resumo incremental das conversas.
+        """
+        self.storage = storage
+        self.criar_janela = criar_janela
+        self.resumidor = resumidor
+        self._janelas = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    def conectar(self, storage: ChatStorage) -> None:
+        """Define o armazenamento usado para recarregar conversas."""
+        self.storage = storage
+
+    async def janela(self, conversation_id: str, user_email: str = "") -> ConversationWindow:
+        """
+        Obtém a janela da conversa, recarregando-a do armazenamento se necessário.
+
+        Args:
+            conversation_id (str): Identificador da conversa.
+            user_email (str): Usuário dono da conversa, usado na recarga.
+
+        Returns:
+            ConversationWindow: Janela da conversa.
+        """
+        chave = (user_email, conversation_id)
+        janela = self._janelas.get(chave)
+        if janela is not None:
+            return janela
+        janela = self.criar_janela()
+        if self.storage is not None and user_email and HISTORY_HYDRATE_MESSAGES > 0:
+            mensagens = await asyncio.to_thread(
+                self.storage.load_messages, user_email, None, HISTORY_HYDRATE_MESSAGES
+            )
+            for mensagem in mensagens:
+                janela.adicionar(mensagem["role"], mensagem["content"])
+            metrics.inc("chat_x_conversation_hydrations_total")
+            logger.debug("Conversa %s recarregada com %d mensagens.", conversation_id, len(mensagens))
+        # Outra requisição da mesma conversa pode ter criado a janela durante a leitura
+        existente = self._janelas.get(chave)
+        if existente is not None:
+            return existente
+        self._janelas.set(chave, janela)
+        metrics.set("chat_x_conversations", len(self._janelas))
+        return janela
+
+    async def historico(self, conversation_id: str, user_email: str = "") -> str:
+        """Histórico da conversa formatado para os prompts ('' sem conversation_id)."""
+        if not conversation_id:
+            return ""
+        janela = await self.janela(conversation_id, user_email)
+        if self.resumidor is not None:
+            janela.definir_resumo(await self.resumidor.resumo(user_email))
+            # Os turnos anteriores já foram gravados: incorpora-os ao resumo em segundo plano
+            self.resumidor.agendar(user_email)
+        return janela.texto()
+
+    async def registrar_turno(self, conversation_id: str, pergunta: str, resposta: str,
+                              user_email: str = "") -> None:
+        """Acrescenta pergunta e resposta à janela da conversa."""
+        if not conversation_id:
+            return
+        janela = await self.janela(conversation_id, user_email)
+        janela.adicionar("user", pergunta)
+        janela.adicionar("assistant", resposta)
+        metrics.set("chat_x_history_window_tokens", janela.tokens)
@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0bgenai.proto\x12\x05genai\"#\n\x0fQuestionRequest\x12\x10\n\x08question\x18\x01 \x01(\t\" \n\x0e\x41nswerResponse\x12\x0e\n\x06\x61nswer\x18\x01 \x01(\t2L\n\x0cGenAiService\x12<\n\x0b\x41skQuestion\x12\x16.genai.QuestionRequest\x1a\x15.genai.AnswerResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0bgenai.proto\x12\x05genai\"P\n\x0fQuestionRequest\x12\x10\n\x08question\x18\x01 \x01(\t\x12\x12\n\nuser_email\x18\x02 \x01(\t\x12\x17\n\x0f\x63onversation_id\x18\x03 \x01(\t\"7\n\x0e\x41nswerResponse\x12\x0e\n\x06\x61nswer\x18\x01 \x01(\t\x12\x15\n\rprompt_tokens\x18\x02 \x01(\x05\"3\n\x0b\x41nswerChunk\x12\r\n\x05\x63hunk\x18\x01 \x01(\t\x12\x15\n\rprompt_tokens\x18\x02 \x01(\x05\x32\x8f\x01\n\x0cGenAiService\x12<\n\x0b\x41skQuestion\x12\x16.genai.QuestionRequest\x1a\x15.genai.AnswerResponse\x12\x41\n\x11\x41skQuestionStream\x12\x16.genai.QuestionRequest\x1a\x12.genai.AnswerChunk0\x01\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -32,9 +32,11 @@ _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'genai_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
   _globals['_QUESTIONREQUEST']._serialized_start=22
-  _globals['_QUESTIONREQUEST']._serialized_end=57
-  _globals['_ANSWERRESPONSE']._serialized_start=59
-  _globals['_ANSWERRESPONSE']._serialized_end=91
-  _globals['_GENAISERVICE']._serialized_start=93
-  _globals['_GENAISERVICE']._serialized_end=169
+  _globals['_QUESTIONREQUEST']._serialized_end=102
+  _globals['_ANSWERRESPONSE']._serialized_start=104
+  _globals['_ANSWERRESPONSE']._serialized_end=159
+  _globals['_ANSWERCHUNK']._serialized_start=161
+  _globals['_ANSWERCHUNK']._serialized_end=212
+  _globals['_GENAISERVICE']._serialized_start=215
+  _globals['_GENAISERVICE']._serialized_end=358
 # @@protoc_insertion_point(module_scope)
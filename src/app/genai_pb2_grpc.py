@@ -39,6 +39,11 @@ class GenAiServiceStub(object):
                 request_serializer=genai__pb2.QuestionRequest.SerializeToString,
                 response_deserializer=genai__pb2.AnswerResponse.FromString,
                 _registered_method=True)
+        self.AskQuestionStream = channel.unary_stream(
+                '/genai.GenAiService/AskQuestionStream',
+                request_serializer=genai__pb2.QuestionRequest.SerializeToString,
+                response_deserializer=genai__pb2.AnswerChunk.FromString,
+                _registered_method=True)
 
 
 class GenAiServiceServicer(object):
@@ -50,6 +55,12 @@ class GenAiServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def AskQuestionStream(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_GenAiServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -58,6 +69,11 @@ def add_GenAiServiceServicer_to_server(servicer, server):
                     request_deserializer=genai__pb2.QuestionRequest.FromString,
                     response_serializer=genai__pb2.AnswerResponse.SerializeToString,
             ),
+            'AskQuestionStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.AskQuestionStream,
+                    request_deserializer=genai__pb2.QuestionRequest.FromString,
+                    response_serializer=genai__pb2.AnswerChunk.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'genai.GenAiService', rpc_method_handlers)
@@ -95,3 +111,30 @@ class GenAiService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def AskQuestionStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/genai.GenAiService/AskQuestionStream',
+            genai__pb2.QuestionRequest.SerializeToString,
+            genai__pb2.AnswerChunk.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -1,30 +1,256 @@
 # grpc_client.py
 
-import logging
 import asyncio
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import AsyncIterator, Callable, Dict, Iterator, List
+
+import grpc
 from grpc import aio
 import genai_pb2
 import genai_pb2_grpc
 
+# Canais persistentes, compartilhados por todas as sessões do processo
+GRPC_CHANNEL_POOL_SIZE = int(os.getenv("GRPC_CHANNEL_POOL_SIZE", "2"))
+GRPC_TIMEOUT = float(os.getenv("GRPC_TIMEOUT", "120"))  # prazo por chamada, em segundos
+GRPC_KEEPALIVE_TIME_MS = int(os.getenv("GRPC_KEEPALIVE_TIME_MS", "30000"))
+GRPC_KEEPALIVE_TIMEOUT_MS = int(os.getenv("GRPC_KEEPALIVE_TIMEOUT_MS", "10000"))
+GRPC_COMPRESSION = os.getenv("GRPC_COMPRESSION", "none").lower()  # 'gzip', 'deflate' ou 'none'
+GRPC_RETRY_MAX_ATTEMPTS = int(os.getenv("GRPC_RETRY_MAX_ATTEMPTS", "3"))
+
+MENSAGEM_ERRO = "Desculpe, ocorreu um erro ao processar sua pergunta."
+
+COMPRESSOES = {
+    "gzip": grpc.Compression.Gzip,
+    "deflate": grpc.Compression.Deflate,
+    "none": grpc.Compression.NoCompression,
+}
+
+# Repetição automática de chamadas recusadas antes do processamento (p. ex., durante
+# a reinicialização do servidor); nos streams, apenas antes do primeiro trecho
+SERVICE_CONFIG = json.dumps({
+    "methodConfig": [{
+        "name": [{"service": "genai.GenAiService"}],
+        "retryPolicy": {
+            "maxAttempts": GRPC_RETRY_MAX_ATTEMPTS,
+            "initialBackoff": "0.1s",
+            "maxBackoff": "2s",
+            "backoffMultiplier": 2,
+            "retryableStatusCodes": ["UNAVAILABLE"],
+        },
+    }]
+})
+
+
+def channel_options() -> List[tuple]:
+    """Opções de keepalive e de repetição usadas nos canais do cliente."""
+    return [
+        ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_TIME_MS),
+        ("grpc.keepalive_timeout_ms", GRPC_KEEPALIVE_TIMEOUT_MS),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+        ("grpc.enable_retries", 1),
+        ("grpc.service_config", SERVICE_CONFIG),
+        # Cada canal do pool mantém sua própria conexão HTTP/2
+        ("grpc.use_local_subchannel_pool", 1),
+    ]
+
+
+class ChannelPool:
+    """Canais gRPC persistentes em um event loop dedicado, executado em uma thread.
+
+    O Streamlit executa cada interação em uma thread própria e, antes, criava um
+    event loop e um canal (com novo handshake HTTP/2) por pergunta. Aqui, o loop e
+    os canais são criados uma única vez por processo; as chamadas são submetidas ao
+    loop com `run_coroutine_threadsafe` e distribuídas entre os canais em rodízio.
+    """
+
+    def __init__(self, address: str, size: int = GRPC_CHANNEL_POOL_SIZE):
+        """
+        Args:
+            address (str): Endereço do servidor (host:porta).
+            size (int): Número de canais (conexões) mantidos.
+        """
+        self.address = address
+        self.size = max(size, 1)
+        self.logger = logging.getLogger(__name__)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name=f"grpc_client[{address}]", daemon=True
+        )
+        self._thread.start()
+        self._stubs: List[genai_pb2_grpc.GenAiServiceStub] = []
+        self._channels: List[aio.Channel] = []
+        self._proximo = itertools.count()
+        self.submit(self._abrir_canais()).result()
+
+    async def _abrir_canais(self) -> None:
+        # Os canais aio ficam vinculados ao loop em que são criados
+        for _ in range(self.size):
+            channel = aio.insecure_channel(
+                self.address,
+                options=channel_options(),
+                compression=COMPRESSOES.get(GRPC_COMPRESSION, grpc.Compression.NoCompression),
+            )
+            self._channels.append(channel)
+            self._stubs.append(genai_pb2_grpc.GenAiServiceStub(channel))
+        self.logger.info(f"{self.size} canais gRPC abertos para {self.address}.")
+
+    def submit(self, coro) -> Future:
+        """Agenda uma corrotina no loop dos canais."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def stub(self) -> genai_pb2_grpc.GenAiServiceStub:
+        """Próximo stub do rodízio (usado apenas no loop dos canais)."""
+        return self._stubs[next(self._proximo) % self.size]
+
+    def close(self) -> None:
+        """Fecha os canais e encerra o loop."""
+        async def fechar():
+            for channel in self._channels:
+                await channel.close()
+
+        self.submit(fechar()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+_pools: Dict[str, ChannelPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_channel_pool(address: str) -> ChannelPool:
+    """Obtém o pool de canais do endereço, compartilhado por todo o processo."""
+    with _pools_lock:
+        pool = _pools.get(address)
+        if pool is None:
+            pool = _pools[address] = ChannelPool(address)
+        return pool
+
+
+@atexit.register
+def close_channel_pools() -> None:
+    """Fecha os canais antes do encerramento do interpretador."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
 
 class GRPCClient:
-    """Cliente para comunicação com o serviço gRPC."""
+    """Cliente para comunicação com o serviço gRPC.
 
-    def __init__(self, host: str = "localhost", port: int = 50051):
+    As chamadas usam os canais persistentes de `get_channel_pool`. Os métodos
+    assíncronos podem ser aguardados em qualquer event loop; os métodos `_sync`
+    atendem ao Streamlit sem criar um event loop por pergunta.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 50051, timeout: float = GRPC_TIMEOUT):
         self.address = f"{host}:{port}"
+        self.timeout = timeout
         self.logger = logging.getLogger(__name__)
+        self.pool = get_channel_pool(self.address)
         self.logger.debug(f"GRPCClient inicializado com endereço {self.address}.")
 
-    async def ask_question(self, question: str) -> str:
-        """Envia uma pergunta ao serviço gRPC e retorna a resposta."""
+    def _request(self, question: str, user_email: str, conversation_id: str) -> genai_pb2.QuestionRequest:
+        return genai_pb2.QuestionRequest(
+            question=question, user_email=user_email, conversation_id=conversation_id
+        )
+
+    @staticmethod
+    def _mensagem_erro(erro: BaseException) -> str:
+        """Mensagem exibida ao usuário: a do servidor quando o usuário não é reconhecido."""
+        if isinstance(erro, grpc.RpcError) and erro.code() == grpc.StatusCode.UNAUTHENTICATED:
+            return erro.details()
+        return MENSAGEM_ERRO
+
+    async def _ask(self, request: genai_pb2.QuestionRequest) -> str:
+        response = await self.pool.stub().AskQuestion(request, timeout=self.timeout)
+        return response.answer
+
+    async def _stream(self, request: genai_pb2.QuestionRequest, entregar: Callable) -> None:
+        """Consome o stream no loop dos canais, repassando cada trecho a `entregar`."""
+        try:
+            async for response in self.pool.stub().AskQuestionStream(request, timeout=self.timeout):
+                if response.chunk:  # O último trecho traz apenas a contagem de tokens
+                    entregar(response.chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            entregar(e)
+            return
+        entregar(None)
+
+    async def ask_question(self, question: str, user_email: str = "", conversation_id: str = "") -> str:
+        """Envia uma pergunta ao serviço gRPC e retorna a resposta.
+
+        O e-mail identifica o usuário cuja cota de mensagens é consumida no servidor;
+        `conversation_id` identifica a conversa cujo histórico é usado nos prompts.
+        """
         self.logger.info(f"Enviando pergunta via gRPC: {question}")
         try:
-            async with aio.insecure_channel(self.address) as channel:
-                stub = genai_pb2_grpc.GenAiServiceStub(channel)
-                request = genai_pb2.QuestionRequest(question=question)
-                response = await stub.AskQuestion(request)
-                self.logger.debug(f"Recebida resposta do gRPC: {response.answer}")
-                return response.answer
+            answer = await asyncio.wrap_future(self.pool.submit(self._ask(self._request(question, user_email, conversation_id))))
+            self.logger.debug(f"Recebida resposta do gRPC: {answer}")
+            return answer
         except Exception as e:
             self.logger.error(f"Erro na comunicação gRPC: {e}", exc_info=True)
-            return "Desculpe, ocorreu um erro ao processar sua pergunta."
+            return self._mensagem_erro(e)
+
+    def ask_question_sync(self, question: str, user_email: str = "", conversation_id: str = "") -> str:
+        """Versão bloqueante de `ask_question`, sem criar um event loop."""
+        self.logger.info(f"Enviando pergunta via gRPC: {question}")
+        try:
+            return self.pool.submit(self._ask(self._request(question, user_email, conversation_id))).result()
+        except Exception as e:
+            self.logger.error(f"Erro na comunicação gRPC: {e}", exc_info=True)
+            return self._mensagem_erro(e)
+
+    async def ask_question_stream(self, question: str, user_email: str = "",
+                                  conversation_id: str = "") -> AsyncIterator[str]:
+        """Envia uma pergunta ao serviço gRPC e produz a resposta em trechos.
+
+        Os trechos são entregues à medida que o servidor os gera, permitindo que a
+        interface exiba a resposta antes de sua conclusão.
+        """
+        self.logger.info(f"Enviando pergunta via gRPC (streaming): {question}")
+        loop = asyncio.get_running_loop()
+        fila: asyncio.Queue = asyncio.Queue()
+        tarefa = self.pool.submit(self._stream(
+            self._request(question, user_email, conversation_id),
+            lambda item: loop.call_soon_threadsafe(fila.put_nowait, item),
+        ))
+        try:
+            while (item := await fila.get()) is not None:
+                if isinstance(item, Exception):
+                    self.logger.error(f"Erro na comunicação gRPC: {item}", exc_info=item)
+                    yield self._mensagem_erro(item)
+                    return
+                yield item
+            self.logger.debug("Streaming da resposta gRPC concluído.")
+        finally:
+            tarefa.cancel()
+
+    def ask_question_stream_sync(self, question: str, user_email: str = "",
+                                 conversation_id: str = "") -> Iterator[str]:
+        """Versão bloqueante de `ask_question_stream`, sem criar um event loop."""
+        self.logger.info(f"Enviando pergunta via gRPC (streaming): {question}")
+        fila: "queue.Queue" = queue.Queue()
+        tarefa = self.pool.submit(self._stream(self._request(question, user_email, conversation_id), fila.put))
+        try:
+            while (item := fila.get()) is not None:
+                if isinstance(item, Exception):
+                    self.logger.error(f"Erro na comunicação gRPC: {item}", exc_info=item)
+                    yield self._mensagem_erro(item)
+                    return
+                yield item
+            self.logger.debug("Streaming da resposta gRPC concluído.")
+        finally:
+            # Interrompe a chamada se a sessão deixar de consumir os trechos
+            tarefa.cancel()
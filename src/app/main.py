@@ -1,7 +1,6 @@
 # main.py
 
 import streamlit as st
-import asyncio
 import logging
 from auth import AuthManager
 from grpc_client import GRPCClient
@@ -15,6 +14,36 @@ logger.info("Aplicativo Chat X iniciado.")
 # Constantes
 USER_AVATAR = "🧑‍⚕️"
 BOT_AVATAR = "🤖"
+STREAM_CURSOR = "▌"
+
+
+def render_streamed_response(grpc_client: GRPCClient, question: str, placeholder,
+                             user_email: str = "", conversation_id: str = "") -> str:
+    """Exibe a resposta do assistente no placeholder conforme os trechos chegam.
+
+    A chamada usa os canais persistentes do cliente gRPC, sem criar um event loop
+    a cada pergunta.
+
+    Args:
+        grpc_client (GRPCClient): Cliente gRPC utilizado para a consulta.
+        question (str): Pergunta enviada pelo usuário.
+        placeholder: Elemento do Streamlit onde a resposta é renderizada.
+        user_email (str): Usuário cuja cota é consumida no servidor.
+        conversation_id (str): Conversa cujo histórico o servidor usa nos prompts.
+
+    Returns:
+        str: A resposta completa após o término do streaming.
+    """
+    response = ""
+    with st.spinner("Processando..."):
+        stream = grpc_client.ask_question_stream_sync(question, user_email, conversation_id)
+        first_chunk = next(stream, "")
+    response += first_chunk
+    placeholder.markdown(response + STREAM_CURSOR)
+    for chunk in stream:
+        response += chunk
+        placeholder.markdown(response + STREAM_CURSOR)
+    return response
 
 
 def main():
@@ -54,6 +83,7 @@ def main():
                         st.sidebar.success("Registro bem-sucedido!")
                         st.session_state.is_logged_in = True
                         st.session_state.useremail = user_email
+                        st.session_state.thread_key = auth_manager.thread_key
                         logger.info(f"Usuário {user_email} registrado e logado com sucesso.")
                     else:
                         st.sidebar.error("Falha no registro. O e-mail já está registrado?")
@@ -71,6 +101,7 @@ def main():
                         st.sidebar.success("Login bem-sucedido!")
                         st.session_state.is_logged_in = True
                         st.session_state.useremail = user_email
+                        st.session_state.thread_key = auth_manager.thread_key
                         logger.info(f"Usuário {user_email} autenticado e logado com sucesso.")
                     else:
                         st.sidebar.error("Credenciais inválidas. Tente novamente.")
@@ -91,8 +122,10 @@ def main():
         st.sidebar.text(f"Usuário: {st.session_state.useremail}")
         st.sidebar.text(f"Sua cota de prompt é: {message_handler.get_message_limit()}")
 
-        # Carregar e exibir mensagens
-        messages = message_handler.load_user_messages()
+        # Carregar e exibir mensagens (as mais recentes; anteriores sob demanda)
+        messages = message_handler.load_recent_messages()
+        if message_handler.has_older_messages() and st.button("Carregar mensagens anteriores"):
+            messages = message_handler.load_older_messages()
         for message in messages:
             avatar = USER_AVATAR if message["role"] == "user" else BOT_AVATAR
             with st.chat_message(message["role"], avatar=avatar):
@@ -102,26 +135,26 @@ def main():
         user_question = st.chat_input("Como posso te ajudar?")
         if user_question:
             logger.info(f"Usuário {st.session_state.useremail} enviou uma pergunta: {user_question}")
-            # Salvar e exibir a mensagem do usuário
-            message_handler.save_user_message(user_question)
-            messages.append({"role": "user", "content": user_question})
+            # Exibir a mensagem do usuário
             with st.chat_message("user", avatar=USER_AVATAR):
                 st.markdown(user_question)
 
-            # Processar e exibir a resposta do assistente
+            # Processar e exibir a resposta do assistente à medida que é gerada
             with st.chat_message("assistant", avatar=BOT_AVATAR):
                 message_placeholder = st.empty()
-                with st.spinner("Processando..."):
-                    try:
-                        response = asyncio.run(grpc_client.ask_question(user_question))
-                        logger.info(f"Resposta recebida para a pergunta '{user_question}': {response}")
-                    except Exception as e:
-                        response = "Desculpe, ocorreu um erro ao processar sua pergunta."
-                        logger.error(f"Erro ao obter resposta para a pergunta '{user_question}': {e}", exc_info=True)
-                message_handler.save_assistant_message(response)
+                try:
+                    response = render_streamed_response(
+                        grpc_client, user_question, message_placeholder,
+                        st.session_state.useremail, st.session_state.thread_key
+                    )
+                    logger.info(f"Resposta recebida para a pergunta '{user_question}': {response}")
+                except Exception as e:
+                    response = "Desculpe, ocorreu um erro ao processar sua pergunta."
+                    logger.error(f"Erro ao obter resposta para a pergunta '{user_question}': {e}", exc_info=True)
                 message_placeholder.markdown(response)
-                messages.append({"role": "assistant", "content": response})
-                message_handler.update_counter()
+                # Pergunta e resposta gravadas em uma única transação (a cota é
+                # contabilizada pelo servidor gRPC)
+                message_handler.record_turn(user_question, response)
     else:
         st.error("Por favor, faça o login para continuar.")
         logger.info("Acesso negado: usuário não autenticado.")
@@ -1,9 +1,22 @@
 # message_handler.py
 
 import logging
-from authenticate import DatabaseManager, MessageService
-
-MESSAGE_LIMIT = 1000  # Defina o limite de mensagens aqui
+import os
+import threading
+import time
+from authenticate import MessageService, create_storage
+from cache import TTLCache
+from storage import MESSAGE_LIMIT
+
+# Cache de histórico por usuário, compartilhado pelas sessões do processo
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_CACHE_MAX_USERS = int(os.getenv("HISTORY_CACHE_MAX_USERS", "256"))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "3600"))  # inatividade, em segundos
+# Intervalo para conferir no banco gravações feitas por outros processos
+HISTORY_REVALIDATE_SECONDS = float(os.getenv("HISTORY_REVALIDATE_SECONDS", "30"))
+
+history_cache = TTLCache(max_entries=HISTORY_CACHE_MAX_USERS, ttl=HISTORY_CACHE_TTL)
+history_lock = threading.Lock()
 
 class MessageHandler:
     """Gerencia o armazenamento e recuperação de mensagens dos usuários.
@@ -23,8 +36,9 @@ class MessageHandler:
         self.user_email = user_email
         self.logger = logging.getLogger(__name__)
         self.logger.debug(f"MessageHandler inicializado para o usuário {self.user_email}.")
-        self.db_manager = DatabaseManager()
+        self.db_manager = create_storage()
         self.message_service = MessageService(self.db_manager)
+        self.cache_key = (self.db_manager.storage_key, self.user_email)
 
     def get_message_limit(self) -> int:
         """Obtém o número de mensagens restantes que o usuário pode enviar.
@@ -37,7 +51,7 @@ class MessageHandler:
         self.logger.debug(f"Obtendo limite de mensagens para {self.user_email}.")
         try:
             is_below_limit, value = self.db_manager.get_message_limit(self.user_email)
-            remaining = MESSAGE_LIMIT - value
+            remaining = max(MESSAGE_LIMIT - value, 0)
             self.logger.info(f"{self.user_email} tem {remaining} mensagens restantes.")
             return remaining
         except Exception as e:
@@ -72,6 +86,23 @@ class MessageHandler:
         except Exception as e:
             self.logger.error(f"Erro ao salvar mensagem do assistente para {self.user_email}: {e}", exc_info=True)
 
+    def record_turn(self, question: str, answer: str):
+        """Registra um turno completo do chat.
+
+        Salva a pergunta do usuário e a resposta do assistente em uma única
+        transação. A cota é contabilizada pelo servidor gRPC (`quota.QuotaService`)
+        ao receber a pergunta, e por isso não é incrementada aqui.
+
+        Args:
+            question (str): A mensagem do usuário.
+            answer (str): A resposta do assistente.
+        """
+        self.logger.debug(f"Registrando turno para {self.user_email}.")
+        try:
+            self.message_service.record_turn(self.user_email, question, answer, increment=0)
+        except Exception as e:
+            self.logger.error(f"Erro ao registrar turno para {self.user_email}: {e}", exc_info=True)
+
     def update_counter(self):
         """Atualiza o contador de mensagens enviadas pelo usuário.
 
@@ -84,19 +115,96 @@ class MessageHandler:
         except Exception as e:
             self.logger.error(f"Erro ao atualizar contador de mensagens para {self.user_email}: {e}", exc_info=True)
 
-    def load_user_messages(self) -> list:
-        """Carrega todas as mensagens anteriores do usuário.
+    def load_user_messages(self, before_id: int = None, limit: int = None, after_id: int = None) -> list:
+        """Carrega as mensagens anteriores do usuário, em ordem cronológica.
+
+        Recupera as mensagens armazenadas para o usuário específico, paginadas por id:
+        `limit` restringe às mensagens mais recentes, `before_id` às anteriores a uma
+        mensagem já carregada e `after_id` às posteriores.
 
-        Recupera as mensagens armazenadas para o usuário específico.
+        Args:
+            before_id (int, optional): Carrega apenas mensagens com id menor que este.
+            limit (int, optional): Número máximo de mensagens; None carrega todas.
+            after_id (int, optional): Carrega apenas mensagens com id maior que este.
 
         Returns:
-            list: Lista de dicionários contendo as mensagens do usuário e do assistente.
+            list: Lista de dicionários (id, role, content) com as mensagens do usuário e do assistente.
         """
         self.logger.debug(f"Carregando mensagens para {self.user_email}.")
         try:
-            messages = self.message_service.load_messages(self.user_email)
+            messages = self.message_service.load_messages(self.user_email, before_id, limit, after_id)
             self.logger.info(f"{len(messages)} mensagens carregadas para {self.user_email}.")
             return messages
         except Exception as e:
             self.logger.error(f"Erro ao carregar mensagens para {self.user_email}: {e}", exc_info=True)
             return []
+
+    def load_recent_messages(self) -> list:
+        """Retorna o histórico em cache do usuário, buscando apenas mensagens novas.
+
+        Na primeira chamada, carrega a página mais recente do histórico. Nas seguintes,
+        o banco só é consultado se alguma sessão deste processo gravou mensagens do
+        usuário após a última leitura (nesse caso, apenas as linhas com id maior que o
+        último visto são lidas) ou, a cada HISTORY_REVALIDATE_SECONDS, para detectar
+        gravações de outros processos. Sem mudanças, nenhuma leitura é feita.
+
+        Returns:
+            list: Cópia do histórico em cache, em ordem cronológica.
+        """
+        with history_lock:
+            entry = history_cache.get(self.cache_key)
+        if entry is None:
+            return self._load_first_page()
+
+        latest = self.db_manager.known_latest_message_id(self.user_email) or 0
+        revalidate = time.monotonic() - entry["checked_at"] >= HISTORY_REVALIDATE_SECONDS
+        if latest <= entry["last_id"] and revalidate:
+            latest = self.db_manager.get_latest_message_id(self.user_email)
+            entry["checked_at"] = time.monotonic()
+
+        if latest > entry["last_id"]:
+            newer = self.load_user_messages(after_id=entry["last_id"])
+            with history_lock:
+                # Outra sessão pode ter acrescentado as mesmas linhas em paralelo
+                entry["messages"].extend(m for m in newer if m["id"] > entry["last_id"])
+                entry["last_id"] = max(entry["last_id"], latest, *(m["id"] for m in newer))
+            self.logger.debug(f"{len(newer)} mensagens novas acrescentadas ao cache de {self.user_email}.")
+
+        with history_lock:
+            return list(entry["messages"])
+
+    def load_older_messages(self) -> list:
+        """Acrescenta ao cache a página de mensagens anterior à mais antiga carregada.
+
+        Returns:
+            list: Cópia do histórico em cache, em ordem cronológica.
+        """
+        with history_lock:
+            entry = history_cache.get(self.cache_key)
+        if entry is None or not entry["messages"]:
+            return self.load_recent_messages()
+
+        older = self.load_user_messages(before_id=entry["messages"][0]["id"], limit=HISTORY_PAGE_SIZE)
+        with history_lock:
+            oldest_id = entry["messages"][0]["id"]
+            entry["messages"][:0] = [m for m in older if m["id"] < oldest_id]
+            entry["has_more"] = len(older) == HISTORY_PAGE_SIZE
+            return list(entry["messages"])
+
+    def has_older_messages(self) -> bool:
+        """Indica se há mensagens anteriores às carregadas no cache."""
+        with history_lock:
+            entry = history_cache.get(self.cache_key)
+        return bool(entry and entry["has_more"])
+
+    def _load_first_page(self) -> list:
+        messages = self.load_user_messages(limit=HISTORY_PAGE_SIZE)
+        entry = {
+            "messages": messages,
+            "last_id": messages[-1]["id"] if messages else 0,
+            "has_more": len(messages) == HISTORY_PAGE_SIZE,
+            "checked_at": time.monotonic(),
+        }
+        with history_lock:
+            history_cache.set(self.cache_key, entry)
+            return list(messages)
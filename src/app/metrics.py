@@ -0,0 +1,113 @@
+# metrics.py
+
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """Registro em memória de contadores e medidores expostos no formato Prometheus.
+
+    Os valores são identificados pelo nome da métrica e por um conjunto opcional de
+    rótulos (labels). O acesso é protegido por lock, pois o endpoint HTTP de coleta
+    roda em uma thread separada do event loop do servidor.
+    """
+
+    def __init__(self):
+        self._valores: Dict[str, Dict[LabelKey, float]] = {}
+        self._tipos: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _chave(labels: Optional[Dict[str, str]]) -> LabelKey:
+        return tuple(sorted((labels or {}).items()))
+
+    def inc(self, nome: str, valor: float = 1.0, labels: Optional[Dict[str, str]] = None):
+        """Incrementa um contador.
+
+        Args:
+            nome (str): Nome da métrica.
+            valor (float): Valor a ser somado.
+            labels (Optional[Dict[str, str]]): Rótulos da série.
+        """
+        with self._lock:
+            self._tipos.setdefault(nome, "counter")
+            serie = self._valores.setdefault(nome, {})
+            chave = self._chave(labels)
+            serie[chave] = serie.get(chave, 0.0) + valor
+
+    def set(self, nome: str, valor: float, labels: Optional[Dict[str, str]] = None):
+        """Define o valor de um medidor (gauge).
+
+        Args:
+            nome (str): Nome da métrica.
+            valor (float): Valor atual.
+            labels (Optional[Dict[str, str]]): Rótulos da série.
+        """
+        with self._lock:
+            self._tipos.setdefault(nome, "gauge")
+            self._valores.setdefault(nome, {})[self._chave(labels)] = valor
+
+    def get(self, nome: str, labels: Optional[Dict[str, str]] = None) -> float:
+        """Retorna o valor atual de uma série (0 caso não exista)."""
+        with self._lock:
+            return self._valores.get(nome, {}).get(self._chave(labels), 0.0)
+
+    def reset(self):
+        """Remove todas as métricas registradas."""
+        with self._lock:
+            self._valores.clear()
+            self._tipos.clear()
+
+    def render(self) -> str:
+        """Gera o texto de exposição no formato Prometheus."""
+        linhas = []
+        with self._lock:
+            for nome in sorted(self._valores):
+                linhas.append(f"# TYPE {nome} {self._tipos[nome]}")
+                for chave, valor in self._valores[nome].items():
+                    rotulos = ",".join(f'{k}="{v}"' for k, v in chave)
+                    serie = f"{nome}{{{rotulos}}}" if rotulos else nome
+                    linhas.append(f"{serie} {valor:g}")
+        return "\n".join(linhas) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Handler HTTP que responde em /metrics com o conteúdo do registro."""
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        corpo = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, format, *args):
+        logger.debug("Coleta de métricas: " + format, *args)
+
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer:
+    """Inicia o endpoint HTTP /metrics em uma thread daemon.
+
+    Args:
+        port (int): Porta em que o endpoint será exposto.
+
+    Returns:
+        ThreadingHTTPServer: Servidor iniciado (use shutdown() para encerrá-lo).
+    """
+    httpd = ThreadingHTTPServer(("", port), _MetricsHandler)
+    threading.Thread(target=httpd.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Endpoint de métricas disponível em :%d/metrics", port)
+    return httpd
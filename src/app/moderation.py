@@ -0,0 +1,438 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from nemoguardrails import RailsConfig, LLMRails
+
+from blocked_terms import blocked_terms, check_blocked_terms
+from cache import TTLCache
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# =============================================================================
+# Configuração do Nemo Guardrails
+# =============================================================================
+RAILS_CONFIG_PATH = os.getenv("RAILS_CONFIG_PATH", "./config")
+RAILS_POOL_SIZE = int(os.getenv("RAILS_POOL_SIZE", "4"))
+MODERATION_CACHE_MAX_ENTRIES = int(os.getenv("MODERATION_CACHE_MAX_ENTRIES", "4096"))
+MODERATION_CACHE_TTL = float(os.getenv("MODERATION_CACHE_TTL", "3600"))
+MODERATION_CACHE_CHECK_INTERVAL = float(os.getenv("MODERATION_CACHE_CHECK_INTERVAL", "5"))
+OUTPUT_MODERATION_ENABLED = os.getenv("OUTPUT_MODERATION_ENABLED", "true").lower() == "true"
+OUTPUT_MODERATION_WINDOW = int(os.getenv("OUTPUT_MODERATION_WINDOW", "400"))  # caracteres
+OUTPUT_MODERATION_OVERLAP = int(os.getenv("OUTPUT_MODERATION_OVERLAP", "80"))
+
+rails_config = RailsConfig.from_path(RAILS_CONFIG_PATH)
+
+
+# =============================================================================
+# Pool de instâncias LLMRails
+# =============================================================================
+class RailsPool:
+    """
+    Pool de instâncias LLMRails emprestadas com exclusividade a cada moderação.
+
+    `LLMRails.explain()` reflete a última chamada feita na instância; com uma única
+    instância global, requisições concorrentes leem o histórico umas das outras.
+    Cada moderação empresta uma instância do pool, executa `generate_async` e lê
+    `explain()` antes de devolvê-la, garantindo que o veredito corresponda à própria
+    entrada. As instâncias são criadas sob demanda, até `tamanho`; acima disso, as
+    requisições aguardam uma instância livre.
+    """
+
+    def __init__(self, fabrica: Callable[[], LLMRails], tamanho: int = RAILS_POOL_SIZE):
+        """
+        Args:
+            fabrica (Callable[[], LLMRails]): Função que cria uma nova instância.
+            tamanho (int): Número máximo de instâncias.
+        """
+        self._fabrica = fabrica
+        self.tamanho = tamanho
+        self._livres: asyncio.Queue = asyncio.Queue()
+        self._criadas = 0
+
+    def _criar(self) -> LLMRails:
+        # A vaga é reservada antes da criação e devolvida se a fábrica falhar
+        self._criadas += 1
+        try:
+            return self._fabrica()
+        except Exception:
+            self._criadas -= 1
+            raise
+
+    def preencher(self) -> None:
+        """Cria antecipadamente todas as instâncias (útil na inicialização do servidor)."""
+        while self._criadas < self.tamanho:
+            self._livres.put_nowait(self._criar())
+        logger.info("Pool de guardrails preenchido com %d instâncias.", self.tamanho)
+
+    async def _obter(self) -> LLMRails:
+        try:
+            return self._livres.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        if self._criadas < self.tamanho:
+            return self._criar()
+        metrics.inc("chat_x_rails_pool_waits_total")
+        return await self._livres.get()
+
+    @asynccontextmanager
+    async def checkout(self) -> AsyncIterator[LLMRails]:
+        """Empresta uma instância LLMRails exclusiva durante o bloco `async with`."""
+        rails = await self._obter()
+        try:
+            yield rails
+        finally:
+            self._livres.put_nowait(rails)
+
+
+def criar_rails() -> LLMRails:
+    """Cria uma instância LLMRails com as ações locais registradas."""
+    rails = LLMRails(rails_config)
+    rails.register_action(check_blocked_terms, name="check_blocked_terms")
+    return rails
+
+
+rails_pool = RailsPool(criar_rails)
+
+
+# =============================================================================
+# Cache de vereditos de moderação
+# =============================================================================
+class ModerationCache:
+    """
+    Cache LRU + TTL de vereditos de moderação, indexado pelo hash do conteúdo
+    normalizado e pela direção da mensagem (usuário ou bot).
+
+    Os vereditos dependem das regras em `caminho_config` (flows em rails/, prompts.yml
+    e config.yml). A cada `intervalo_verificacao` segundos, a data de modificação e o
+    tamanho desses arquivos são comparados com os da última verificação; se algo
+    mudou, o cache é esvaziado.
+    """
+
+    def __init__(self, caminho_config: str, max_entries: int = 4096, ttl: float = 3600.0,
+                 intervalo_verificacao: float = 5.0,
+                 relogio: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            caminho_config (str): Diretório de configuração do NeMo Guardrails.
+            max_entries (int): Número máximo de vereditos mantidos.
+            ttl (float): Tempo de vida de cada veredito, em segundos.
+            intervalo_verificacao (float): Intervalo mínimo entre verificações dos arquivos.
+            relogio (Callable[[], float]): Fonte de tempo (injetável para testes).
+        """
+        self.caminho_config = caminho_config
+        self.intervalo_verificacao = intervalo_verificacao
+        self._relogio = relogio
+        self._vereditos = TTLCache(max_entries=max_entries, ttl=ttl, relogio=relogio)
+        self._impressao = self._impressao_configuracao()
+        self._proxima_verificacao = relogio() + intervalo_verificacao
+
+    def _impressao_configuracao(self) -> Tuple:
+        arquivos = []
+        for raiz, _, nomes in os.walk(self.caminho_config):
+            for nome in nomes:
+                caminho = os.path.join(raiz, nome)
+                estado = os.stat(caminho)
+                arquivos.append((caminho, estado.st_mtime_ns, estado.st_size))
+        return tuple(sorted(arquivos))
+
+    def configuracao_alterada(self) -> bool:
+        """
+        Verifica (no máximo uma vez por intervalo) se a configuração mudou, esvaziando
+        o cache em caso afirmativo.
+
+        Returns:
+            bool: True se a configuração foi alterada desde a última verificação.
+        """
+        agora = self._relogio()
+        if agora < self._proxima_verificacao:
+            return False
+        self._proxima_verificacao = agora + self.intervalo_verificacao
+        impressao = self._impressao_configuracao()
+        if impressao == self._impressao:
+            return False
+        self._impressao = impressao
+        self._vereditos.clear()
+        metrics.inc("chat_x_moderation_cache_invalidations_total")
+        logger.info("Configuração de guardrails alterada; cache de moderação invalidado.")
+        return True
+
+    @staticmethod
+    def chave(consulta: str, bot: bool) -> str:
+        """Hash do conteúdo normalizado (caixa e espaços) e da direção da mensagem."""
+        normalizada = " ".join(consulta.lower().split())
+        direcao = "bot" if bot else "user"
+        return hashlib.sha256(f"{direcao}\0{normalizada}".encode("utf-8")).hexdigest()
+
+    def get(self, consulta: str, bot: bool) -> Optional[bool]:
+        """Retorna o veredito armazenado (True = aprovado) ou None."""
+        direcao = {"direcao": "bot" if bot else "user"}
+        veredito = self._vereditos.get(self.chave(consulta, bot))
+        if veredito is None:
+            metrics.inc("chat_x_moderation_cache_misses_total", labels=direcao)
+        else:
+            metrics.inc("chat_x_moderation_cache_hits_total", labels=direcao)
+            metrics.inc("chat_x_moderation_llm_calls_avoided_total")
+        self._atualizar_taxa_acerto()
+        return veredito
+
+    def set(self, consulta: str, bot: bool, aprovado: bool) -> None:
+        """Armazena o veredito de uma moderação."""
+        self._vereditos.set(self.chave(consulta, bot), aprovado)
+
+    def clear(self) -> None:
+        """Remove todos os vereditos."""
+        self._vereditos.clear()
+
+    @staticmethod
+    def _atualizar_taxa_acerto() -> None:
+        acertos = sum(metrics.get("chat_x_moderation_cache_hits_total", {"direcao": d})
+                      for d in ("user", "bot"))
+        erros = sum(metrics.get("chat_x_moderation_cache_misses_total", {"direcao": d})
+                    for d in ("user", "bot"))
+        metrics.set("chat_x_moderation_cache_hit_ratio", acertos / ((acertos + erros) or 1))
+
+
+moderation_cache = ModerationCache(
+    RAILS_CONFIG_PATH,
+    max_entries=MODERATION_CACHE_MAX_ENTRIES,
+    ttl=MODERATION_CACHE_TTL,
+    intervalo_verificacao=MODERATION_CACHE_CHECK_INTERVAL,
+)
+
+
+def recarregar_guardrails() -> None:
+    """Recarrega a configuração do NeMo Guardrails, os termos bloqueados e o pool."""
+    global rails_config, rails_pool
+    blocked_terms.recarregar()
+    rails_config = RailsConfig.from_path(RAILS_CONFIG_PATH)
+    rails_pool = RailsPool(criar_rails, tamanho=rails_pool.tamanho)
+    logger.info("Configuração de guardrails recarregada de %s.", RAILS_CONFIG_PATH)
+
+
+# =============================================================================
+# Funções de moderação (Guardrails)
+# =============================================================================
+async def guard_moderation_async(consulta: str, bot: bool, pergunta: str = "") -> bool:
+    """
+    Realiza a verificação de moderação de conteúdo de forma assíncrona.
+
+    Mensagens do usuário passam pelo fluxo completo (rails de entrada). Respostas do bot
+    são enviadas como mensagem 'assistant', após a pergunta, e apenas os rails de saída
+    ('self check output' e termos bloqueados) são executados.
+
+    Args:
+        consulta (str): Conteúdo a ser analisado.
+        bot (bool): Indica se a origem da mensagem é do bot ou do usuário.
+        pergunta (str): Pergunta do usuário que originou a resposta (apenas para o bot).
+
+    Returns:
+        bool: True se a mensagem for aprovada; False caso contrário.
+    """
+    logger.info(
+        "Iniciando moderação (assíncrona). Tipo: %s, Conteúdo: %.50s",
+        "bot" if bot else "user",
+        consulta.replace("\n", " ")[:50],
+    )
+
+    # Primeiro estágio: termos bloqueados são rejeitados localmente, sem chamar o LLM
+    if blocked_terms.contem(consulta):
+        metrics.inc("chat_x_blocked_terms_matches_total", labels={"origem": "prefiltro"})
+        logger.warning("Conteúdo bloqueado pelo pré-filtro de termos.")
+        return False
+
+    if moderation_cache.configuracao_alterada():
+        recarregar_guardrails()
+
+    veredito = moderation_cache.get(consulta, bot)
+    if veredito is not None:
+        logger.info("Veredito de moderação obtido do cache: %s",
+                    "aprovado" if veredito else "bloqueado")
+        return veredito
+
+    async with rails_pool.checkout() as rails:
+        if bot:
+            resultado = await rails.generate_async(
+                messages=[
+                    {"role": "user", "content": pergunta},
+                    {"role": "assistant", "content": consulta},
+                ],
+                options={"rails": ["output"], "log": {"activated_rails": True}},
+            )
+            aprovado = not any(rail.stop for rail in resultado.log.activated_rails)
+        else:
+            await rails.generate_async(
+                messages=[
+                    {
+                        "role": "user",
+                        "content": consulta,
+                    }
+                ]
+            )
+            # Lido antes de devolver a instância: reflete apenas esta chamada
+            aprovado = "bot refuse" not in rails.explain().colang_history
+
+    moderation_cache.set(consulta, bot, aprovado)
+
+    if not aprovado:
+        logger.warning("Conteúdo bloqueado pela moderação.")
+        return False
+
+    logger.info("Conteúdo aprovado pela moderação.")
+    return True
+
+
+def guard_moderation(consulta: str, bot: bool, pergunta: str = "") -> bool:
+    """
+    Função síncrona de moderação de conteúdo, útil para ambientes que não suportam
+    async/await diretamente.
+
+    Args:
+        consulta (str): Conteúdo a ser analisado.
+        bot (bool): Indica se a origem da mensagem é do bot ou do usuário.
+        pergunta (str): Pergunta do usuário que originou a resposta (apenas para o bot).
+
+    Returns:
+        bool: True se a mensagem for aprovada; False caso contrário.
+    """
+    logger.info("Iniciando moderação (síncrona).")
+    return asyncio.run(guard_moderation_async(consulta, bot, pergunta))
+
+
+# =============================================================================
+# Moderação incremental da resposta (streaming)
+# =============================================================================
+class SaidaBloqueadaError(Exception):
+    """Exceção levantada quando a resposta do bot é reprovada durante a geração."""
+
+    def __init__(self, motivo: str):
+        super().__init__(f"Resposta bloqueada pela moderação de saída ({motivo}).")
+        self.motivo = motivo
+
+
+def _inicio_de_palavra(texto: str, posicao: int) -> int:
+    """Avança `posicao` até o início da próxima palavra, se ela cair no meio de uma."""
+    if posicao <= 0:
+        return 0
+    while posicao < len(texto) and not texto[posicao - 1].isspace():
+        posicao += 1
+    return posicao
+
+
+def _fim_da_ultima_palavra_completa(texto: str, inicio: int) -> int:
+    """Posição logo após o último espaço de `texto[inicio:]` (ou `inicio`, se não houver)."""
+    posicao = len(texto)
+    while posicao > inicio and not texto[posicao - 1].isspace():
+        posicao -= 1
+    return posicao
+
+
+class OutputModerator:
+    """
+    Modera a resposta do bot à medida que ela é gerada, sem esperar o texto completo.
+
+    Cada trecho passa primeiro pelo filtro local de termos bloqueados, que roda em
+    microssegundos; a última palavra, possivelmente incompleta, é retida até o
+    próximo trecho para que termos divididos entre tokens também sejam detectados.
+    O texto liberado é agrupado em janelas de `janela` caracteres (com `sobreposicao`
+    caracteres de contexto da janela anterior), moderadas pelo LLM em segundo plano,
+    em paralelo com a geração. Se qualquer verificação reprovar a resposta, a geração
+    é interrompida com `SaidaBloqueadaError`. Ao fim do fluxo, apenas a última janela
+    ainda pode estar pendente: é o único custo adicional no caminho feliz.
+    """
+
+    def __init__(self, moderar: Callable[[str], Awaitable[bool]],
+                 janela: int = OUTPUT_MODERATION_WINDOW,
+                 sobreposicao: int = OUTPUT_MODERATION_OVERLAP):
+        """
+        Args:
+            moderar (Callable[[str], Awaitable[bool]]): Verificação de uma janela de
+                texto pelo LLM (True = aprovada).
+            janela (int): Tamanho mínimo, em caracteres, de cada lote enviado ao LLM.
+            sobreposicao (int): Caracteres da janela anterior repetidos como contexto.
+        """
+        self._moderar = moderar
+        self.janela = janela
+        self.sobreposicao = sobreposicao
+
+    def _verificar_termos(self, texto: str, inicio: int, fim: int) -> None:
+        # Inclui o fim do texto já liberado para detectar termos de várias palavras
+        inicio = _inicio_de_palavra(texto, max(0, inicio - self.sobreposicao))
+        if blocked_terms.contem(texto[inicio:fim]):
+            metrics.inc("chat_x_output_moderation_cutoffs_total", labels={"motivo": "termos"})
+            raise SaidaBloqueadaError("termos")
+
+    def _disparar_janela(self, texto: str, inicio: int, fim: int,
+                         pendentes: Set[asyncio.Task]) -> None:
+        inicio = _inicio_de_palavra(texto, max(0, inicio - self.sobreposicao))
+        metrics.inc("chat_x_output_moderation_windows_total")
+        pendentes.add(asyncio.create_task(self._moderar(texto[inicio:fim])))
+
+    @staticmethod
+    def _verificar_vereditos(pendentes: Set[asyncio.Task]) -> None:
+        for tarefa in [t for t in pendentes if t.done()]:
+            pendentes.discard(tarefa)
+            if not tarefa.result():
+                metrics.inc("chat_x_output_moderation_cutoffs_total", labels={"motivo": "llm"})
+                raise SaidaBloqueadaError("llm")
+
+    async def moderar(self, trechos: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Repassa os trechos da resposta, interrompendo-a se for reprovada.
+
+        Args:
+            trechos (AsyncIterator[str]): Trechos gerados pelo LLM.
+
+        Yields:
+            str: Trechos aprovados pelo filtro local (agrupados em palavras completas).
+
+        Raises:
+            SaidaBloqueadaError: Se o filtro local ou o LLM reprovar a resposta.
+        """
+        texto = ""
+        liberado = 0   # texto[:liberado] já passou pelo filtro local e foi emitido
+        enviado = 0    # texto[:enviado] já foi enviado à moderação pelo LLM
+        pendentes: Set[asyncio.Task] = set()
+        try:
+            async for trecho in trechos:
+                texto += trecho
+                self._verificar_vereditos(pendentes)
+
+                fim = _fim_da_ultima_palavra_completa(texto, liberado)
+                if fim == liberado:
+                    continue
+                self._verificar_termos(texto, liberado, fim)
+                yield texto[liberado:fim]
+                liberado = fim
+
+                if liberado - enviado >= self.janela:
+                    self._disparar_janela(texto, enviado, liberado, pendentes)
+                    enviado = liberado
+
+            if liberado < len(texto):
+                self._verificar_termos(texto, liberado, len(texto))
+                yield texto[liberado:]
+                liberado = len(texto)
+            if enviado < liberado:
+                self._disparar_janela(texto, enviado, liberado, pendentes)
+
+            inicio = time.perf_counter()
+            if pendentes:
+                await asyncio.wait(pendentes)
+            metrics.inc("chat_x_output_moderation_tail_seconds_total",
+                        time.perf_counter() - inicio)
+            self._verificar_vereditos(pendentes)
+        finally:
+            for tarefa in pendentes:
+                tarefa.cancel()
+            await asyncio.gather(*pendentes, return_exceptions=True)
+            if hasattr(trechos, "aclose"):
+                await trechos.aclose()
@@ -0,0 +1,279 @@
+# page_reader.py
+
+import asyncio
+import codecs
+import hashlib
+import json
+import logging
+import os
+import time
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+import httpx
+
+from metrics import metrics
+from search import Resultado
+
+logger = logging.getLogger(__name__)
+
+# Leitura das páginas dos principais resultados em 'handle_web_search' (opcional)
+PAGE_FETCH_ENABLED = os.getenv("PAGE_FETCH_ENABLED", "false").lower() == "true"
+PAGE_FETCH_TOP_K = int(os.getenv("PAGE_FETCH_TOP_K", "3"))
+PAGE_FETCH_TIMEOUT = float(os.getenv("PAGE_FETCH_TIMEOUT", "3"))  # prazo por página, em segundos
+PAGE_FETCH_MAX_BYTES = int(os.getenv("PAGE_FETCH_MAX_BYTES", "1000000"))
+PAGE_FETCH_MAX_CONNECTIONS = int(os.getenv("PAGE_FETCH_MAX_CONNECTIONS", "20"))
+# Texto extraído gravado em disco por URL e revalidado pelo ETag após PAGE_CACHE_FRESH_SECONDS
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", ".cache/pages")
+PAGE_CACHE_FRESH_SECONDS = float(os.getenv("PAGE_CACHE_FRESH_SECONDS", "600"))
+PAGE_PASSAGE_WORDS = int(os.getenv("PAGE_PASSAGE_WORDS", "120"))
+PAGE_MAX_PASSAGES = int(os.getenv("PAGE_MAX_PASSAGES", "30"))  # por página
+
+USER_AGENT = "Mozilla/5.0 (compatible; ChatX/1.0)"
+TIPOS_ACEITOS = ("text/html", "application/xhtml+xml", "text/plain")
+# Parágrafos mais curtos que isso (menus, botões, créditos) são descartados
+MIN_PALAVRAS_PARAGRAFO = 6
+
+
+class ExtratorTexto(HTMLParser):
+    """Extrai título e parágrafos de um HTML recebido em partes (`feed`).
+
+    O conteúdo de scripts, estilos e elementos de navegação é ignorado; elementos
+    de bloco delimitam os parágrafos.
+    """
+
+    IGNORADAS = {"script", "style", "noscript", "svg", "nav", "footer", "header",
+                 "aside", "form", "template", "iframe", "button", "select"}
+    BLOCOS = {"p", "div", "section", "article", "main", "li", "ul", "ol", "br", "tr", "td",
+              "blockquote", "pre", "table", "h1", "h2", "h3", "h4", "h5", "h6", "dd", "dt"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.titulo = ""
+        self.paragrafos: List[str] = []
+        self._atual: List[str] = []
+        self._ignorando = 0
+        self._no_titulo = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.IGNORADAS:
+            self._ignorando += 1
+        elif tag == "title":
+            self._no_titulo = True
+        elif tag in self.BLOCOS:
+            self._encerrar_paragrafo()
+
+    def handle_endtag(self, tag):
+        if tag in self.IGNORADAS:
+            self._ignorando = max(self._ignorando - 1, 0)
+        elif tag == "title":
+            self._no_titulo = False
+        elif tag in self.BLOCOS:
+            self._encerrar_paragrafo()
+
+    def handle_data(self, data):
+        if self._no_titulo:
+            self.titulo += data
+        elif not self._ignorando:
+            self._atual.append(data)
+
+    def _encerrar_paragrafo(self) -> None:
+        paragrafo = " ".join(" ".join(self._atual).split())
+        self._atual = []
+        if len(paragrafo.split()) >= MIN_PALAVRAS_PARAGRAFO:
+            self.paragrafos.append(paragrafo)
+
+    def close(self):
+        super().close()
+        self._encerrar_paragrafo()
+        self.titulo = " ".join(self.titulo.split())
+
+
+def dividir_passagens(paragrafos: List[str], palavras_por_passagem: int = PAGE_PASSAGE_WORDS) -> List[str]:
+    """Agrupa parágrafos consecutivos em passagens de até `palavras_por_passagem` palavras."""
+    passagens: List[str] = []
+    atual: List[str] = []
+    for paragrafo in paragrafos:
+        palavras = paragrafo.split()
+        # Parágrafos longos são divididos em partes do tamanho de uma passagem
+        for inicio in range(0, len(palavras), palavras_por_passagem):
+            parte = palavras[inicio:inicio + palavras_por_passagem]
+            if atual and len(atual) + len(parte) > palavras_por_passagem:
+                passagens.append(" ".join(atual))
+                atual = []
+            atual.extend(parte)
+    if atual:
+        passagens.append(" ".join(atual))
+    return passagens
+
+
+class PageReader:
+    """Leitura concorrente das páginas dos resultados de pesquisa.
+
+    As páginas são baixadas em paralelo por um cliente HTTP assíncrono com pool de
+    conexões, com prazo e limite de bytes por página. O HTML é convertido em texto
+    à medida que chega (sem montar a página inteira em memória) e o texto extraído
+    é gravado em disco, por URL: dentro de `validade_cache` segundos é reaproveitado
+    sem acesso à rede; depois disso, é revalidado com o ETag (If-None-Match).
+    """
+
+    def __init__(self, prazo: float = PAGE_FETCH_TIMEOUT,
+                 max_bytes: int = PAGE_FETCH_MAX_BYTES,
+                 diretorio_cache: Optional[str] = PAGE_CACHE_DIR,
+                 validade_cache: float = PAGE_CACHE_FRESH_SECONDS,
+                 palavras_por_passagem: int = PAGE_PASSAGE_WORDS,
+                 max_passagens: int = PAGE_MAX_PASSAGES,
+                 max_conexoes: int = PAGE_FETCH_MAX_CONNECTIONS):
+        """
+        Args:
+            prazo (float): Tempo máximo, em segundos, para ler cada página.
+            max_bytes (int): Bytes lidos por página; o restante é descartado.
+            diretorio_cache (Optional[str]): Diretório do cache em disco (None desabilita).
+            validade_cache (float): Segundos em que o texto em cache é usado sem revalidação.
+            palavras_por_passagem (int): Tamanho das passagens extraídas.
+            max_passagens (int): Máximo de passagens por página.
+            max_conexoes (int): Conexões simultâneas do pool HTTP.
+        """
+        self.prazo = prazo
+        self.max_bytes = max_bytes
+        self.diretorio_cache = diretorio_cache
+        self.validade_cache = validade_cache
+        self.palavras_por_passagem = palavras_por_passagem
+        self.max_passagens = max_passagens
+        self.max_conexoes = max_conexoes
+        self._cliente: Optional[httpx.AsyncClient] = None
+
+    @property
+    def cliente(self) -> httpx.AsyncClient:
+        # Criado no primeiro uso, dentro do event loop que fará as requisições
+        if self._cliente is None:
+            self._cliente = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_conexoes,
+                                    max_keepalive_connections=self.max_conexoes),
+                timeout=httpx.Timeout(self.prazo),
+                follow_redirects=True,
+                headers={"User-Agent": USER_AGENT},
+            )
+        return self._cliente
+
+    # Cache em disco
+    def _arquivo_cache(self, url: str) -> str:
+        return os.path.join(self.diretorio_cache, hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    def _ler_cache(self, url: str) -> Optional[Dict]:
+        if not self.diretorio_cache:
+            return None
+        try:
+            with open(self._arquivo_cache(url), encoding="utf-8") as arquivo:
+                entrada = json.load(arquivo)
+        except (OSError, ValueError):
+            return None
+        return entrada if entrada.get("url") == url else None
+
+    def _gravar_cache(self, entrada: Dict) -> None:
+        if not self.diretorio_cache:
+            return
+        try:
+            os.makedirs(self.diretorio_cache, exist_ok=True)
+            destino = self._arquivo_cache(entrada["url"])
+            temporario = f"{destino}.{os.getpid()}.tmp"
+            with open(temporario, "w", encoding="utf-8") as arquivo:
+                json.dump(entrada, arquivo, ensure_ascii=False)
+            os.replace(temporario, destino)
+        except OSError as e:
+            logger.warning("Falha ao gravar a página %s no cache: %s", entrada["url"], e)
+
+    # Leitura
+    async def _baixar(self, url: str, em_cache: Optional[Dict]) -> Optional[Dict]:
+        cabecalhos = {}
+        if em_cache and em_cache.get("etag"):
+            cabecalhos["If-None-Match"] = em_cache["etag"]
+        async with self.cliente.stream("GET", url, headers=cabecalhos) as resposta:
+            if resposta.status_code == 304 and em_cache:
+                metrics.inc("chat_x_page_fetch_total", labels={"resultado": "revalidada"})
+                return {**em_cache, "gravado_em": time.time()}
+            resposta.raise_for_status()
+            tipo = resposta.headers.get("content-type", "").split(";")[0].strip().lower()
+            if tipo not in TIPOS_ACEITOS:
+                metrics.inc("chat_x_page_fetch_total", labels={"resultado": "ignorada"})
+                logger.debug("Página %s ignorada (tipo %s).", url, tipo)
+                return None
+            extrator = ExtratorTexto()
+            decodificador = codecs.getincrementaldecoder(resposta.encoding or "utf-8")(errors="replace")
+            lidos = 0
+            async for parte in resposta.aiter_bytes():
+                parte = parte[:self.max_bytes - lidos]
+                lidos += len(parte)
+                extrator.feed(decodificador.decode(parte))
+                if lidos >= self.max_bytes:
+                    metrics.inc("chat_x_page_fetch_truncated_total")
+                    break
+            extrator.feed(decodificador.decode(b"", final=True))
+            extrator.close()
+            metrics.inc("chat_x_page_fetch_bytes_total", lidos)
+            metrics.inc("chat_x_page_fetch_total", labels={"resultado": "baixada"})
+            return {
+                "url": url,
+                "etag": resposta.headers.get("etag", ""),
+                "titulo": extrator.titulo,
+                "paragrafos": extrator.paragrafos,
+                "gravado_em": time.time(),
+            }
+
+    async def ler(self, url: str) -> Optional[Dict]:
+        """
+        Obtém o título e os parágrafos de uma página, do cache em disco ou da rede.
+
+        Args:
+            url (str): Endereço da página.
+
+        Returns:
+            Optional[Dict]: 'url', 'etag', 'titulo' e 'paragrafos' (None se a página
+            não pôde ser lida no prazo ou não é HTML/texto).
+        """
+        em_cache = await asyncio.to_thread(self._ler_cache, url)
+        if em_cache and time.time() - em_cache.get("gravado_em", 0) < self.validade_cache:
+            metrics.inc("chat_x_page_fetch_total", labels={"resultado": "cache"})
+            return em_cache
+        try:
+            pagina = await asyncio.wait_for(self._baixar(url, em_cache), self.prazo)
+        except asyncio.TimeoutError:
+            metrics.inc("chat_x_page_fetch_total", labels={"resultado": "prazo"})
+            logger.warning("Leitura da página %s excedeu %.1fs.", url, self.prazo)
+            return None
+        except (httpx.HTTPError, ValueError) as e:
+            metrics.inc("chat_x_page_fetch_total", labels={"resultado": "erro"})
+            logger.warning("Falha ao ler a página %s: %s", url, e)
+            return None
+        if pagina is not None:
+            await asyncio.to_thread(self._gravar_cache, pagina)
+        return pagina
+
+    async def passagens(self, resultados: List[Resultado]) -> List[Resultado]:
+        """
+        Lê em paralelo as páginas dos resultados e as divide em passagens.
+
+        Args:
+            resultados (List[Resultado]): Resultados cujas páginas serão lidas.
+
+        Returns:
+            List[Resultado]: Passagens no formato dos resultados ('title', 'body',
+            'href'); páginas que não puderam ser lidas não geram passagens.
+        """
+        paginas = await asyncio.gather(*(self.ler(r["href"]) for r in resultados))
+        passagens: List[Resultado] = []
+        for resultado, pagina in zip(resultados, paginas):
+            if not pagina:
+                continue
+            titulo = pagina["titulo"] or resultado["title"]
+            trechos = dividir_passagens(pagina["paragrafos"], self.palavras_por_passagem)
+            for numero, trecho in enumerate(trechos[:self.max_passagens], start=1):
+                passagens.append({"title": f"{titulo} (trecho {numero})", "body": trecho,
+                                  "href": resultado["href"]})
+        return passagens
+
+    async def aclose(self) -> None:
+        """Fecha o cliente HTTP, liberando as conexões do pool."""
+        if self._cliente is not None:
+            await self._cliente.aclose()
+            self._cliente = None
@@ -0,0 +1,383 @@
+# postgres_storage.py
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import streamlit as st
+
+from storage import MESSAGE_LIMIT, ChatStorage
+
+try:
+    import asyncpg
+except ImportError:  # pragma: no cover - dependência opcional
+    asyncpg = None
+
+POSTGRES_POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN_SIZE", "1"))
+POSTGRES_POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", "10"))
+POSTGRES_TIMEOUT = float(os.getenv("POSTGRES_TIMEOUT", "10"))  # segundos por operação
+
+# Mesmas versões de `authenticate.SCHEMA_MIGRATIONS`, no dialeto do PostgreSQL
+SCHEMA_MIGRATIONS: List[Tuple[int, List[str]]] = [
+    (1, [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            useremail TEXT PRIMARY KEY
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS thread_save (
+            useremail TEXT PRIMARY KEY REFERENCES users(useremail),
+            thread_key TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS message_limit (
+            useremail TEXT PRIMARY KEY REFERENCES users(useremail),
+            counter INTEGER DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id BIGSERIAL PRIMARY KEY,
+            useremail TEXT NOT NULL REFERENCES users(useremail),
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMPTZ DEFAULT now()
+        )
+        """,
+    ]),
+    (2, [
+        "CREATE INDEX IF NOT EXISTS idx_messages_useremail_id ON messages (useremail, id)",
+    ]),
+    (3, [
+        "ALTER TABLE thread_save ADD COLUMN IF NOT EXISTS summary TEXT",
+        "ALTER TABLE thread_save ADD COLUMN IF NOT EXISTS summary_message_id BIGINT NOT NULL DEFAULT 0",
+    ]),
+]
+
+
+class PostgresStorage(ChatStorage):
+    """Armazenamento em PostgreSQL com pool de conexões assíncrono (asyncpg).
+
+    O pool e todas as consultas rodam em um event loop dedicado, em uma thread de
+    fundo; os métodos síncronos da interface `ChatStorage` (usados pelo Streamlit)
+    submetem as corrotinas a esse loop e aguardam o resultado. Assim, sessões
+    simultâneas compartilham poucas conexões persistentes sem bloquear umas às outras.
+    """
+
+    def __init__(self, dsn: str, schema: Optional[str] = None,
+                 min_size: int = POSTGRES_POOL_MIN_SIZE, max_size: int = POSTGRES_POOL_MAX_SIZE):
+        """
+        Args:
+            dsn (str): String de conexão do PostgreSQL.
+            schema (Optional[str]): Schema usado no lugar de 'public' (criado se necessário).
+            min_size (int): Conexões mantidas abertas no pool.
+            max_size (int): Número máximo de conexões do pool.
+        """
+        if asyncpg is None:
+            raise ImportError("Instale o pacote 'asyncpg' para usar STORAGE_BACKEND=postgres.")
+        self.dsn = dsn
+        self.schema = schema
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="postgres_storage", daemon=True
+        )
+        self._thread.start()
+        self._pool = self._run(self._create_pool(min_size, max_size))
+        self.initialize_database()
+
+    @property
+    def storage_key(self) -> str:
+        return f"{self.dsn}#{self.schema or 'public'}"
+
+    def _run(self, coro):
+        """Executa uma corrotina no loop do pool e aguarda o resultado.
+
+        Raises:
+            TimeoutError: Se a operação exceder POSTGRES_TIMEOUT. A corrotina é cancelada
+                (liberando a conexão do pool) e, como TimeoutError é um OSError, os
+                métodos do armazenamento a tratam como as demais falhas de conexão.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(POSTGRES_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self.logger.error(f"Operação no PostgreSQL excedeu {POSTGRES_TIMEOUT}s e foi cancelada.")
+            raise TimeoutError(f"Operação no PostgreSQL excedeu {POSTGRES_TIMEOUT}s.") from None
+
+    async def _create_pool(self, min_size: int, max_size: int):
+        if self.schema:
+            conn = await asyncpg.connect(self.dsn)
+            try:
+                await conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{self.schema}"')
+            finally:
+                await conn.close()
+        server_settings = {"search_path": self.schema} if self.schema else None
+        return await asyncpg.create_pool(
+            self.dsn, min_size=min_size, max_size=max_size, server_settings=server_settings
+        )
+
+    def close(self):
+        """Fecha o pool de conexões e encerra o loop de fundo."""
+        self._run(self._pool.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def initialize_database(self):
+        """Aplica as migrações de esquema pendentes, registrando a versão em schema_version."""
+        async def migrate():
+            async with self._pool.acquire() as conn:
+                async with conn.transaction():
+                    # Serializa migrações concorrentes de vários processos
+                    await conn.execute("SELECT pg_advisory_xact_lock(hashtext('chat_x_schema'))")
+                    await conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+                    version = await conn.fetchval("SELECT max(version) FROM schema_version") or 0
+                    for target, queries in SCHEMA_MIGRATIONS:
+                        if target <= version:
+                            continue
+                        for query in queries:
+                            await conn.execute(query)
+                        await conn.execute("INSERT INTO schema_version (version) VALUES ($1)", target)
+                        self.logger.info(f"Migração de esquema aplicada: versão {target}.")
+
+        try:
+            self._run(migrate())
+            self.logger.info("Banco de dados inicializado com sucesso.")
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Falha ao inicializar o banco de dados: {e}")
+            st.error("Erro ao inicializar o banco de dados.")
+
+    # Métodos de Usuário
+    def add_user(self, useremail: str) -> bool:
+        """Adiciona um novo usuário ao banco de dados."""
+        async def insert():
+            await self._pool.execute("INSERT INTO users (useremail) VALUES ($1)", useremail)
+
+        try:
+            self._run(insert())
+            self.logger.info(f"Usuário registrado: {useremail}")
+            return True
+        except asyncpg.UniqueViolationError:
+            self.logger.warning(f"Tentativa de registrar usuário existente: {useremail}")
+            return False
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao registrar usuário {useremail}: {e}")
+            st.error("Erro ao registrar usuário.")
+            return False
+
+    def user_exists(self, useremail: str) -> bool:
+        """Verifica se um usuário existe no banco de dados."""
+        try:
+            return self._run(self._pool.fetchval(
+                "SELECT EXISTS (SELECT 1 FROM users WHERE useremail = $1)", useremail
+            ))
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao verificar existência do usuário {useremail}: {e}")
+            return False
+
+    # Métodos de Thread
+    def get_thread_key(self, useremail: str) -> Optional[str]:
+        """Obtém a chave da thread para um usuário específico."""
+        try:
+            return self._run(self._pool.fetchval(
+                "SELECT thread_key FROM thread_save WHERE useremail = $1", useremail
+            ))
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao obter chave de thread para {useremail}: {e}")
+            return None
+
+    def set_thread_key(self, useremail: str, thread_key: str) -> bool:
+        """Define ou atualiza a chave da thread para um usuário."""
+        try:
+            self._run(self._pool.execute("""
+                INSERT INTO thread_save (useremail, thread_key)
+                VALUES ($1, $2)
+                ON CONFLICT (useremail) DO UPDATE SET thread_key = excluded.thread_key
+            """, useremail, thread_key))
+            self.logger.info(f"Chave de thread atualizada para {useremail}.")
+            return True
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao definir chave de thread para {useremail}: {e}")
+            st.error("Erro ao definir chave da thread.")
+            return False
+
+    def get_thread_summary(self, useremail: str) -> Tuple[str, int]:
+        """Obtém o resumo da thread e o id da última mensagem resumida."""
+        try:
+            row = self._run(self._pool.fetchrow(
+                "SELECT summary, summary_message_id FROM thread_save WHERE useremail = $1",
+                useremail
+            ))
+            if row is None or row["summary"] is None:
+                return "", 0
+            return row["summary"], row["summary_message_id"]
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao obter resumo da thread para {useremail}: {e}")
+            return "", 0
+
+    def set_thread_summary(self, useremail: str, summary: str, message_id: int) -> bool:
+        """Grava o resumo da thread de um usuário (chamado pelo servidor, sem interface)."""
+        try:
+            self._run(self._pool.execute("""
+                INSERT INTO thread_save (useremail, summary, summary_message_id)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (useremail) DO UPDATE SET
+                    summary = excluded.summary, summary_message_id = excluded.summary_message_id
+            """, useremail, summary, message_id))
+            self.logger.debug(f"Resumo da thread atualizado para {useremail} (até {message_id}).")
+            return True
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao gravar resumo da thread para {useremail}: {e}")
+            return False
+
+    # Métodos de Limite de Mensagens
+    def get_message_limit(self, useremail: str) -> Tuple[bool, int]:
+        """Obtém o status do limite de mensagens para um usuário."""
+        try:
+            counter = self._run(self._pool.fetchval(
+                "SELECT counter FROM message_limit WHERE useremail = $1", useremail
+            ))
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao obter limite de mensagens para {useremail}: {e}")
+            return False, 0
+        if counter is None:
+            self.logger.debug(f"Limite de mensagens não inicializado para {useremail}.")
+            return False, 0
+        return counter < MESSAGE_LIMIT, counter
+
+    def initialize_message_limit(self, useremail: str) -> bool:
+        """Inicializa o contador de mensagens para um novo usuário."""
+        try:
+            self._run(self._pool.execute(
+                "INSERT INTO message_limit (useremail, counter) VALUES ($1, 0)", useremail
+            ))
+            self.logger.info(f"Limite de mensagens inicializado para {useremail}.")
+            return True
+        except asyncpg.UniqueViolationError:
+            self.logger.warning(f"Tentativa de inicializar limite de mensagens existente para {useremail}.")
+            return False
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao inicializar limite de mensagens para {useremail}: {e}")
+            st.error("Erro ao inicializar limite de mensagens.")
+            return False
+
+    def update_message_counter(self, useremail: str, increment: int = 1) -> Optional[int]:
+        """Atualiza o contador de mensagens para um usuário."""
+        try:
+            new_counter = self._run(self._pool.fetchval("""
+                UPDATE message_limit SET counter = counter + $1
+                WHERE useremail = $2
+                RETURNING counter
+            """, increment, useremail))
+            self.logger.info(f"Contador de mensagens atualizado para {useremail}: {new_counter}")
+            return new_counter
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao atualizar contador de mensagens para {useremail}: {e}")
+            st.error("Erro ao atualizar contador de mensagens.")
+            return None
+
+    def adjust_message_counters(self, deltas: Dict[str, int]) -> bool:
+        """Aplica em lote, em uma única transação, ajustes aos contadores de mensagens."""
+        if not deltas:
+            return True
+        try:
+            self._run(self._pool.executemany("""
+                UPDATE message_limit SET counter = GREATEST(counter + $1, 0)
+                WHERE useremail = $2
+            """, [(delta, useremail) for useremail, delta in deltas.items()]))
+            self.logger.debug(f"Contadores de mensagens ajustados para {len(deltas)} usuários.")
+            return True
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao ajustar contadores de mensagens: {e}")
+            return False
+
+    # Métodos de Mensagens
+    def save_message(self, useremail: str, role: str, content: str) -> bool:
+        """Salva uma mensagem no banco de dados."""
+        try:
+            message_id = self._run(self._pool.fetchval("""
+                INSERT INTO messages (useremail, role, content)
+                VALUES ($1, $2, $3)
+                RETURNING id
+            """, useremail, role, content))
+            self._record_message_id(useremail, message_id)
+            self.logger.info(f"Mensagem salva para {useremail}: {role} - {content[:50]}...")
+            return True
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao salvar mensagem para {useremail}: {e}")
+            st.error("Erro ao salvar mensagem.")
+            return False
+
+    def record_turn(self, useremail: str, user_message: str, assistant_message: str,
+                    increment: int = 1) -> Optional[int]:
+        """Grava um turno completo (pergunta, resposta e cota) em uma única transação."""
+        async def record():
+            async with self._pool.acquire() as conn:
+                async with conn.transaction():
+                    counter = await conn.fetchval("""
+                        UPDATE message_limit SET counter = counter + $1
+                        WHERE useremail = $2
+                        RETURNING counter
+                    """, increment, useremail)
+                    if counter is None:
+                        return None, None
+                    rows = await conn.fetch("""
+                        INSERT INTO messages (useremail, role, content)
+                        VALUES ($1, 'user', $2), ($1, 'assistant', $3)
+                        RETURNING id
+                    """, useremail, user_message, assistant_message)
+                    return counter, max(row["id"] for row in rows)
+
+        try:
+            counter, message_id = self._run(record())
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao gravar turno para {useremail}: {e}")
+            st.error("Erro ao salvar mensagem.")
+            return None
+        if counter is None:
+            self.logger.warning(f"Limite de mensagens não inicializado para {useremail}.")
+            return None
+        self._record_message_id(useremail, message_id)
+        self.logger.info(f"Turno gravado para {useremail}. Contador: {counter}")
+        return counter
+
+    def load_messages(self, useremail: str, before_id: Optional[int] = None,
+                      limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict]:
+        """Carrega as mensagens de um usuário em ordem cronológica, paginadas por id."""
+        # Parâmetros NULL desativam o filtro correspondente (LIMIT NULL = sem limite)
+        query = """
+            SELECT id, role, content FROM messages
+            WHERE useremail = $1
+              AND ($2::bigint IS NULL OR id < $2)
+              AND ($3::bigint IS NULL OR id > $3)
+            ORDER BY id DESC
+            LIMIT $4
+        """
+        try:
+            rows = self._run(self._pool.fetch(query, useremail, before_id, after_id, limit))
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao carregar mensagens para {useremail}: {e}")
+            return []
+        self.logger.debug(f"{len(rows)} mensagens carregadas para {useremail}.")
+        return [
+            {"id": row["id"], "role": row["role"], "content": row["content"]}
+            for row in reversed(rows)
+        ]
+
+    def get_latest_message_id(self, useremail: str) -> int:
+        """Consulta o id da última mensagem do usuário (0 se não houver mensagens)."""
+        try:
+            latest = self._run(self._pool.fetchval(
+                "SELECT max(id) FROM messages WHERE useremail = $1", useremail
+            )) or 0
+        except (asyncpg.PostgresError, OSError) as e:
+            self.logger.error(f"Erro ao consultar a última mensagem de {useremail}: {e}")
+            return 0
+        self._record_message_id(useremail, latest)
+        return latest
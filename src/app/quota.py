@@ -0,0 +1,332 @@
+# quota.py
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from metrics import metrics
+from storage import MESSAGE_LIMIT, ChatStorage
+
+logger = logging.getLogger(__name__)
+
+QUOTA_ENABLED = os.getenv("QUOTA_ENABLED", "true").lower() == "true"
+# Mensagens devolvidas à cota por hora (0 mantém a cota fixa de MESSAGE_LIMIT)
+QUOTA_REFILL_PER_HOUR = float(os.getenv("QUOTA_REFILL_PER_HOUR", "0"))
+QUOTA_FLUSH_INTERVAL = float(os.getenv("QUOTA_FLUSH_INTERVAL", "2"))  # segundos
+QUOTA_FLUSH_BATCH = int(os.getenv("QUOTA_FLUSH_BATCH", "100"))  # usuários pendentes
+# Baldes sem ajustes pendentes são descartados após o flush (recarregados do banco depois)
+QUOTA_MAX_USERS = int(os.getenv("QUOTA_MAX_USERS", "10000"))
+QUOTA_IDLE_TTL = float(os.getenv("QUOTA_IDLE_TTL", "600"))  # segundos sem uso
+
+
+class TokenBucket:
+    """Balde de fichas de um usuário: `nivel` é a parcela já consumida da cota."""
+
+    __slots__ = ("nivel", "atualizado_em", "pendente")
+
+    def __init__(self, nivel: float, agora: float):
+        self.nivel = nivel
+        self.atualizado_em = agora
+        # Ajuste ainda não gravado no banco (consumo menos recarga)
+        self.pendente = 0.0
+
+
+class QuotaService:
+    """Cota de mensagens por usuário mantida em memória, com gravação em lote.
+
+    Cada usuário possui um balde de fichas (token bucket) com capacidade `limite`,
+    carregado do contador `message_limit.counter` na primeira requisição. As
+    verificações seguintes não acessam o banco: o consumo é acumulado em memória e
+    gravado periodicamente, ou quando `lote_flush` usuários têm ajustes pendentes,
+    em uma única transação (`ChatStorage.adjust_message_counters`).
+
+    Após cada gravação, os baldes sem ajustes pendentes ociosos há mais de
+    `ociosidade` segundos, ou além dos `max_usuarios` usados mais recentemente, são
+    descartados; a próxima requisição do usuário relê o contador do banco.
+
+    Os baldes pertencem a um único processo e não devem ser compartilhados entre
+    réplicas: os ajustes são gravados como incrementos, então o contador no banco
+    permanece correto, mas cada réplica aplica o limite sobre a própria cópia e só
+    percebe o consumo das demais ao recarregar o usuário. Com várias réplicas,
+    encaminhe cada usuário sempre à mesma réplica (afinidade por e-mail) ou reduza
+    `ociosidade` para limitar a defasagem.
+    """
+
+    def __init__(self, limite: int = MESSAGE_LIMIT,
+                 recarga_por_hora: float = QUOTA_REFILL_PER_HOUR,
+                 storage: Optional[ChatStorage] = None,
+                 intervalo_flush: float = QUOTA_FLUSH_INTERVAL,
+                 lote_flush: int = QUOTA_FLUSH_BATCH,
+                 max_usuarios: int = QUOTA_MAX_USERS,
+                 ociosidade: float = QUOTA_IDLE_TTL,
+                 relogio: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            limite (int): Número máximo de mensagens por usuário.
+            recarga_por_hora (float): Mensagens devolvidas à cota por hora.
+            storage (Optional[ChatStorage]): Armazenamento dos contadores; sem ele, a
+                cota fica inativa até `conectar`.
+            intervalo_flush (float): Intervalo, em segundos, entre gravações.
+            lote_flush (int): Usuários pendentes que antecipam a gravação.
+            max_usuarios (int): Baldes mantidos em memória após a gravação.
+            ociosidade (float): Segundos sem uso após os quais um balde gravado é descartado.
+            relogio (Callable[[], float]): Fonte de tempo (injetável para testes).
+        """
+        self.limite = limite
+        self.recarga_por_segundo = recarga_por_hora / 3600.0
+        self.storage = storage
+        self.intervalo_flush = intervalo_flush
+        self.lote_flush = lote_flush
+        self.max_usuarios = max_usuarios
+        self.ociosidade = ociosidade
+        self._relogio = relogio
+        # Ordem de uso (LRU): os baldes usados há mais tempo ficam no início
+        self._baldes: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._sujos: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        # Serializa as gravações: um lote só é retirado após o anterior ser gravado
+        self._flush_lock = threading.Lock()
+        self._tarefa_flush: Optional[asyncio.Task] = None
+        self._flush_antecipado: Optional[asyncio.Task] = None
+
+    @property
+    def ativo(self) -> bool:
+        """Indica se a cota está conectada a um armazenamento."""
+        return self.storage is not None
+
+    def conectar(self, storage: ChatStorage) -> None:
+        """Define o armazenamento dos contadores e ativa a cota."""
+        self.storage = storage
+
+    # -------------------------------------------------------------------------
+    # Verificação (memória)
+    # -------------------------------------------------------------------------
+    def carregado(self, useremail: str) -> bool:
+        """Indica se o balde do usuário já está em memória."""
+        return useremail in self._baldes
+
+    def carregar(self, useremail: str) -> bool:
+        """
+        Lê o contador do usuário no banco e cria seu balde (operação bloqueante).
+
+        Returns:
+            bool: False se o usuário não tiver cota inicializada (não registrado).
+        """
+        if self.carregado(useremail):
+            return True
+        abaixo_do_limite, contador = self.storage.get_message_limit(useremail)
+        # (False, 0) indica contador inexistente (ou erro de leitura)
+        if not abaixo_do_limite and not contador:
+            logger.warning("Cota recusada para usuário não registrado: %s", useremail)
+            return False
+        with self._lock:
+            # Outra requisição pode ter carregado o usuário durante a leitura
+            self._baldes.setdefault(useremail, TokenBucket(float(contador), self._relogio()))
+        metrics.set("chat_x_quota_users", len(self._baldes))
+        return True
+
+    def _usar(self, useremail: str) -> bool:
+        """Marca o balde como usado agora, afastando-o do descarte; False se não carregado."""
+        with self._lock:
+            balde = self._baldes.get(useremail)
+            if balde is None:
+                return False
+            self._baldes.move_to_end(useremail)
+            self._recarregar(balde, self._relogio())
+            return True
+
+    def _recarregar(self, balde: TokenBucket, agora: float) -> None:
+        if self.recarga_por_segundo and balde.nivel > 0:
+            recarga = min(balde.nivel, (agora - balde.atualizado_em) * self.recarga_por_segundo)
+            balde.nivel -= recarga
+            balde.pendente -= recarga
+        balde.atualizado_em = agora
+
+    def consumir(self, useremail: str, custo: int = 1) -> bool:
+        """
+        Consome fichas do balde do usuário, sem acessar o banco.
+
+        Args:
+            useremail (str): E-mail do usuário (já carregado com `carregar`).
+            custo (int): Número de mensagens a contabilizar.
+
+        Returns:
+            bool: True se a cota permitir a mensagem.
+        """
+        with self._lock:
+            balde = self._baldes.get(useremail)
+            if balde is None:
+                return False
+            self._baldes.move_to_end(useremail)
+            self._recarregar(balde, self._relogio())
+            if balde.nivel + custo > self.limite:
+                return False
+            balde.nivel += custo
+            balde.pendente += custo
+            self._sujos[useremail] = balde
+            return True
+
+    def devolver(self, useremail: str, custo: int = 1) -> None:
+        """
+        Devolve à cota mensagens consumidas por uma requisição recusada ou com falha.
+
+        Args:
+            useremail (str): E-mail do usuário.
+            custo (int): Número de mensagens a devolver.
+        """
+        with self._lock:
+            balde = self._baldes.get(useremail)
+            if balde is None:
+                return
+            devolvidas = min(float(custo), balde.nivel)
+            balde.nivel -= devolvidas
+            balde.pendente -= devolvidas
+            self._sujos[useremail] = balde
+        metrics.inc("chat_x_quota_refunds_total")
+
+    def restante(self, useremail: str) -> Optional[int]:
+        """Mensagens ainda disponíveis para o usuário (None se não carregado)."""
+        with self._lock:
+            balde = self._baldes.get(useremail)
+            if balde is None:
+                return None
+            self._recarregar(balde, self._relogio())
+            return max(int(self.limite - balde.nivel), 0)
+
+    # -------------------------------------------------------------------------
+    # Gravação em lote
+    # -------------------------------------------------------------------------
+    def flush(self) -> int:
+        """
+        Grava no banco os ajustes pendentes, em uma única transação (bloqueante).
+
+        Apenas a parte inteira de cada ajuste é gravada; a fração de recarga
+        permanece pendente para o próximo lote.
+
+        Returns:
+            int: Número de usuários gravados.
+        """
+        with self._flush_lock:
+            with self._lock:
+                deltas = {}
+                for useremail, balde in self._sujos.items():
+                    delta = int(balde.pendente)
+                    if delta:
+                        deltas[useremail] = delta
+                        balde.pendente -= delta
+                self._sujos = {u: b for u, b in self._sujos.items() if abs(b.pendente) >= 1}
+            if not deltas:
+                self._descartar_ociosos()
+                return 0
+            inicio = time.perf_counter()
+            if not self.storage.adjust_message_counters(deltas):
+                # Devolve os ajustes para uma nova tentativa no próximo lote
+                with self._lock:
+                    for useremail, delta in deltas.items():
+                        balde = self._baldes[useremail]
+                        balde.pendente += delta
+                        self._sujos[useremail] = balde
+                metrics.inc("chat_x_quota_flush_errors_total")
+                return 0
+            self._descartar_ociosos()
+        metrics.inc("chat_x_quota_flushes_total")
+        metrics.inc("chat_x_quota_flushed_users_total", len(deltas))
+        metrics.set("chat_x_quota_flush_seconds", time.perf_counter() - inicio)
+        logger.debug("Cota gravada para %d usuários.", len(deltas))
+        return len(deltas)
+
+    def _descartar_ociosos(self) -> None:
+        """Descarta os baldes já gravados ociosos ou além de `max_usuarios` (LRU).
+
+        Baldes com ajustes pendentes nunca são descartados; a fração de recarga
+        ainda não gravada (menos de uma mensagem) é perdida junto com o balde.
+        """
+        with self._lock:
+            agora = self._relogio()
+            excedentes = len(self._baldes) - self.max_usuarios
+            descartados = []
+            for useremail, balde in self._baldes.items():
+                if useremail in self._sujos:
+                    continue
+                if excedentes > 0:
+                    excedentes -= 1
+                elif agora - balde.atualizado_em < self.ociosidade:
+                    continue
+                descartados.append(useremail)
+            for useremail in descartados:
+                del self._baldes[useremail]
+            total = len(self._baldes)
+        if descartados:
+            metrics.inc("chat_x_quota_evictions_total", len(descartados))
+            logger.debug("Cota descartada da memória para %d usuários.", len(descartados))
+        metrics.set("chat_x_quota_users", total)
+
+    # -------------------------------------------------------------------------
+    # Integração com o event loop do servidor
+    # -------------------------------------------------------------------------
+    async def autenticar(self, useremail: str) -> bool:
+        """
+        Indica se o e-mail pertence a um usuário registrado, carregando seu balde.
+
+        A leitura inicial do contador roda em uma thread, sem bloquear o event loop.
+
+        Args:
+            useremail (str): E-mail do usuário informado na requisição.
+
+        Returns:
+            bool: False se o e-mail estiver vazio ou não tiver cota inicializada.
+        """
+        if not useremail:
+            return False
+        return self._usar(useremail) or await asyncio.to_thread(self.carregar, useremail)
+
+    async def verificar(self, useremail: str) -> bool:
+        """
+        Verifica e consome a cota de uma mensagem do usuário.
+
+        Após a carga do usuário (ver `autenticar`), as verificações são feitas
+        apenas em memória.
+
+        Args:
+            useremail (str): E-mail do usuário informado na requisição.
+
+        Returns:
+            bool: True se a mensagem puder ser processada.
+        """
+        if not await self.autenticar(useremail):
+            resultado = "nao_registrado"
+        else:
+            resultado = "permitido" if self.consumir(useremail) else "negado"
+        permitido = resultado == "permitido"
+        metrics.inc("chat_x_quota_checks_total", labels={"resultado": resultado})
+        if len(self._sujos) >= self.lote_flush and (
+                self._flush_antecipado is None or self._flush_antecipado.done()):
+            self._flush_antecipado = asyncio.create_task(asyncio.to_thread(self.flush))
+        return permitido
+
+    async def _executar_flush_periodico(self) -> None:
+        while True:
+            await asyncio.sleep(self.intervalo_flush)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error("Falha ao gravar a cota de mensagens: %s", e)
+
+    def iniciar(self) -> None:
+        """Inicia a gravação periódica no event loop corrente."""
+        if self._tarefa_flush is None:
+            self._tarefa_flush = asyncio.create_task(self._executar_flush_periodico())
+
+    async def aclose(self) -> None:
+        """Interrompe a gravação periódica e grava os ajustes pendentes."""
+        for tarefa in (self._tarefa_flush, self._flush_antecipado):
+            if tarefa is not None and not tarefa.done():
+                tarefa.cancel()
+                await asyncio.gather(tarefa, return_exceptions=True)
+        self._tarefa_flush = self._flush_antecipado = None
+        if self.ativo:
+            await asyncio.to_thread(self.flush)
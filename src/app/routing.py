@@ -0,0 +1,207 @@
+# routing.py
+
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+import yaml
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+
+from conversation import contar_tokens
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Arquivo com o modelo e os parâmetros de cada nó do grafo e de cada categoria
+LLM_ROUTES_FILE = os.getenv("LLM_ROUTES_FILE", "./model_routes.yml")
+# Sobrescritas pontuais: LLM_ROUTE_<NÓ OU CATEGORIA>=[provedor/]modelo
+PREFIXO_ENV_ROTA = "LLM_ROUTE_"
+
+# Parâmetros de uma rota: 'provider', 'model', 'temperature', 'max_tokens', 'fallback',
+# mais 'base_url' e 'api_key_env' herdados do provedor
+Rota = Dict[str, Any]
+
+CAMPOS_ROTA = ("provider", "model", "temperature", "max_tokens", "fallback")
+
+
+def chave_rota(no: str, categoria: str = "") -> str:
+    """Nome da rota usado nas métricas: o nó, seguido da categoria quando houver."""
+    return f"{no}:{categoria}" if categoria else no
+
+
+class ModelRouter:
+    """Escolhe o modelo e os parâmetros de cada chamada ao LLM a partir da configuração.
+
+    A rota de um nó é montada em camadas, cada uma sobrescrevendo a anterior:
+    'default', a categoria da consulta ('categories'), o nó do grafo ('nodes') e as
+    variáveis LLM_ROUTE_<NOME>. Os provedores ('providers') definem o endereço de
+    cada endpoint compatível com a API da OpenAI, como um modelo local para as
+    conversas simples.
+
+    Exemplo (model_routes.yml)::
+
+        default: {provider: openai, model: gpt-4o-mini, temperature: 0}
+        providers:
+          local: {base_url: "http://localhost:11434/v1"}
+        categories:
+          simples: {provider: local, model: "llama3.2:3b", fallback: true}
+        nodes:
+          categorize: {max_tokens: 5}
+        prices:
+          gpt-4o-mini: {input: 0.15, output: 0.60}
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, modelo_padrao: str = "gpt-4o-mini"):
+        """
+        Args:
+            config (Optional[Dict[str, Any]]): Conteúdo do arquivo de rotas.
+            modelo_padrao (str): Modelo usado quando a configuração não define 'default'.
+        """
+        config = config or {}
+        self.padrao: Rota = {"provider": "openai", "model": modelo_padrao, "temperature": 0.0,
+                             **(config.get("default") or {})}
+        self.provedores: Dict[str, Dict[str, Any]] = {"openai": {}, **(config.get("providers") or {})}
+        self.categorias: Dict[str, Rota] = config.get("categories") or {}
+        self.nos: Dict[str, Rota] = config.get("nodes") or {}
+        # Preço em USD por milhão de tokens de entrada e de saída, por modelo
+        self.precos: Dict[str, Dict[str, float]] = config.get("prices") or {}
+        for nome, rota in [("default", self.padrao), *self.categorias.items(), *self.nos.items()]:
+            desconhecidos = set(rota) - set(CAMPOS_ROTA)
+            if desconhecidos:
+                raise ValueError(f"Rota '{nome}' com parâmetros desconhecidos: {', '.join(sorted(desconhecidos))}")
+            if rota.get("provider", "openai") not in self.provedores:
+                raise ValueError(f"Rota '{nome}' usa o provedor desconhecido '{rota['provider']}'.")
+
+    @classmethod
+    def from_yaml(cls, caminho: str = LLM_ROUTES_FILE, modelo_padrao: str = "gpt-4o-mini") -> "ModelRouter":
+        """Carrega as rotas de um arquivo YAML; sem o arquivo, todos os nós usam `modelo_padrao`."""
+        if not caminho or not os.path.exists(caminho):
+            logger.info("Arquivo de rotas '%s' não encontrado; usando %s em todos os nós.", caminho, modelo_padrao)
+            return cls(modelo_padrao=modelo_padrao)
+        with open(caminho, encoding="utf-8") as arquivo:
+            config = yaml.safe_load(arquivo) or {}
+        logger.info("Rotas de modelos carregadas de '%s'.", caminho)
+        return cls(config, modelo_padrao=modelo_padrao)
+
+    def _sobrescrita_env(self, nome: str) -> Rota:
+        valor = os.getenv(PREFIXO_ENV_ROTA + nome.upper(), "").strip()
+        if not valor:
+            return {}
+        provedor, _, modelo = valor.partition("/")
+        if modelo and provedor in self.provedores:
+            return {"provider": provedor, "model": modelo}
+        return {"model": valor}
+
+    def resolver(self, no: str, categoria: str = "") -> Rota:
+        """
+        Monta a rota de um nó do grafo.
+
+        Args:
+            no (str): Nome do nó (chave de `ChainRegistry.PROMPTS`).
+            categoria (str): Categoria da consulta ('simples', 'complexa' ou '').
+
+        Returns:
+            Rota: Parâmetros do modelo, incluindo os do provedor.
+        """
+        rota = dict(self.padrao)
+        if categoria:
+            rota.update(self.categorias.get(categoria) or {})
+            rota.update(self._sobrescrita_env(categoria))
+        rota.update(self.nos.get(no) or {})
+        rota.update(self._sobrescrita_env(no))
+        provedor = self.provedores.get(rota["provider"])
+        if provedor is None:
+            raise ValueError(f"Provedor desconhecido '{rota['provider']}' na rota '{chave_rota(no, categoria)}'.")
+        rota.update(provedor)
+        return rota
+
+    def rota_padrao(self) -> Rota:
+        """Rota 'default', usada como reserva das rotas com 'fallback'."""
+        return {**self.padrao, **self.provedores[self.padrao["provider"]]}
+
+    def custo(self, modelo: str, tokens_entrada: int, tokens_saida: int) -> float:
+        """Custo estimado de uma chamada, em USD (0 se o modelo não tiver preço configurado)."""
+        preco = self.precos.get(modelo) or {}
+        return (tokens_entrada * preco.get("input", 0.0) + tokens_saida * preco.get("output", 0.0)) / 1e6
+
+
+class RouteMetricsHandler(BaseCallbackHandler):
+    """Contabiliza, por rota, as chamadas ao LLM: latência, tempo até o primeiro token,
+    tokens de entrada e de saída, custo estimado e erros.
+
+    Os tokens vêm do uso informado pelo provedor; quando ausente (p. ex., endpoints
+    locais sem esse suporte), são estimados com `contar_tokens`.
+    """
+
+    # Executado no event loop, sem passar pelo executor: apenas atualiza contadores
+    run_inline = True
+
+    def __init__(self, rota: str, roteador: Optional[ModelRouter] = None, modelo: str = "desconhecido"):
+        """
+        Args:
+            rota (str): Nome da rota (ver `chave_rota`).
+            roteador (Optional[ModelRouter]): Fonte dos preços por modelo.
+            modelo (str): Modelo registrado quando o provedor não informa o nome.
+        """
+        self.rota = rota
+        self.roteador = roteador
+        self.modelo = modelo
+        self._chamadas: Dict[UUID, Tuple[float, Optional[float], str, int]] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]],
+                            *, run_id: UUID, **kwargs: Any) -> None:
+        parametros = kwargs.get("invocation_params") or {}
+        modelo = parametros.get("model_name") or parametros.get("model") or self.modelo
+        estimativa = sum(contar_tokens(str(m.content)) for lista in messages for m in lista)
+        self._chamadas[run_id] = (time.perf_counter(), None, modelo, estimativa)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        inicio, primeiro, modelo, estimativa = self._chamadas.get(run_id, (None, None, "", 0))
+        if inicio is not None and primeiro is None:
+            self._chamadas[run_id] = (inicio, time.perf_counter() - inicio, modelo, estimativa)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        chamada = self._chamadas.pop(run_id, None)
+        if chamada is None:
+            return
+        inicio, primeiro, modelo, estimativa = chamada
+        labels = {"rota": self.rota, "modelo": modelo}
+        metrics.inc("chat_x_llm_requests_total", labels=labels)
+        metrics.inc("chat_x_llm_seconds_total", time.perf_counter() - inicio, labels=labels)
+        if primeiro is not None:
+            metrics.inc("chat_x_llm_streamed_requests_total", labels=labels)
+            metrics.inc("chat_x_llm_first_token_seconds_total", primeiro, labels=labels)
+
+        entrada, saida = self._uso(response)
+        if entrada is None:
+            entrada = estimativa
+            texto = "".join(g.text for geracoes in response.generations for g in geracoes)
+            saida = contar_tokens(texto)
+            metrics.inc("chat_x_llm_estimated_usage_total", labels=labels)
+        metrics.inc("chat_x_llm_prompt_tokens_total", entrada, labels=labels)
+        metrics.inc("chat_x_llm_completion_tokens_total", saida, labels=labels)
+        if self.roteador is not None:
+            metrics.inc("chat_x_llm_cost_usd_total", self.roteador.custo(modelo, entrada, saida), labels=labels)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        chamada = self._chamadas.pop(run_id, None)
+        modelo = chamada[2] if chamada else self.modelo
+        metrics.inc("chat_x_llm_errors_total", labels={"rota": self.rota, "modelo": modelo})
+        logger.warning("Falha na chamada ao LLM (rota %s, modelo %s): %s", self.rota, modelo, error)
+
+    @staticmethod
+    def _uso(response: LLMResult) -> Tuple[Optional[int], Optional[int]]:
+        """Tokens de entrada e de saída informados pelo provedor, se houver."""
+        for geracoes in response.generations:
+            for geracao in geracoes:
+                uso = getattr(getattr(geracao, "message", None), "usage_metadata", None)
+                if uso:
+                    return uso.get("input_tokens", 0), uso.get("output_tokens", 0)
+        uso = (response.llm_output or {}).get("token_usage") or {}
+        if uso:
+            return uso.get("prompt_tokens", 0), uso.get("completion_tokens", 0)
+        return None, None
@@ -0,0 +1,403 @@
+# search.py
+
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from duckduckgo_search import DDGS
+
+from cache import TTLCache, chave_consulta, normalizar_texto
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Resultados de pesquisa na web reaproveitados entre usuários por SEARCH_CACHE_TTL
+# segundos (0 desabilita o cache; pesquisas simultâneas continuam compartilhadas)
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024"))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "10"))
+
+# Provedores em ordem de prioridade ('duckduckgo', 'offline'); o prazo de cada um
+# pode ser ajustado com SEARCH_<NOME>_TIMEOUT (p. ex., SEARCH_DUCKDUCKGO_TIMEOUT)
+SEARCH_PROVIDERS = os.getenv("SEARCH_PROVIDERS", "duckduckgo")
+SEARCH_PROVIDER_TIMEOUT = float(os.getenv("SEARCH_PROVIDER_TIMEOUT", "5"))
+# Sem resposta do provedor após esse tempo, o próximo é acionado em paralelo
+SEARCH_HEDGE_DELAY = float(os.getenv("SEARCH_HEDGE_DELAY", "1.5"))
+# Threads de cada provedor bloqueante (cliente DuckDuckGo); chamadas abandonadas após
+# o prazo continuam ocupando a thread até terminar
+SEARCH_MAX_WORKERS = int(os.getenv("SEARCH_MAX_WORKERS", "4"))
+SEARCH_OFFLINE_INDEX = os.getenv("SEARCH_OFFLINE_INDEX", "")  # JSONL com title, body e href
+
+# Cada resultado segue o formato do DuckDuckGo: {"title", "body", "href"}
+Resultado = Dict[str, str]
+
+
+class SearchError(Exception):
+    """Exceção levantada quando nenhum provedor de pesquisa conseguiu responder."""
+    pass
+
+
+class ProvedorSaturadoError(Exception):
+    """Exceção levantada quando um provedor bloqueante não tem threads livres."""
+    pass
+
+
+def formatar_resultados(resultados: List[Resultado]) -> str:
+    """Texto com títulos, trechos e URLs dos resultados, usado no prompt."""
+    return "\n---\n".join(
+        "\n".join([item["title"], item["body"], item["href"]]) for item in resultados
+    )
+
+
+# =============================================================================
+# Provedores de pesquisa
+# =============================================================================
+class SearchProvider(ABC):
+    """Interface dos provedores de pesquisa.
+
+    Cada provedor tem um nome (usado em logs, métricas e configuração) e um prazo,
+    em segundos, aplicado por `HedgedSearchProvider` a cada chamada.
+    """
+
+    def __init__(self, nome: str, prazo: float = SEARCH_PROVIDER_TIMEOUT):
+        self.nome = nome
+        self.prazo = prazo
+
+    @property
+    def saturado(self) -> bool:
+        """Indica se uma nova chamada seria recusada por falta de capacidade."""
+        return False
+
+    @abstractmethod
+    async def buscar(self, consulta: str, max_resultados: int = SEARCH_MAX_RESULTS) -> List[Resultado]:
+        """Retorna até `max_resultados` resultados para a consulta."""
+
+
+class ThreadedSearchProvider(SearchProvider):
+    """Adapta uma função de pesquisa bloqueante, executada em um executor dedicado.
+
+    Uma chamada que estoura o prazo não pode ser interrompida: a thread a termina
+    em segundo plano e o resultado é descartado. Para que essas chamadas não formem
+    fila no executor (atrasando as seguintes até também estourarem o prazo), o
+    provedor admite no máximo `max_simultaneas` chamadas em execução, contando as
+    abandonadas; acima disso, recusa a chamada na hora com `ProvedorSaturadoError`.
+    """
+
+    def __init__(self, nome: str, funcao: Callable[[str, int], List[Resultado]],
+                 executor: Optional[Executor] = None, prazo: float = SEARCH_PROVIDER_TIMEOUT,
+                 max_simultaneas: int = SEARCH_MAX_WORKERS):
+        """
+        Args:
+            nome (str): Nome do provedor.
+            funcao (Callable): Função bloqueante (consulta, max_resultados) -> resultados.
+            executor (Optional[Executor]): Executor dedicado, com ao menos `max_simultaneas`
+                threads (None cria um).
+            prazo (float): Prazo de cada chamada, em segundos.
+            max_simultaneas (int): Máximo de chamadas em execução ao mesmo tempo.
+        """
+        super().__init__(nome, prazo)
+        self.funcao = funcao
+        self.max_simultaneas = max(max_simultaneas, 1)
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=self.max_simultaneas, thread_name_prefix=f"search_{nome}"
+        )
+        self._em_execucao = 0
+        self._lock = threading.Lock()
+
+    @property
+    def saturado(self) -> bool:
+        return self._em_execucao >= self.max_simultaneas
+
+    def _liberar(self, futuro: Future) -> None:
+        # Executado quando a thread termina a chamada, mesmo que ela tenha sido abandonada
+        with self._lock:
+            self._em_execucao -= 1
+            metrics.set("chat_x_search_provider_busy_threads", self._em_execucao, labels={"provedor": self.nome})
+
+    async def buscar(self, consulta: str, max_resultados: int = SEARCH_MAX_RESULTS) -> List[Resultado]:
+        with self._lock:
+            if self._em_execucao >= self.max_simultaneas:
+                metrics.inc("chat_x_search_provider_saturated_total", labels={"provedor": self.nome})
+                raise ProvedorSaturadoError(
+                    f"{self.nome}: {self._em_execucao} chamadas em execução (máximo {self.max_simultaneas})."
+                )
+            self._em_execucao += 1
+            metrics.set("chat_x_search_provider_busy_threads", self._em_execucao, labels={"provedor": self.nome})
+        futuro = self.executor.submit(self.funcao, consulta, max_resultados)
+        futuro.add_done_callback(self._liberar)
+        return await asyncio.wrap_future(futuro)
+
+
+def buscar_duckduckgo(consulta: str, max_resultados: int) -> List[Resultado]:
+    """Pesquisa no DuckDuckGo (cliente bloqueante)."""
+    return DDGS().text(consulta, max_results=max_resultados)
+
+
+class DuckDuckGoProvider(ThreadedSearchProvider):
+    """Pesquisa na web pelo cliente `duckduckgo_search`."""
+
+    def __init__(self, executor: Optional[Executor] = None, prazo: float = SEARCH_PROVIDER_TIMEOUT,
+                 max_simultaneas: int = SEARCH_MAX_WORKERS):
+        super().__init__("duckduckgo", buscar_duckduckgo, executor, prazo, max_simultaneas)
+
+
+class OfflineIndexProvider(SearchProvider):
+    """Índice local em memória, para testes e ambientes sem acesso à rede.
+
+    Os documentos são pontuados pela soma do IDF dos termos da consulta que
+    contêm (após `normalizar_texto`), sem nenhuma chamada externa.
+    """
+
+    def __init__(self, documentos: Iterable[Resultado], nome: str = "offline",
+                 prazo: float = SEARCH_PROVIDER_TIMEOUT):
+        """
+        Args:
+            documentos (Iterable[Resultado]): Documentos com 'title', 'body' e 'href'.
+            nome (str): Nome do provedor.
+            prazo (float): Prazo de cada chamada, em segundos.
+        """
+        super().__init__(nome, prazo)
+        self.documentos = list(documentos)
+        self._indice: Dict[str, List[int]] = defaultdict(list)
+        for posicao, documento in enumerate(self.documentos):
+            termos = set(normalizar_texto(f"{documento['title']} {documento['body']}").split())
+            for termo in termos:
+                self._indice[termo].append(posicao)
+
+    @classmethod
+    def from_jsonl(cls, caminho: str, **kwargs) -> "OfflineIndexProvider":
+        """Carrega os documentos de um arquivo JSONL com campos 'title', 'body' e 'href'."""
+        with open(caminho, encoding="utf-8") as arquivo:
+            return cls([json.loads(linha) for linha in arquivo if linha.strip()], **kwargs)
+
+    async def buscar(self, consulta: str, max_resultados: int = SEARCH_MAX_RESULTS) -> List[Resultado]:
+        pontuacoes: Dict[int, float] = defaultdict(float)
+        total = len(self.documentos)
+        for termo in set(normalizar_texto(consulta).split()):
+            posicoes = self._indice.get(termo, ())
+            if not posicoes:
+                continue
+            idf = math.log(1 + total / len(posicoes))
+            for posicao in posicoes:
+                pontuacoes[posicao] += idf
+        melhores = sorted(pontuacoes, key=lambda p: (-pontuacoes[p], p))[:max_resultados]
+        return [self.documentos[p] for p in melhores]
+
+
+class HedgedSearchProvider(SearchProvider):
+    """Combina provedores com prazos, requisições de reserva (hedging) e fallback.
+
+    O primeiro provedor é acionado imediatamente. Se não responder em
+    `atraso_hedge` segundos, o seguinte é acionado em paralelo e vale o primeiro
+    resultado não vazio; se um provedor falhar, estourar o prazo ou não encontrar
+    resultados, o seguinte é acionado na hora. Os demais são cancelados assim que
+    um resultado é obtido. A reserva não é acionada enquanto o próximo provedor
+    estiver saturado (ver `ThreadedSearchProvider`).
+    """
+
+    def __init__(self, provedores: Sequence[SearchProvider],
+                 atraso_hedge: float = SEARCH_HEDGE_DELAY):
+        """
+        Args:
+            provedores (Sequence[SearchProvider]): Provedores em ordem de prioridade.
+            atraso_hedge (float): Espera, em segundos, antes de acionar o próximo provedor.
+        """
+        if not provedores:
+            raise ValueError("É necessário ao menos um provedor de pesquisa.")
+        super().__init__("+".join(p.nome for p in provedores),
+                         max(p.prazo for p in provedores) + atraso_hedge * (len(provedores) - 1))
+        self.provedores = list(provedores)
+        self.atraso_hedge = atraso_hedge
+
+    async def _chamar(self, provedor: SearchProvider, consulta: str,
+                      max_resultados: int) -> List[Resultado]:
+        labels = {"provedor": provedor.nome}
+        inicio = time.perf_counter()
+        try:
+            resultados = await asyncio.wait_for(provedor.buscar(consulta, max_resultados), provedor.prazo)
+        except asyncio.TimeoutError:
+            metrics.inc("chat_x_search_provider_timeouts_total", labels=labels)
+            logger.warning("Provedor de pesquisa %s excedeu o prazo de %.1fs.", provedor.nome, provedor.prazo)
+            raise
+        except Exception as e:
+            metrics.inc("chat_x_search_provider_errors_total", labels=labels)
+            logger.warning("Falha no provedor de pesquisa %s: %s", provedor.nome, e)
+            raise
+        metrics.set("chat_x_search_provider_seconds_last", time.perf_counter() - inicio, labels=labels)
+        return resultados
+
+    async def buscar(self, consulta: str, max_resultados: int = SEARCH_MAX_RESULTS) -> List[Resultado]:
+        restantes = list(self.provedores)
+        pendentes: Dict[asyncio.Task, SearchProvider] = {}
+        falhas: List[str] = []
+        sem_resultados = False
+
+        def acionar() -> None:
+            provedor = restantes.pop(0)
+            pendentes[asyncio.create_task(self._chamar(provedor, consulta, max_resultados))] = provedor
+
+        acionar()
+        try:
+            while pendentes:
+                concluidas, _ = await asyncio.wait(
+                    pendentes, timeout=self.atraso_hedge if restantes else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not concluidas:
+                    if restantes[0].saturado:
+                        # Sem threads livres, a reserva seria recusada: aguarda o provedor em andamento
+                        metrics.inc("chat_x_search_hedges_skipped_total")
+                        continue
+                    # O provedor em andamento está lento: aciona o próximo em paralelo
+                    metrics.inc("chat_x_search_hedges_total")
+                    acionar()
+                    continue
+                for tarefa in concluidas:
+                    provedor = pendentes.pop(tarefa)
+                    if tarefa.exception() is not None:
+                        falhas.append(provedor.nome)
+                    elif tarefa.result():
+                        metrics.inc("chat_x_search_provider_wins_total", labels={"provedor": provedor.nome})
+                        return tarefa.result()
+                    else:
+                        sem_resultados = True
+                if not pendentes and restantes:
+                    acionar()
+        finally:
+            for tarefa in pendentes:
+                tarefa.cancel()
+        if sem_resultados:
+            return []
+        raise SearchError(f"Nenhum provedor de pesquisa respondeu ({', '.join(falhas)}).")
+
+
+def criar_provedor(nomes: str = SEARCH_PROVIDERS, executor: Optional[Executor] = None,
+                   indice_offline: str = SEARCH_OFFLINE_INDEX,
+                   max_simultaneas: int = SEARCH_MAX_WORKERS) -> HedgedSearchProvider:
+    """
+    Cria os provedores configurados, na ordem de prioridade informada.
+
+    Args:
+        nomes (str): Nomes separados por vírgula ('duckduckgo', 'offline').
+        executor (Optional[Executor]): Executor dedicado dos provedores bloqueantes.
+        indice_offline (str): Arquivo JSONL do índice local.
+        max_simultaneas (int): Chamadas simultâneas de cada provedor bloqueante.
+
+    Returns:
+        HedgedSearchProvider: Provedor combinado.
+    """
+    provedores: List[SearchProvider] = []
+    for nome in (n.strip().lower() for n in nomes.split(",") if n.strip()):
+        prazo = float(os.getenv(f"SEARCH_{nome.upper()}_TIMEOUT", str(SEARCH_PROVIDER_TIMEOUT)))
+        if nome == "duckduckgo":
+            provedores.append(DuckDuckGoProvider(executor, prazo, max_simultaneas))
+        elif nome == "offline":
+            if indice_offline:
+                provedores.append(OfflineIndexProvider.from_jsonl(indice_offline, prazo=prazo))
+            else:
+                logger.warning("Provedor 'offline' ignorado: SEARCH_OFFLINE_INDEX não definido.")
+        else:
+            logger.warning("Provedor de pesquisa desconhecido ignorado: %s", nome)
+    if not provedores:
+        provedores.append(DuckDuckGoProvider(executor, max_simultaneas=max_simultaneas))
+    logger.info("Provedores de pesquisa: %s", ", ".join(p.nome for p in provedores))
+    return HedgedSearchProvider(provedores)
+
+
+# =============================================================================
+# Cache e coalescência
+# =============================================================================
+class WebSearchService:
+    """Camada de pesquisa na web com cache TTL e coalescência de requisições.
+
+    A chave é a consulta normalizada (`chave_consulta`). Uma consulta em cache é
+    respondida sem acessar o provedor; consultas idênticas simultâneas aguardam a
+    mesma chamada em andamento (single-flight), de modo que um pico de perguntas
+    iguais gera uma única pesquisa. Falhas não são armazenadas e são repassadas a
+    todas as requisições que aguardavam a chamada.
+    """
+
+    def __init__(self, provedor: SearchProvider,
+                 max_resultados: int = SEARCH_MAX_RESULTS,
+                 ttl: float = SEARCH_CACHE_TTL,
+                 max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            provedor (SearchProvider): Provedor das pesquisas.
+            max_resultados (int): Número máximo de resultados por pesquisa.
+            ttl (float): Tempo de validade, em segundos, dos resultados em cache.
+            max_entries (int): Número máximo de consultas em cache.
+        """
+        self.provedor = provedor
+        self.max_resultados = max_resultados
+        self.ttl = ttl
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._em_andamento: Dict[str, asyncio.Future] = {}
+
+    async def buscar(self, consulta: str) -> List[Resultado]:
+        """
+        Obtém os resultados da pesquisa, do cache, de uma chamada em andamento ou do provedor.
+
+        Args:
+            consulta (str): Termo de pesquisa.
+
+        Returns:
+            List[Resultado]: Resultados com 'title', 'body' e 'href'.
+        """
+        chave = chave_consulta(consulta)
+        em_cache = self._cache.get(chave)
+        if em_cache is not None:
+            metrics.inc("chat_x_search_cache_hits_total")
+            metrics.inc("chat_x_search_upstream_saved_total")
+            logger.debug("Pesquisa em cache: %s", consulta)
+            return em_cache
+
+        chamada = self._em_andamento.get(chave)
+        if chamada is not None:
+            metrics.inc("chat_x_search_coalesced_total")
+            metrics.inc("chat_x_search_upstream_saved_total")
+            logger.debug("Pesquisa coalescida com a chamada em andamento: %s", consulta)
+        else:
+            chamada = asyncio.ensure_future(self._chamar_provedor(consulta))
+            self._em_andamento[chave] = chamada
+            chamada.add_done_callback(lambda c: self._concluir(chave, c))
+            metrics.set("chat_x_search_inflight", len(self._em_andamento))
+        # O cancelamento de uma requisição não interrompe a chamada compartilhada
+        return await asyncio.shield(chamada)
+
+    async def _chamar_provedor(self, consulta: str) -> List[Resultado]:
+        metrics.inc("chat_x_search_upstream_calls_total")
+        return await self.provedor.buscar(consulta, self.max_resultados)
+
+    def _concluir(self, chave: str, chamada: asyncio.Future) -> None:
+        self._em_andamento.pop(chave, None)
+        metrics.set("chat_x_search_inflight", len(self._em_andamento))
+        if chamada.cancelled():
+            return
+        # Consultar a exceção também evita o aviso de exceção não recuperada
+        # quando todas as requisições que aguardavam foram canceladas
+        erro = chamada.exception()
+        if erro is not None:
+            metrics.inc("chat_x_search_errors_total")
+            return
+        if self.ttl > 0:
+            self._cache.set(chave, chamada.result())
+
+    def limpar(self) -> None:
+        """Descarta os resultados em cache."""
+        self._cache.clear()
+
+    async def aclose(self) -> None:
+        """Cancela as pesquisas em andamento."""
+        chamadas = list(self._em_andamento.values())
+        for chamada in chamadas:
+            chamada.cancel()
+        await asyncio.gather(*chamadas, return_exceptions=True)
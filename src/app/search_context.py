@@ -0,0 +1,181 @@
+# search_context.py
+
+import logging
+import math
+import os
+from collections import Counter
+from typing import Callable, List, Optional, Set, Tuple
+
+from cache import normalizar_texto
+from conversation import RETICENCIAS, contar_tokens
+from metrics import metrics
+from search import Resultado, formatar_resultados
+
+logger = logging.getLogger(__name__)
+
+# Contexto de pesquisa enviado ao prompt de 'handle_web_search'
+SEARCH_CONTEXT_ENABLED = os.getenv("SEARCH_CONTEXT_ENABLED", "true").lower() == "true"
+SEARCH_CONTEXT_TOKEN_BUDGET = int(os.getenv("SEARCH_CONTEXT_TOKEN_BUDGET", "800"))
+# Similaridade (Jaccard de trigramas de palavras) a partir da qual trechos são duplicados
+SEARCH_CONTEXT_DEDUP_THRESHOLD = float(os.getenv("SEARCH_CONTEXT_DEDUP_THRESHOLD", "0.6"))
+# Trechos truncados menores que isso são descartados em vez de incluídos pela metade
+SEARCH_CONTEXT_MIN_SNIPPET_TOKENS = int(os.getenv("SEARCH_CONTEXT_MIN_SNIPPET_TOKENS", "30"))
+
+SEPARADOR = "\n---\n"
+
+
+def _termos(resultado: Resultado) -> List[str]:
+    return normalizar_texto(f"{resultado['title']} {resultado['body']}").split()
+
+
+def _trigramas(termos: List[str]) -> Set[Tuple[str, ...]]:
+    if len(termos) < 3:
+        return {tuple(termos)}
+    return {tuple(termos[i:i + 3]) for i in range(len(termos) - 2)}
+
+
+def _jaccard(a: Set, b: Set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _url_canonica(href: str) -> str:
+    url = href.split("#", 1)[0].rstrip("/").lower()
+    for prefixo in ("https://", "http://"):
+        if url.startswith(prefixo):
+            url = url[len(prefixo):]
+    return url[4:] if url.startswith("www.") else url
+
+
+class SearchContextBuilder:
+    """Monta o contexto de pesquisa do prompt a partir dos resultados brutos.
+
+    Etapas, todas locais: descarte de resultados duplicados (mesma URL e título, ou trechos
+    quase idênticos), ordenação por relevância lexical (BM25) em relação à consulta
+    e corte no orçamento de tokens. Resultados sem nenhum termo da consulta são
+    descartados quando há resultados relevantes; o último trecho que cabe apenas em
+    parte é truncado.
+    """
+
+    def __init__(self, orcamento: int = SEARCH_CONTEXT_TOKEN_BUDGET,
+                 limiar_duplicata: float = SEARCH_CONTEXT_DEDUP_THRESHOLD,
+                 min_tokens_trecho: int = SEARCH_CONTEXT_MIN_SNIPPET_TOKENS,
+                 k1: float = 1.5, b: float = 0.75,
+                 contar: Callable[[str], int] = contar_tokens):
+        """
+        Args:
+            orcamento (int): Número máximo de tokens do contexto.
+            limiar_duplicata (float): Similaridade a partir da qual um trecho é duplicado.
+            min_tokens_trecho (int): Tamanho mínimo de um trecho truncado.
+            k1 (float): Saturação da frequência dos termos no BM25.
+            b (float): Normalização pelo tamanho do documento no BM25.
+            contar (Callable[[str], int]): Contador de tokens.
+        """
+        self.orcamento = orcamento
+        self.limiar_duplicata = limiar_duplicata
+        self.min_tokens_trecho = min_tokens_trecho
+        self.k1 = k1
+        self.b = b
+        self._contar = contar
+
+    def deduplicar(self, resultados: List[Resultado]) -> List[Resultado]:
+        """Remove resultados com a mesma URL e título, ou trecho quase idêntico a um anterior.
+
+        O título faz parte da chave para manter passagens distintas de uma mesma
+        página (ver `page_reader.PageReader.passagens`).
+        """
+        unicos: List[Resultado] = []
+        urls: Set[Tuple[str, str]] = set()
+        vistos: List[Set[Tuple[str, ...]]] = []
+        for resultado in resultados:
+            url = _url_canonica(resultado.get("href", ""))
+            chave = (url, normalizar_texto(resultado["title"]))
+            trigramas = _trigramas(normalizar_texto(resultado["body"]).split())
+            if (url and chave in urls) or any(
+                _jaccard(trigramas, outro) >= self.limiar_duplicata for outro in vistos
+            ):
+                continue
+            urls.add(chave)
+            vistos.append(trigramas)
+            unicos.append(resultado)
+        return unicos
+
+    def pontuar(self, consulta: str, resultados: List[Resultado]) -> List[float]:
+        """Pontuação BM25 de cada resultado, usando os próprios resultados como corpus."""
+        documentos = [_termos(r) for r in resultados]
+        if not documentos:
+            return []
+        total = len(documentos)
+        tamanho_medio = sum(len(d) for d in documentos) / total or 1.0
+        frequencia_documentos = Counter(t for d in documentos for t in set(d))
+        termos_consulta = set(normalizar_texto(consulta).split())
+        pontuacoes = []
+        for documento in documentos:
+            frequencias = Counter(documento)
+            pontuacao = 0.0
+            for termo in termos_consulta:
+                tf = frequencias.get(termo, 0)
+                if not tf:
+                    continue
+                df = frequencia_documentos[termo]
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                normalizacao = 1 - self.b + self.b * len(documento) / tamanho_medio
+                pontuacao += idf * tf * (self.k1 + 1) / (tf + self.k1 * normalizacao)
+            pontuacoes.append(pontuacao)
+        return pontuacoes
+
+    def ordenar(self, consulta: str, resultados: List[Resultado]) -> List[Resultado]:
+        """
+        Remove duplicatas e ordena os resultados por relevância para a consulta.
+
+        Resultados sem nenhum termo da consulta são descartados quando há resultados
+        relevantes; caso contrário, a ordem do provedor é mantida.
+        """
+        unicos = self.deduplicar(resultados)
+        pontuacoes = self.pontuar(consulta, unicos)
+        ordem = sorted(range(len(unicos)), key=lambda i: (-pontuacoes[i], i))
+        if any(pontuacoes):
+            ordem = [i for i in ordem if pontuacoes[i] > 0]
+        return [unicos[i] for i in ordem]
+
+    def _truncar(self, resultado: Resultado, disponivel: int) -> Optional[Resultado]:
+        # Título, URL e quebras de linha, mais um token para as reticências do corte
+        fixo = self._contar(f"{resultado['title']}\n\n{resultado['href']}") + 1
+        limite = disponivel - fixo
+        if limite < self.min_tokens_trecho:
+            return None
+        truncar = getattr(self._contar, "truncar", None)
+        corpo = truncar(resultado["body"], limite) if truncar else resultado["body"][:limite * 4] + RETICENCIAS
+        return {**resultado, "body": corpo}
+
+    def construir(self, consulta: str, resultados: List[Resultado]) -> str:
+        """
+        Monta o contexto de pesquisa para o prompt.
+
+        Args:
+            consulta (str): Pergunta do usuário.
+            resultados (List[Resultado]): Resultados da pesquisa, na ordem do provedor.
+
+        Returns:
+            str: Resultados selecionados, formatados como em `formatar_resultados`.
+        """
+        selecionados: List[Resultado] = []
+        usados = 0
+        separador = self._contar(SEPARADOR)
+        for resultado in self.ordenar(consulta, resultados):
+            custo = self._contar(formatar_resultados([resultado])) + (separador if selecionados else 0)
+            if usados + custo <= self.orcamento:
+                selecionados.append(resultado)
+                usados += custo
+                continue
+            truncado = self._truncar(resultado, self.orcamento - usados - (separador if selecionados else 0))
+            if truncado is not None:
+                selecionados.append(truncado)
+            break
+
+        contexto = formatar_resultados(selecionados)
+        metrics.inc("chat_x_search_context_results_dropped_total", len(resultados) - len(selecionados))
+        metrics.set("chat_x_search_context_tokens_last", self._contar(contexto))
+        logger.debug("Contexto de pesquisa: %d de %d resultados.", len(selecionados), len(resultados))
+        return contexto
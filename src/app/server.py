@@ -1,18 +1,49 @@
 import asyncio
 import logging
-from typing import Dict, TypedDict
-
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Tuple, TypedDict
+
+import grpc
+import httpx
 from dotenv import load_dotenv
-from duckduckgo_search import DDGS
 from grpc import aio  # API assíncrona do gRPC
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
 from langchain_core.runnables.graph import MermaidDrawMethod
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
-from nemoguardrails import RailsConfig, LLMRails
 
 import genai_pb2
 import genai_pb2_grpc
+from cache import CATEGORIAS, HashingEmbedder, ResponseCache
+from classifier import NaiveBayesClassifier, QueryPreClassifier
+from conversation import (
+    SUMMARY_ENABLED,
+    SUMMARY_RECENT_TURNS,
+    ConversationStore,
+    ConversationSummarizer,
+    ConversationWindow,
+    contar_tokens,
+)
+from metrics import metrics, start_metrics_server
+from moderation import (
+    OUTPUT_MODERATION_ENABLED,
+    OutputModerator,
+    SaidaBloqueadaError,
+    guard_moderation,
+    guard_moderation_async,
+    rails_pool,
+)
+from quota import QUOTA_ENABLED, QuotaService
+from routing import ModelRouter, Rota, RouteMetricsHandler, chave_rota
+from page_reader import PAGE_FETCH_ENABLED, PAGE_FETCH_TOP_K, PageReader
+from search import SEARCH_MAX_WORKERS, Resultado, WebSearchService, criar_provedor, formatar_resultados
+from search_context import SEARCH_CONTEXT_ENABLED, SearchContextBuilder
 
 # =============================================================================
 # Configuração de Logging
@@ -29,66 +60,88 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 # =============================================================================
-# Configuração do Nemo Guardrails
+# Configuração do cliente LLM (pool de conexões compartilhado)
 # =============================================================================
-rails_config = RailsConfig.from_path("./config")
-rails = LLMRails(rails_config)
-
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
 
 # =============================================================================
-# Funções de moderação (Guardrails)
+# Cache de respostas e métricas
 # =============================================================================
-async def guard_moderation_async(consulta: str, bot: bool) -> bool:
-    """
-    Realiza a verificação de moderação de conteúdo de forma assíncrona.
-
-    Args:
-        consulta (str): Conteúdo a ser analisado.
-        bot (bool): Indica se a origem da mensagem é do bot ou do usuário.
-
-    Returns:
-        bool: True se a mensagem for aprovada; False caso contrário.
-    """
-    logger.info(
-        "Iniciando moderação (assíncrona). Tipo: %s, Conteúdo: %.50s",
-        "bot" if bot else "user",
-        consulta.replace("\n", " ")[:50],
-    )
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_TTL_SIMPLES = float(os.getenv("RESPONSE_CACHE_TTL_SIMPLES", "3600"))
+RESPONSE_CACHE_TTL_COMPLEXA = float(os.getenv("RESPONSE_CACHE_TTL_COMPLEXA", "300"))
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true"
+RESPONSE_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SEMANTIC_THRESHOLD", "0.92"))
+# Consultas informais de até N palavras reaproveitam, em uma conversa, respostas geradas sem histórico
+RESPONSE_CACHE_SELF_CONTAINED_WORDS = int(os.getenv("RESPONSE_CACHE_SELF_CONTAINED_WORDS", "4"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # 0 desabilita o endpoint
+
+response_cache = ResponseCache(
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    ttl_simples=RESPONSE_CACHE_TTL_SIMPLES,
+    ttl_complexa=RESPONSE_CACHE_TTL_COMPLEXA,
+    embedder=HashingEmbedder() if RESPONSE_CACHE_SEMANTIC else None,
+    limiar_semantico=RESPONSE_CACHE_SEMANTIC_THRESHOLD,
+    max_palavras_autocontida=RESPONSE_CACHE_SELF_CONTAINED_WORDS,
+)
 
-    tipo = "bot" if bot else "user"
+# =============================================================================
+# Cota de mensagens por usuário (conectada ao armazenamento em serve())
+# =============================================================================
+quota_service = QuotaService()
 
-    await rails.generate_async(
-        messages=[
-            {
-                "role": tipo,
-                "content": consulta,
-            }
-        ]
+# =============================================================================
+# Histórico das conversas (janela limitada em tokens por conversa); com o resumo
+# incremental, a janela traz o resumo e os últimos SUMMARY_RECENT_TURNS turnos
+# =============================================================================
+if SUMMARY_ENABLED:
+    conversation_summarizer = ConversationSummarizer()
+    conversation_store = ConversationStore(
+        criar_janela=partial(ConversationWindow, max_mensagens_recentes=2 * SUMMARY_RECENT_TURNS),
+        resumidor=conversation_summarizer,
     )
-    info = rails.explain()
-    if "bot refuse" in info.colang_history:
-        logger.warning("Conteúdo bloqueado pela moderação.")
-        return False
+else:
+    conversation_summarizer = None
+    conversation_store = ConversationStore()
 
-    logger.info("Conteúdo aprovado pela moderação.")
-    return True
-
-
-def guard_moderation(consulta: str, bot: bool) -> bool:
-    """
-    Função síncrona de moderação de conteúdo, útil para ambientes que não suportam
-    async/await diretamente.
+# =============================================================================
+# Pré-classificador local (evita a chamada ao LLM em 'categorize')
+# =============================================================================
+CLASSIFIER_ENABLED = os.getenv("CLASSIFIER_ENABLED", "true").lower() == "true"
+CLASSIFIER_MODEL_DATA = os.getenv("CLASSIFIER_MODEL_DATA", "")  # JSONL rotulado (opcional)
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CLASSIFIER_MIN_CONFIDENCE", "0.9"))
 
-    Args:
-        consulta (str): Conteúdo a ser analisado.
-        bot (bool): Indica se a origem da mensagem é do bot ou do usuário.
+pre_classificador = QueryPreClassifier(
+    modelo=NaiveBayesClassifier.from_jsonl(CLASSIFIER_MODEL_DATA) if CLASSIFIER_MODEL_DATA else None,
+    confianca_minima=CLASSIFIER_MIN_CONFIDENCE,
+) if CLASSIFIER_ENABLED else None
 
-    Returns:
-        bool: True se a mensagem for aprovada; False caso contrário.
-    """
-    logger.info("Iniciando moderação (síncrona).")
-    return asyncio.run(guard_moderation_async(consulta, bot))
+# =============================================================================
+# Especulação: moderação em paralelo com o fluxo ('off', 'categorize' ou 'full')
+# =============================================================================
+SPECULATION_MODE = os.getenv("SPECULATION_MODE", "categorize").lower()
 
+# =============================================================================
+# Pesquisa na web: executor dos provedores bloqueantes (cliente DuckDuckGo),
+# provedores configurados (ver `search.criar_provedor`), cache e coalescência
+# =============================================================================
+# Tempo máximo da pesquisa em 'handle_web_search'; excedido, responde sem pesquisa
+SEARCH_LATENCY_BUDGET = float(os.getenv("SEARCH_LATENCY_BUDGET", "8"))
+search_executor = ThreadPoolExecutor(
+    max_workers=SEARCH_MAX_WORKERS, thread_name_prefix="web_search"
+)
+search_service = WebSearchService(
+    criar_provedor(executor=search_executor, max_simultaneas=SEARCH_MAX_WORKERS)
+)
+# Deduplicação, ranking (BM25) e corte dos resultados no orçamento de tokens do prompt
+search_context_builder = SearchContextBuilder() if SEARCH_CONTEXT_ENABLED else None
+# Leitura das páginas dos principais resultados; as melhores passagens entram no
+# contexto no lugar dos trechos (requer o SearchContextBuilder)
+page_reader = PageReader() if PAGE_FETCH_ENABLED and search_context_builder is not None else None
 
 # =============================================================================
 # Definição do estado do fluxo (grafo)
@@ -98,43 +151,275 @@ class State(TypedDict):
     categoria: str
     resposta: str
     history: str
+    prompt_tokens: int
 
 
 # =============================================================================
 # Funções utilitárias
 # =============================================================================
-def web_search(query: str) -> str:
+async def ler_paginas(query: str, resultados: List[Resultado]) -> List[Resultado]:
     """
-    Obtém informações gerais usando DuckDuckGo.
+    Substitui os trechos dos principais resultados pelas passagens de suas páginas.
+
+    Args:
+        query (str): Consulta usada para escolher os PAGE_FETCH_TOP_K resultados.
+        resultados (List[Resultado]): Resultados da pesquisa.
+
+    Returns:
+        List[Resultado]: Passagens das páginas lidas e os demais resultados.
+    """
+    principais = search_context_builder.ordenar(query, resultados)[:PAGE_FETCH_TOP_K]
+    passagens = await page_reader.passagens(principais)
+    lidas = {p["href"] for p in passagens}
+    logger.info("Páginas lidas: %d de %d; %d passagens.", len(lidas), len(principais), len(passagens))
+    return passagens + [r for r in resultados if r["href"] not in lidas]
+
+
+async def web_search_async(query: str) -> str:
+    """
+    Pesquisa na web com os provedores configurados, sem bloquear o event loop.
+
+    Resultados recentes vêm do cache e consultas idênticas simultâneas compartilham
+    uma única pesquisa (ver `WebSearchService`). A espera é limitada a
+    SEARCH_LATENCY_BUDGET segundos: se a pesquisa falhar ou exceder esse tempo, o
+    retorno é vazio e a resposta é gerada sem os resultados. Com PAGE_FETCH_ENABLED,
+    as páginas dos principais resultados são lidas (ver `ler_paginas`). Os
+    resultados são reduzidos aos mais relevantes para a consulta (ver
+    `SearchContextBuilder`).
 
     Args:
         query (str): Termo de pesquisa.
 
     Returns:
-        str: Texto contendo títulos, trechos e URLs dos resultados da busca.
+        str: Texto contendo títulos, trechos e URLs dos resultados ('' sem resultados).
     """
     logger.info("Iniciando pesquisa na web para a query: %s", query)
     try:
-        results = DDGS().text(query, max_results=10)
+        resultados = await asyncio.wait_for(search_service.buscar(query), SEARCH_LATENCY_BUDGET)
+    except asyncio.TimeoutError:
+        metrics.inc("chat_x_search_degraded_total", labels={"motivo": "prazo"})
+        logger.warning("Pesquisa na web excedeu %.1fs; respondendo sem pesquisa.", SEARCH_LATENCY_BUDGET)
+        return ""
     except Exception as e:
+        metrics.inc("chat_x_search_degraded_total", labels={"motivo": "falha"})
         logger.error("Falha ao realizar a pesquisa na web: %s", str(e))
-        # Re-levanta a exceção para que o fluxo principal possa tratar
-        raise
+        return ""
+    logger.info("Pesquisa na web concluída, %d resultados retornados.", len(resultados))
+    if search_context_builder is None:
+        return formatar_resultados(resultados)
+    if page_reader is not None:
+        resultados = await ler_paginas(query, resultados)
+    return search_context_builder.construir(query, resultados)
+
+
+# =============================================================================
+# Prompts dos nós
+# =============================================================================
+PROMPT_CATEGORIZE = """
+    Você deve analisar a seguinte conversa (histórico) e a última pergunta 
+    do usuário para decidir se a consulta é 'simples' ou 'complexa'.
+
+    Histórico da conversa:
+    {history}
+
+    Última consulta do usuário:
+    {query}
+
+    Instrução:
+    - Sempre que for relacionada a ‘dia’, ‘hora’, ‘mês’, ‘ano’, ou termos relacionados a tempo, 
+      responda "complexa".
+    - Se for uma pergunta relacionada aos últimos 2 anos, responda "complexa".
+    - Se for um tema complexo, responda "complexa".
+    - Se for uma simples conversa informal, responda "simples".
+    - Responda APENAS com 'simples' ou 'complexa'.
+    """
+
+PROMPT_HANDLE_TECHNICAL = """
+    Você é um assistente que deve considerar o histórico de conversa abaixo
+    e a nova pergunta do usuário. Forneça a melhor resposta possível para
+    questões consideradas 'simples'.
+
+    Histórico da conversa:
+    {history}
+
+    Pergunta atual:
+    {query}
+
+    Responda de maneira objetiva e clara.
+    """
+
+# Usado no lugar dos resultados quando a pesquisa falha ou excede o orçamento
+SEM_RESULTADOS_PESQUISA = (
+    "Nenhum resultado de pesquisa disponível. Responda com o seu conhecimento e "
+    "avise que a informação pode estar desatualizada."
+)
+
+PROMPT_HANDLE_WEB_SEARCH = """
+    Você obteve as seguintes informações de uma pesquisa na web:
+    {search_content}
+
+    Aqui está o histórico da conversa:
+    {history}
+
+    Com base nisso, responda de forma objetiva a pergunta do usuário:
+    {query}
+    """
+
+PROMPT_SUMMARIZE = """
+    Você mantém o resumo de uma conversa entre um usuário e um assistente.
+
+    Resumo atual:
+    {summary}
+
+    Novas mensagens da conversa:
+    {messages}
+
+    Atualize o resumo incorporando as novas mensagens. Preserve fatos, nomes,
+    preferências e pedidos do usuário que possam ser retomados; omita cumprimentos
+    e repetições. Responda APENAS com o resumo atualizado, de forma concisa.
+    """
+
+
+# =============================================================================
+# Registro de chains (construídas uma única vez)
+# =============================================================================
+class ChainRegistry:
+    """
+    Constrói uma única vez as chains prompt | modelo usadas pelos nós do grafo.
+
+    O modelo e os parâmetros de cada nó (e de cada categoria da consulta) vêm do
+    `ModelRouter`. Todos os modelos de um provedor compartilham o mesmo cliente HTTP
+    com keep-alive, evitando recriar o template, o cliente e a conexão TLS a cada
+    requisição. Cada rota registra latência, tokens e custo das suas chamadas (ver
+    `RouteMetricsHandler`).
+    """
+
+    PROMPTS = {
+        "categorize": PROMPT_CATEGORIZE,
+        "handle_technical": PROMPT_HANDLE_TECHNICAL,
+        "handle_web_search": PROMPT_HANDLE_WEB_SEARCH,
+        "summarize": PROMPT_SUMMARIZE,
+    }
+
+    def __init__(self, llm: Optional[BaseChatModel] = None, roteador: Optional[ModelRouter] = None):
+        """
+        Args:
+            llm (Optional[BaseChatModel]): Modelo único para todas as chains, sem rotas
+                nem contabilização. Se omitido, os modelos de cada rota são criados a
+                partir do roteador.
+            roteador (Optional[ModelRouter]): Rotas de modelos; por padrão, as de
+                LLM_ROUTES_FILE.
+        """
+        self._llm = llm
+        self.roteador = roteador or ModelRouter.from_yaml(modelo_padrao=LLM_MODEL)
+        self._http_clients: Dict[str, httpx.AsyncClient] = {}
+        self._chains: Dict[Tuple[str, str], Runnable] = {}
+
+    def _cliente_http(self, provedor: str) -> httpx.AsyncClient:
+        """Cliente HTTP do provedor, com um pool de conexões configurável."""
+        if provedor not in self._http_clients:
+            self._http_clients[provedor] = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            )
+        return self._http_clients[provedor]
+
+    def _criar_modelo(self, rota: Rota, callbacks: List[BaseCallbackHandler]) -> BaseChatModel:
+        """Cria o ChatOpenAI de uma rota; provedores com 'base_url' são endpoints compatíveis."""
+        parametros = {}
+        if rota.get("base_url"):
+            parametros["base_url"] = rota["base_url"]
+            # Servidores locais costumam dispensar a chave, mas o cliente exige uma
+            parametros["api_key"] = os.getenv(rota.get("api_key_env", ""), "") or "local"
+        else:
+            parametros["stream_usage"] = True
+        return ChatOpenAI(
+            model=rota["model"],
+            temperature=rota.get("temperature", 0),
+            max_tokens=rota.get("max_tokens"),
+            timeout=LLM_TIMEOUT,
+            http_async_client=self._cliente_http(rota["provider"]),
+            callbacks=callbacks,
+            **parametros,
+        )
+
+    def _compilar(self, nome: str, categoria: str) -> Runnable:
+        prompt = ChatPromptTemplate.from_template(self.PROMPTS[nome])
+        if self._llm is not None:
+            return prompt | self._llm
+        chave = chave_rota(nome, categoria)
+        rota = self.roteador.resolver(nome, categoria)
+        padrao = self.roteador.rota_padrao()
+        # Os callbacks ficam no modelo: na chain, substituiriam os do grafo (streaming)
+        modelo = self._criar_modelo(rota, [RouteMetricsHandler(chave, self.roteador, rota["model"])])
+        if rota.get("fallback") and (rota["provider"], rota["model"]) != (padrao["provider"], padrao["model"]):
+            reserva = self._criar_modelo(padrao, [RouteMetricsHandler(chave, self.roteador, padrao["model"])])
+            modelo = modelo.with_fallbacks([reserva])
+        logger.info("Rota %s: %s/%s", chave, rota["provider"], rota["model"])
+        return prompt | modelo
+
+    def build(self) -> None:
+        """Compila as chains de todos os nós, caso ainda não tenham sido compiladas."""
+        if self._chains:
+            return
+        for nome in self.PROMPTS:
+            self._chains[(nome, "")] = self._compilar(nome, "")
+        logger.info("Chains compiladas: %s", ", ".join(self.PROMPTS))
+
+    def get(self, nome: str, categoria: str = "") -> Runnable:
+        """
+        Retorna a chain compilada para o nó informado.
+
+        Args:
+            nome (str): Nome do nó do grafo.
+            categoria (str): Categoria da consulta, para rotas específicas por categoria.
+
+        Returns:
+            Runnable: Chain prompt | modelo pronta para uso.
+        """
+        if not self._chains:
+            self.build()
+        if categoria not in CATEGORIAS and categoria not in self.roteador.categorias:
+            # Resposta inesperada do 'categorize': usa a rota do nó
+            categoria = ""
+        if (nome, categoria) not in self._chains:
+            self._chains[(nome, categoria)] = self._compilar(nome, categoria)
+        return self._chains[(nome, categoria)]
 
-    contexts = "\n---\n".join(
-        [
-            "\n".join([item["title"], item["body"], item["href"]])
-            for item in results
-        ]
+    async def aclose(self) -> None:
+        """Fecha os clientes HTTP dos provedores, liberando as conexões dos pools."""
+        for cliente in self._http_clients.values():
+            await cliente.aclose()
+        self._http_clients.clear()
+
+
+chain_registry = ChainRegistry()
+
+
+async def resumir_conversa(resumo: str, mensagens: str) -> str:
+    """
+    Incorpora novas mensagens ao resumo da conversa (usado por `ConversationSummarizer`).
+
+    Args:
+        resumo (str): Resumo anterior ('' na primeira atualização).
+        mensagens (str): Mensagens ainda não resumidas, já formatadas.
+
+    Returns:
+        str: Resumo atualizado.
+    """
+    resposta = await chain_registry.get("summarize").ainvoke(
+        {"summary": resumo or "(nenhum)", "messages": mensagens}
     )
-    logger.info("Pesquisa na web concluída, %d resultados retornados.", len(results))
-    return contexts
+    return resposta.content.strip()
 
 
 # =============================================================================
 # Funções de nós (para o fluxo da LangGraph)
 # =============================================================================
-def categorize(state: State) -> State:
+async def categorize(state: State) -> State:
     """
     Categoriza a consulta em 'simples' ou 'complexa'.
 
@@ -142,6 +427,9 @@ def categorize(state: State) -> State:
       perguntas de tempo (dia, hora, mês, ano) ou temas que exijam pesquisa mais profunda.
     - Caso contrário, 'simples'.
 
+    O pré-classificador local decide os casos evidentes; o LLM só é chamado quando ele
+    não tem confiança suficiente.
+
     Args:
         state (State): Dicionário que contém os dados atuais do fluxo.
 
@@ -149,76 +437,98 @@ def categorize(state: State) -> State:
         State: Dicionário contendo 'categoria' como 'simples' ou 'complexa'.
     """
     logger.debug("Iniciando categorização. Consulta: %s", state["query"])
-    prompt = ChatPromptTemplate.from_template(
-        """
-        Você deve analisar a seguinte conversa (histórico) e a última pergunta 
-        do usuário para decidir se a consulta é 'simples' ou 'complexa'.
-
-        Histórico da conversa:
-        {history}
-
-        Última consulta do usuário:
-        {query}
-
-        Instrução:
-        - Sempre que for relacionada a ‘dia’, ‘hora’, ‘mês’, ‘ano’, ou termos relacionados a tempo, 
-          responda "complexa".
-        - Se for uma pergunta relacionada aos últimos 2 anos, responda "complexa".
-        - Se for um tema complexo, responda "complexa".
-        - Se for uma simples conversa informal, responda "simples".
-        - Responda APENAS com 'simples' ou 'complexa'.
-        """
-    )
-    chain = prompt | ChatOpenAI(temperature=0, model="gpt-4o-mini")
-    categoria = chain.invoke(
-        {
-            "history": state["history"],
-            "query": state["query"]
-        }
-    ).content.strip().lower()
+    if state.get("categoria"):
+        # Categoria já calculada em paralelo com a moderação
+        return {"categoria": state["categoria"]}
+
+    if pre_classificador is not None:
+        categoria, fonte = pre_classificador.classificar(state["query"])
+        if categoria is not None:
+            registrar_categorizacao(fonte)
+            logger.debug("Categoria definida localmente (%s) como: %s", fonte, categoria)
+            return {"categoria": categoria}
+
+    chain = chain_registry.get("categorize")
+    variaveis = {
+        "history": state["history"],
+        "query": state["query"]
+    }
+    inicio = time.perf_counter()
+    categoria = (await chain.ainvoke(variaveis)).content.strip().lower()
+    registrar_categorizacao("llm", time.perf_counter() - inicio)
 
     logger.debug("Categoria definida como: %s", categoria)
-    return {"categoria": categoria}
+    return {
+        "categoria": categoria,
+        "prompt_tokens": state.get("prompt_tokens", 0) + contar_tokens_prompt("categorize", variaveis),
+    }
 
 
-def handle_technical(state: State) -> State:
+def contar_tokens_prompt(no: str, variaveis: Dict[str, str]) -> int:
     """
-    Fornece uma resposta para consultas 'simples', considerando o histórico.
+    Conta os tokens do prompt enviado ao LLM por um nó do grafo.
 
     Args:
-        state (State): Dicionário com dados do estado, incluindo histórico e consulta.
+        no (str): Nome do nó (chave de `ChainRegistry.PROMPTS`).
+        variaveis (Dict[str, str]): Variáveis usadas no template do nó.
 
     Returns:
-        State: Dicionário contendo a resposta gerada.
+        int: Número de tokens do prompt.
     """
-    logger.debug("Iniciando manuseio 'simples'. Consulta: %s", state["query"])
-    prompt = ChatPromptTemplate.from_template(
-        """
-        Você é um assistente que deve considerar o histórico de conversa abaixo
-        e a nova pergunta do usuário. Forneça a melhor resposta possível para
-        questões consideradas 'simples'.
+    return contar_tokens(ChainRegistry.PROMPTS[no].format(**variaveis))
 
-        Histórico da conversa:
-        {history}
 
-        Pergunta atual:
-        {query}
+def registrar_categorizacao(fonte: str, duracao: float = 0.0) -> None:
+    """
+    Atualiza as métricas de categorização: decisões por origem, fração resolvida sem
+    o LLM e latência economizada (estimada pela latência média das chamadas ao LLM).
 
-        Responda de maneira objetiva e clara.
-        """
+    Args:
+        fonte (str): Origem da decisão ('regras', 'modelo' ou 'llm').
+        duracao (float): Duração da chamada ao LLM, em segundos (apenas para 'llm').
+    """
+    metrics.inc("chat_x_categorize_decisions_total", labels={"fonte": fonte})
+    if fonte == "llm":
+        metrics.inc("chat_x_categorize_llm_seconds_total", duracao)
+    else:
+        chamadas_llm = metrics.get("chat_x_categorize_decisions_total", {"fonte": "llm"})
+        if chamadas_llm:
+            media = metrics.get("chat_x_categorize_llm_seconds_total") / chamadas_llm
+            metrics.inc("chat_x_categorize_latency_saved_seconds_total", media)
+
+    locais = sum(
+        metrics.get("chat_x_categorize_decisions_total", {"fonte": f})
+        for f in ("regras", "modelo")
     )
-    chain = prompt | ChatOpenAI(temperature=0, model="gpt-4o-mini")
-    resposta = chain.invoke(
-        {
-            "history": state["history"],
-            "query": state["query"]
-        }
-    ).content
+    total = locais + metrics.get("chat_x_categorize_decisions_total", {"fonte": "llm"})
+    metrics.set("chat_x_categorize_short_circuit_ratio", locais / total)
+
+
+async def handle_technical(state: State) -> State:
+    """
+    Fornece uma resposta para consultas 'simples', considerando o histórico.
+
+    Args:
+        state (State): Dicionário com dados do estado, incluindo histórico e consulta.
+
+    Returns:
+        State: Dicionário contendo a resposta gerada.
+    """
+    logger.debug("Iniciando manuseio 'simples'. Consulta: %s", state["query"])
+    chain = chain_registry.get("handle_technical", state.get("categoria", ""))
+    variaveis = {
+        "history": state["history"],
+        "query": state["query"]
+    }
+    resposta = (await chain.ainvoke(variaveis)).content
     logger.debug("Resposta (simples) gerada com sucesso.")
-    return {"resposta": resposta}
+    return {
+        "resposta": resposta,
+        "prompt_tokens": state.get("prompt_tokens", 0) + contar_tokens_prompt("handle_technical", variaveis),
+    }
 
 
-def handle_web_search(state: State) -> State:
+async def handle_web_search(state: State) -> State:
     """
     Node responsável por buscar informações na web e gerar uma resposta usando o LLM
     para questões consideradas 'complexas'.
@@ -230,29 +540,19 @@ def handle_web_search(state: State) -> State:
         State: Dicionário contendo a resposta gerada.
     """
     logger.debug("Iniciando manuseio 'complexo'. Consulta: %s", state["query"])
-    search_content = web_search(state["query"])
-    prompt = ChatPromptTemplate.from_template(
-        """
-        Você obteve as seguintes informações de uma pesquisa na web:
-        {search_content}
-
-        Aqui está o histórico da conversa:
-        {history}
-
-        Com base nisso, responda de forma objetiva a pergunta do usuário:
-        {query}
-        """
-    )
-    chain = prompt | ChatOpenAI(temperature=0, model="gpt-4o-mini")
-    resposta = chain.invoke(
-        {
-            "search_content": search_content,
-            "history": state["history"],
-            "query": state["query"]
-        }
-    ).content
+    search_content = await web_search_async(state["query"]) or SEM_RESULTADOS_PESQUISA
+    chain = chain_registry.get("handle_web_search", state.get("categoria", ""))
+    variaveis = {
+        "search_content": search_content,
+        "history": state["history"],
+        "query": state["query"]
+    }
+    resposta = (await chain.ainvoke(variaveis)).content
     logger.debug("Resposta (complexa) gerada com sucesso.")
-    return {"resposta": resposta}
+    return {
+        "resposta": resposta,
+        "prompt_tokens": state.get("prompt_tokens", 0) + contar_tokens_prompt("handle_web_search", variaveis),
+    }
 
 
 def route_query(state: State) -> str:
@@ -303,34 +603,170 @@ workflow.set_entry_point("categorize")
 app = workflow.compile()
 
 # (Opcional) Desenha a estrutura do grafo como imagem
-app.get_graph().draw_mermaid_png(draw_method=MermaidDrawMethod.API)
+try:
+    app.get_graph().draw_mermaid_png(draw_method=MermaidDrawMethod.API)
+except Exception as e:
+    # O desenho depende de uma API externa e não deve impedir a inicialização
+    logger.warning("Não foi possível desenhar o grafo: %s", str(e))
+
+# Nós cuja saída do LLM corresponde à resposta final enviada ao usuário
+NOS_DE_RESPOSTA = ("handle_technical", "handle_web_search")
 
 
 # =============================================================================
 # Função de execução do suporte ao cliente
 # =============================================================================
-def executar_suporte_ao_cliente(consulta: str) -> Dict[str, str]:
+class ConteudoBloqueadoError(Exception):
+    """Exceção levantada quando a moderação reprova a pergunta do usuário."""
+    pass
+
+
+def montar_estado_inicial(consulta: str, categoria: str = "", historico: str = "") -> State:
     """
-    Processa a consulta do cliente através do fluxo de trabalho LangGraph.
+    Monta o estado inicial do fluxo LangGraph para uma consulta.
 
     Args:
         consulta (str): Consulta realizada pelo usuário.
+        categoria (str): Categoria já conhecida (p. ex., calculada especulativamente).
+        historico (str): Janela de histórico da conversa (ver `ConversationStore`).
 
     Returns:
-        Dict[str, str]: Dicionário contendo a categoria e a resposta final.
+        State: Estado inicial com a consulta, o histórico e os demais campos vazios.
     """
-    logger.info("Executando fluxo de suporte ao cliente para consulta: %.50s",
-                consulta.replace("\n", " ")[:50])
-
-    history_str = ""  # Pode ser preenchido com um histórico real, se disponível
-    input_data = {
+    return {
         "query": consulta,
-        "categoria": "",
+        "categoria": categoria,
         "resposta": "",
-        "history": history_str,
+        "history": historico,
+        "prompt_tokens": 0,
     }
 
-    resultados = app.invoke(input_data)
+
+async def aguardar_aprovacao(moderacao: Optional[asyncio.Task]) -> None:
+    """
+    Aguarda o veredito de uma moderação em andamento.
+
+    Args:
+        moderacao (Optional[asyncio.Task]): Tarefa de moderação; None dispensa a espera.
+
+    Raises:
+        ConteudoBloqueadoError: Se a moderação reprovar a pergunta.
+    """
+    if moderacao is not None and not await moderacao:
+        raise ConteudoBloqueadoError()
+
+
+async def preparar_estado(consulta: str, moderacao: Optional[asyncio.Task],
+                          historico: str = "") -> State:
+    """
+    Monta o estado inicial, categorizando a consulta em paralelo com a moderação
+    quando a especulação está no modo 'categorize'.
+
+    Args:
+        consulta (str): Consulta realizada pelo usuário.
+        moderacao (Optional[asyncio.Task]): Tarefa de moderação em andamento.
+        historico (str): Janela de histórico da conversa.
+
+    Returns:
+        State: Estado inicial, com a categoria preenchida quando já calculada.
+    """
+    estado = montar_estado_inicial(consulta, historico=historico)
+    if moderacao is not None and SPECULATION_MODE == "categorize":
+        estado.update(await categorize(estado))
+        # A geração da resposta só começa após a aprovação
+        await aguardar_aprovacao(moderacao)
+    return estado
+
+
+async def moderar_saida(texto: str, pergunta: str = "") -> bool:
+    """Modera uma janela da resposta do bot à `pergunta` (usada por `OutputModerator`)."""
+    return await guard_moderation_async(texto, bot=True, pergunta=pergunta)
+
+
+async def gerar_resposta(
+    consulta: str, moderacao: Optional[asyncio.Task], resultados: Dict[str, str],
+    historico: str = ""
+) -> AsyncIterator[str]:
+    """
+    Executa o fluxo LangGraph, emitindo os tokens dos nós de resposta
+    ('handle_technical' e 'handle_web_search') já moderados incrementalmente.
+
+    Args:
+        consulta (str): Consulta realizada pelo usuário.
+        moderacao (Optional[asyncio.Task]): Moderação da pergunta em andamento.
+        resultados (Dict[str, str]): Preenchido com o estado final do fluxo
+            (categoria, resposta e tokens dos prompts).
+        historico (str): Janela de histórico da conversa.
+
+    Yields:
+        str: Trechos da resposta na ordem em que são gerados pelo LLM.
+
+    Raises:
+        SaidaBloqueadaError: Se a moderação de saída reprovar a resposta.
+    """
+    async def tokens() -> AsyncIterator[str]:
+        async for modo, evento in app.astream(
+            await preparar_estado(consulta, moderacao, historico), stream_mode=["messages", "updates"]
+        ):
+            if modo == "updates":
+                # Atualizações de estado ao fim de cada nó: {nó: {campo: valor}}
+                for atualizacao in evento.values():
+                    resultados.update(atualizacao or {})
+                continue
+            mensagem, metadata = evento
+            if metadata.get("langgraph_node") not in NOS_DE_RESPOSTA:
+                continue
+            if mensagem.content:
+                yield mensagem.content
+
+    if not OUTPUT_MODERATION_ENABLED:
+        async for trecho in tokens():
+            yield trecho
+        return
+    async for trecho in OutputModerator(partial(moderar_saida, pergunta=consulta)).moderar(tokens()):
+        yield trecho
+
+
+async def executar_suporte_ao_cliente(
+    consulta: str, moderacao: Optional[asyncio.Task] = None, historico: str = "",
+    resultados: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """
+    Processa a consulta do cliente através do fluxo de trabalho LangGraph, de forma
+    assíncrona, sem bloquear o event loop do servidor gRPC.
+
+    Consultas repetidas são respondidas pelo cache de respostas, sem executar o fluxo.
+    Com histórico, o cache considera a janela da conversa (ver `ResponseCache`).
+    A resposta é moderada em janelas durante a geração (ver `OutputModerator`).
+
+    Args:
+        consulta (str): Consulta realizada pelo usuário.
+        moderacao (Optional[asyncio.Task]): Moderação executada em paralelo. Quando
+            informada, nenhuma resposta é devolvida ou armazenada antes da aprovação.
+        historico (str): Janela de histórico da conversa.
+        resultados (Optional[Dict[str, str]]): Preenchido com o estado final do fluxo
+            (inclusive os tokens dos prompts, em 'prompt_tokens').
+
+    Returns:
+        Dict[str, str]: Dicionário contendo a categoria e a resposta final.
+
+    Raises:
+        SaidaBloqueadaError: Se a moderação de saída reprovar a resposta.
+    """
+    logger.info("Executando fluxo de suporte ao cliente para consulta: %.50s",
+                consulta.replace("\n", " ")[:50])
+
+    em_cache = await response_cache.aget(consulta, historico=historico)
+    if em_cache is not None:
+        logger.info("Resposta obtida do cache. Categoria: %s", em_cache["categoria"])
+        await aguardar_aprovacao(moderacao)
+        return em_cache
+
+    resultados = {} if resultados is None else resultados
+    async for _ in gerar_resposta(consulta, moderacao, resultados, historico):
+        pass
+    await aguardar_aprovacao(moderacao)
+    response_cache.set(consulta, resultados["categoria"], resultados["resposta"], historico)
     logger.info(
         "Fluxo concluído. Categoria: %s, Resposta: %.50s",
         resultados["categoria"],
@@ -343,9 +779,224 @@ def executar_suporte_ao_cliente(consulta: str) -> Dict[str, str]:
     }
 
 
+async def executar_suporte_ao_cliente_stream(
+    consulta: str, moderacao: Optional[asyncio.Task] = None, historico: str = "",
+    resultados: Optional[Dict[str, str]] = None
+) -> AsyncIterator[str]:
+    """
+    Processa a consulta pelo fluxo LangGraph, emitindo a resposta token a token.
+
+    Apenas os tokens gerados pelos nós de resposta ('handle_technical' e
+    'handle_web_search') são repassados; a saída da categorização é descartada.
+    Respostas presentes no cache são emitidas em um único trecho.
+
+    A resposta é moderada em janelas durante a geração e pode ser interrompida no
+    meio com `SaidaBloqueadaError`; nesse caso, ela não é armazenada no cache.
+
+    Args:
+        consulta (str): Consulta realizada pelo usuário.
+        moderacao (Optional[asyncio.Task]): Moderação executada em paralelo. Quando
+            informada, a resposta só é armazenada no cache após a aprovação.
+        historico (str): Janela de histórico da conversa.
+        resultados (Optional[Dict[str, str]]): Preenchido com o estado final do fluxo.
+
+    Yields:
+        str: Trechos da resposta na ordem em que são gerados pelo LLM.
+    """
+    logger.info("Executando fluxo (streaming) para consulta: %.50s",
+                consulta.replace("\n", " ")[:50])
+
+    resultados = {} if resultados is None else resultados
+    em_cache = await response_cache.aget(consulta, historico=historico)
+    if em_cache is not None:
+        logger.info("Resposta obtida do cache. Categoria: %s", em_cache["categoria"])
+        resultados.update(em_cache)
+        yield em_cache["resposta"]
+        return
+
+    async for trecho in gerar_resposta(consulta, moderacao, resultados, historico):
+        yield trecho
+
+    await aguardar_aprovacao(moderacao)
+    response_cache.set(consulta, resultados.get("categoria", ""), resultados.get("resposta", ""), historico)
+    logger.info("Fluxo (streaming) concluído.")
+
+
+# =============================================================================
+# Moderação em paralelo com a execução especulativa do fluxo
+# =============================================================================
+async def _descartar_especulacao(tarefa: asyncio.Task) -> None:
+    """Cancela o trabalho especulativo de uma pergunta reprovada e aguarda seu término."""
+    tarefa.cancel()
+    await asyncio.gather(tarefa, return_exceptions=True)
+    metrics.inc("chat_x_speculation_cancelled_total")
+    logger.info("Execução especulativa cancelada após reprovação da moderação.")
+
+
+async def responder_com_moderacao(
+    consulta: str, historico: str = "", resultados: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """
+    Modera a pergunta e executa o fluxo, de acordo com SPECULATION_MODE:
+
+    - 'off': modera e só então executa o fluxo (comportamento sequencial).
+    - 'categorize': categoriza em paralelo com a moderação; a resposta só é gerada
+      após a aprovação.
+    - 'full': executa todo o fluxo em paralelo com a moderação; a resposta
+      especulativa é descartada se a pergunta for reprovada.
+
+    Args:
+        consulta (str): Consulta realizada pelo usuário.
+        historico (str): Janela de histórico da conversa.
+        resultados (Optional[Dict[str, str]]): Preenchido com o estado final do fluxo.
+
+    Returns:
+        Dict[str, str]: Dicionário contendo a categoria e a resposta final.
+
+    Raises:
+        ConteudoBloqueadoError: Se a moderação reprovar a pergunta.
+    """
+    if SPECULATION_MODE == "off":
+        if not await guard_moderation_async(consulta, bot=False):
+            raise ConteudoBloqueadoError()
+        return await executar_suporte_ao_cliente(consulta, historico=historico, resultados=resultados)
+
+    moderacao = asyncio.create_task(guard_moderation_async(consulta, bot=False))
+    execucao = asyncio.create_task(
+        executar_suporte_ao_cliente(consulta, moderacao, historico, resultados)
+    )
+    try:
+        aprovado = await moderacao
+    except BaseException:
+        # Moderação com erro ou RPC cancelado: a especulação não pode continuar solta
+        execucao.cancel()
+        await asyncio.gather(execucao, return_exceptions=True)
+        raise
+    if not aprovado:
+        await _descartar_especulacao(execucao)
+        raise ConteudoBloqueadoError()
+    return await execucao
+
+
+async def responder_com_moderacao_stream(
+    consulta: str, historico: str = "", resultados: Optional[Dict[str, str]] = None
+) -> AsyncIterator[str]:
+    """
+    Versão em streaming de `responder_com_moderacao`.
+
+    No modo 'full', os trechos gerados antes do veredito ficam retidos em uma fila e
+    só são emitidos após a aprovação; se a pergunta for reprovada, a geração é
+    cancelada e os trechos retidos são descartados.
+
+    Args:
+        consulta (str): Consulta realizada pelo usuário.
+        historico (str): Janela de histórico da conversa.
+        resultados (Optional[Dict[str, str]]): Preenchido com o estado final do fluxo.
+
+    Yields:
+        str: Trechos da resposta, apenas após a aprovação da moderação.
+
+    Raises:
+        ConteudoBloqueadoError: Se a moderação reprovar a pergunta.
+    """
+    if SPECULATION_MODE == "off":
+        if not await guard_moderation_async(consulta, bot=False):
+            raise ConteudoBloqueadoError()
+        async for trecho in executar_suporte_ao_cliente_stream(
+            consulta, historico=historico, resultados=resultados
+        ):
+            yield trecho
+        return
+
+    moderacao = asyncio.create_task(guard_moderation_async(consulta, bot=False))
+    fila: asyncio.Queue = asyncio.Queue()
+    fim = object()
+
+    async def produzir() -> None:
+        try:
+            async for trecho in executar_suporte_ao_cliente_stream(
+                consulta, moderacao, historico, resultados
+            ):
+                await fila.put(trecho)
+        finally:
+            fila.put_nowait(fim)
+
+    produtor = asyncio.create_task(produzir())
+    try:
+        if not await moderacao:
+            await _descartar_especulacao(produtor)
+            raise ConteudoBloqueadoError()
+        while (trecho := await fila.get()) is not fim:
+            yield trecho
+        await produtor  # Propaga eventuais erros da geração
+    finally:
+        produtor.cancel()
+        await asyncio.gather(produtor, return_exceptions=True)
+
+
 # =============================================================================
 # Classe do Servidor gRPC
 # =============================================================================
+MENSAGEM_BLOQUEIO = "Desculpe, sua pergunta contém conteúdo bloqueado."
+MENSAGEM_SAIDA_BLOQUEADA = "Desculpe, a resposta foi interrompida por conter conteúdo bloqueado."
+MENSAGEM_COTA_ESGOTADA = "Sua cota de mensagens foi atingida."
+MENSAGEM_NAO_AUTENTICADO = "Usuário não identificado: informe o e-mail de um usuário registrado."
+
+
+async def usuario_autenticado(user_email: str) -> bool:
+    """Indica se o e-mail pertence a um usuário registrado; sempre True se a cota não estiver ativa."""
+    if not quota_service.ativo:
+        return True
+    return await quota_service.autenticar(user_email)
+
+
+async def verificar_cota(user_email: str) -> bool:
+    """Consome a cota do usuário; sempre permite se a cota não estiver ativa."""
+    if not quota_service.ativo:
+        return True
+    return await quota_service.verificar(user_email)
+
+
+class ReservaCota:
+    """Mensagem já consumida da cota, devolvida se a requisição não for concluída.
+
+    A requisição é concluída quando o turno é registrado; recusas da moderação,
+    falhas e cancelamentos (p. ex., o cliente encerrando o stream) devolvem a mensagem.
+    """
+
+    def __init__(self, user_email: str):
+        self.user_email = user_email
+        self.concluida = False
+
+    def __enter__(self) -> "ReservaCota":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if not self.concluida and quota_service.ativo:
+            quota_service.devolver(self.user_email)
+            logger.info("Cota devolvida a %s: requisição não concluída.", self.user_email)
+
+
+def registrar_tokens_prompt(historico: str, resultados: Dict[str, str]) -> int:
+    """
+    Registra em log e nas métricas os tokens dos prompts de uma requisição.
+
+    Args:
+        historico (str): Janela de histórico usada nos prompts.
+        resultados (Dict[str, str]): Estado final do fluxo (com 'prompt_tokens').
+
+    Returns:
+        int: Tokens dos prompts enviados ao LLM (0 para respostas do cache).
+    """
+    tokens_prompt = resultados.get("prompt_tokens", 0)
+    tokens_historico = contar_tokens(historico)
+    metrics.inc("chat_x_prompt_tokens_total", tokens_prompt)
+    metrics.inc("chat_x_history_tokens_total", tokens_historico)
+    metrics.set("chat_x_prompt_tokens_last", tokens_prompt)
+    logger.info("Tokens do prompt: %d (histórico: %d).", tokens_prompt, tokens_historico)
+    return tokens_prompt
+
+
 class GenAiServiceServicer(genai_pb2_grpc.GenAiServiceServicer):
     """
     Classe que implementa o serviço gRPC para processamento de perguntas via LLMs.
@@ -365,34 +1016,129 @@ class GenAiServiceServicer(genai_pb2_grpc.GenAiServiceServicer):
         user_question = request.question
         logger.info("Recebida pergunta via gRPC: %s", user_question)
 
-        # Moderação inicial
-        if not await guard_moderation_async(user_question, bot=False):
-            logger.warning("Pergunta bloqueada pela moderação.")
-            return genai_pb2.AnswerResponse(
-                answer="Desculpe, sua pergunta contém conteúdo bloqueado."
+        if not await usuario_autenticado(request.user_email):
+            logger.warning("Pergunta recusada: usuário não registrado (%r).", request.user_email)
+            await context.abort(grpc.StatusCode.UNAUTHENTICATED, MENSAGEM_NAO_AUTENTICADO)
+        if not await verificar_cota(request.user_email):
+            logger.warning("Cota de mensagens esgotada para %s.", request.user_email)
+            return genai_pb2.AnswerResponse(answer=MENSAGEM_COTA_ESGOTADA)
+
+        with ReservaCota(request.user_email) as reserva:
+            historico = await conversation_store.historico(request.conversation_id, request.user_email)
+            resultados: Dict[str, str] = {}
+            try:
+                response_text = await responder_com_moderacao(user_question, historico, resultados)
+                resposta_final = response_text["resposta"]
+            except ConteudoBloqueadoError:
+                logger.warning("Pergunta bloqueada pela moderação.")
+                return genai_pb2.AnswerResponse(answer=MENSAGEM_BLOQUEIO)
+            except SaidaBloqueadaError as e:
+                logger.warning("Resposta bloqueada pela moderação de saída (%s).", e.motivo)
+                return genai_pb2.AnswerResponse(answer=MENSAGEM_SAIDA_BLOQUEADA)
+            except Exception as e:
+                logger.error("Erro ao processar a solicitação: %s", str(e))
+                return genai_pb2.AnswerResponse(answer=f"Erro ao processar a solicitação: {str(e)}")
+
+            await conversation_store.registrar_turno(
+                request.conversation_id, user_question, resposta_final, request.user_email
             )
-
-        try:
-            response_text = executar_suporte_ao_cliente(user_question)
-            resposta_final = response_text["resposta"]
-        except Exception as e:
-            logger.error("Erro ao processar a solicitação: %s", str(e))
-            resposta_final = f"Erro ao processar a solicitação: {str(e)}"
-
+            reserva.concluida = True
+        tokens_prompt = registrar_tokens_prompt(historico, resultados)
         logger.info("Resposta final enviada ao cliente: %.50s",
                     resposta_final.replace("\n", " ")[:50])
-        return genai_pb2.AnswerResponse(answer=resposta_final)
+        return genai_pb2.AnswerResponse(answer=resposta_final, prompt_tokens=tokens_prompt)
+
+    async def AskQuestionStream(self, request, context):
+        """
+        Método gRPC que recebe a pergunta e envia a resposta do Agente em trechos,
+        à medida que os tokens são gerados pelo LLM.
+
+        Args:
+            request (genai_pb2.QuestionRequest): Objeto contendo a pergunta do usuário.
+            context (grpc.aio.ServicerContext): Contexto de execução do gRPC.
+
+        Yields:
+            genai_pb2.AnswerChunk: Trechos da resposta a serem enviados ao cliente.
+        """
+        user_question = request.question
+        logger.info("Recebida pergunta via gRPC (streaming): %s", user_question)
+
+        if not await usuario_autenticado(request.user_email):
+            logger.warning("Pergunta recusada: usuário não registrado (%r).", request.user_email)
+            await context.abort(grpc.StatusCode.UNAUTHENTICATED, MENSAGEM_NAO_AUTENTICADO)
+        if not await verificar_cota(request.user_email):
+            logger.warning("Cota de mensagens esgotada para %s.", request.user_email)
+            yield genai_pb2.AnswerChunk(chunk=MENSAGEM_COTA_ESGOTADA)
+            return
+
+        with ReservaCota(request.user_email) as reserva:
+            historico = await conversation_store.historico(request.conversation_id, request.user_email)
+            resultados: Dict[str, str] = {}
+            trechos = []
+            try:
+                async for trecho in responder_com_moderacao_stream(user_question, historico, resultados):
+                    trechos.append(trecho)
+                    yield genai_pb2.AnswerChunk(chunk=trecho)
+            except ConteudoBloqueadoError:
+                logger.warning("Pergunta bloqueada pela moderação.")
+                yield genai_pb2.AnswerChunk(chunk=MENSAGEM_BLOQUEIO)
+                return
+            except SaidaBloqueadaError as e:
+                # Os trechos já enviados permanecem no cliente; a resposta é encerrada aqui
+                logger.warning("Resposta interrompida pela moderação de saída (%s).", e.motivo)
+                yield genai_pb2.AnswerChunk(chunk=f"\n\n{MENSAGEM_SAIDA_BLOQUEADA}")
+                return
+            except Exception as e:
+                logger.error("Erro ao processar a solicitação: %s", str(e))
+                yield genai_pb2.AnswerChunk(
+                    chunk=f"Erro ao processar a solicitação: {str(e)}"
+                )
+                return
+
+            await conversation_store.registrar_turno(
+                request.conversation_id, user_question, "".join(trechos), request.user_email
+            )
+            reserva.concluida = True
+        # Último trecho, sem texto, com a contagem de tokens da requisição
+        yield genai_pb2.AnswerChunk(prompt_tokens=registrar_tokens_prompt(historico, resultados))
+        logger.info("Streaming da resposta concluído.")
 
 
 # =============================================================================
 # Função principal de execução do servidor
 # =============================================================================
+# Intervalo mínimo aceito entre pings de keepalive dos clientes
+GRPC_MIN_PING_INTERVAL_MS = int(os.getenv("GRPC_MIN_PING_INTERVAL_MS", "10000"))
+
+
 async def serve() -> None:
     """
     Inicializa e executa o servidor gRPC de forma assíncrona, 
     lidando com Ctrl+C e interrompendo o loop corretamente.
     """
-    server = aio.server()
+    # Compila as chains e o cliente LLM e cria as instâncias de guardrails
+    # antes de aceitar requisições
+    chain_registry.build()
+    rails_pool.preencher()
+
+    # Importado aqui: o módulo de autenticação abre o banco na importação
+    from authenticate import create_storage
+
+    storage = create_storage()
+    conversation_store.conectar(storage)
+    if conversation_summarizer is not None:
+        conversation_summarizer.conectar(storage, resumir_conversa)
+    if QUOTA_ENABLED:
+        quota_service.conectar(storage)
+        quota_service.iniciar()
+
+    metrics_server = start_metrics_server(METRICS_PORT) if METRICS_PORT else None
+
+    server = aio.server(options=[
+        # Aceita os pings de keepalive dos canais persistentes do cliente
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.min_ping_interval_without_data_ms", GRPC_MIN_PING_INTERVAL_MS),
+    ])
     genai_pb2_grpc.add_GenAiServiceServicer_to_server(
         GenAiServiceServicer(), server
     )
@@ -427,6 +1173,16 @@ async def serve() -> None:
         try:
             # Protege a chamada de shutdown contra cancelamentos
             await asyncio.shield(server.stop(grace=5))
+            await search_service.aclose()
+            if page_reader is not None:
+                await page_reader.aclose()
+            search_executor.shutdown(wait=False, cancel_futures=True)
+            await quota_service.aclose()
+            if conversation_summarizer is not None:
+                await conversation_summarizer.aclose()
+            await chain_registry.aclose()
+            if metrics_server is not None:
+                metrics_server.shutdown()
             logger.info("Servidor gRPC desligado com sucesso.")
         except asyncio.CancelledError:
             logger.warning("Shutdown interrompido novamente (Ctrl+C duplo?).")
@@ -0,0 +1,111 @@
+# storage.py
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+# Limite de mensagens por usuário, usado pela interface e pela cota do servidor
+MESSAGE_LIMIT = int(os.getenv("MESSAGE_LIMIT", "20"))
+
+
+class DatabaseError(Exception):
+    """Exceção personalizada para erros de banco de dados."""
+    pass
+
+
+# Id da última mensagem gravada por este processo, por (armazenamento, usuário):
+# permite que caches de histórico detectem novas mensagens sem consultar o banco
+_latest_message_ids: Dict[Tuple[str, str], int] = {}
+_latest_message_ids_lock = threading.Lock()
+
+
+class ChatStorage(ABC):
+    """Interface de armazenamento de usuários, cotas de mensagens e histórico.
+
+    As implementações (SQLite em `authenticate.DatabaseManager` e PostgreSQL em
+    `postgres_storage.PostgresStorage`) seguem o mesmo contrato: erros de banco são
+    registrados em log e convertidos no valor de retorno indicado em cada método,
+    sem propagar exceções para a interface.
+    """
+
+    @property
+    @abstractmethod
+    def storage_key(self) -> str:
+        """Identifica o banco (arquivo ou DSN), para caches compartilhados no processo."""
+
+    # Métodos de Usuário
+    @abstractmethod
+    def add_user(self, useremail: str) -> bool:
+        """Adiciona um novo usuário; False se já existir ou em caso de erro."""
+
+    @abstractmethod
+    def user_exists(self, useremail: str) -> bool:
+        """Verifica se um usuário existe."""
+
+    # Métodos de Thread
+    @abstractmethod
+    def get_thread_key(self, useremail: str) -> Optional[str]:
+        """Obtém a chave da thread de um usuário."""
+
+    @abstractmethod
+    def set_thread_key(self, useremail: str, thread_key: str) -> bool:
+        """Define ou atualiza a chave da thread de um usuário."""
+
+    @abstractmethod
+    def get_thread_summary(self, useremail: str) -> Tuple[str, int]:
+        """Retorna (resumo, id da última mensagem resumida); ("", 0) se não houver resumo."""
+
+    @abstractmethod
+    def set_thread_summary(self, useremail: str, summary: str, message_id: int) -> bool:
+        """Grava o resumo da thread e o id da última mensagem que ele cobre."""
+
+    # Métodos de Limite de Mensagens
+    @abstractmethod
+    def get_message_limit(self, useremail: str) -> Tuple[bool, int]:
+        """Retorna (abaixo do limite, contador); (False, 0) se não inicializado."""
+
+    @abstractmethod
+    def initialize_message_limit(self, useremail: str) -> bool:
+        """Inicializa o contador de mensagens; False se já existir ou em caso de erro."""
+
+    @abstractmethod
+    def update_message_counter(self, useremail: str, increment: int = 1) -> Optional[int]:
+        """Incrementa o contador e retorna o novo valor (None em caso de erro)."""
+
+    @abstractmethod
+    def adjust_message_counters(self, deltas: Dict[str, int]) -> bool:
+        """Soma os ajustes aos contadores de vários usuários em uma transação (mínimo 0)."""
+
+    # Métodos de Mensagens
+    @abstractmethod
+    def save_message(self, useremail: str, role: str, content: str) -> bool:
+        """Salva uma mensagem."""
+
+    @abstractmethod
+    def record_turn(self, useremail: str, user_message: str, assistant_message: str,
+                    increment: int = 1) -> Optional[int]:
+        """Grava pergunta, resposta e cota em uma transação; retorna o novo contador."""
+
+    @abstractmethod
+    def load_messages(self, useremail: str, before_id: Optional[int] = None,
+                      limit: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict]:
+        """Carrega mensagens (id, role, content) em ordem cronológica, paginadas por id."""
+
+    @abstractmethod
+    def get_latest_message_id(self, useremail: str) -> int:
+        """Consulta o id da última mensagem do usuário (0 se não houver mensagens)."""
+
+    def close(self):
+        """Libera as conexões mantidas pelo armazenamento."""
+
+    def known_latest_message_id(self, useremail: str) -> Optional[int]:
+        """Id da última mensagem do usuário gravada por este processo (sem consultar o banco)."""
+        with _latest_message_ids_lock:
+            return _latest_message_ids.get((self.storage_key, useremail))
+
+    def _record_message_id(self, useremail: str, message_id: int) -> None:
+        with _latest_message_ids_lock:
+            key = (self.storage_key, useremail)
+            if message_id > _latest_message_ids.get(key, 0):
+                _latest_message_ids[key] = message_id
@@ -0,0 +1,94 @@
+import pytest
+import sys
+import os
+import asyncio
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import genai_pb2
+import server
+from cache import ResponseCache
+from search import ThreadedSearchProvider, WebSearchService
+
+LATENCIA = 0.2  # Latência artificial de cada chamada ao LLM (segundos)
+N_REQUISICOES = 10
+
+
+class LentoFakeLLM(BaseChatModel):
+    """LLM falso com latência artificial: 'categoria' para a categorização, texto fixo nas respostas."""
+
+    categoria: str = "simples"
+
+    @property
+    def _llm_type(self) -> str:
+        return "lento-fake"
+
+    def _responder(self, messages) -> ChatResult:
+        prompt = messages[-1].content
+        texto = self.categoria if "'simples' ou 'complexa'" in prompt else "resposta"
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=texto))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(LATENCIA)
+        return self._responder(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(LATENCIA)
+        return self._responder(messages)
+
+
+async def _aprovar(consulta, bot, pergunta=""):
+    return True
+
+
+def _pesquisa_lenta(query, max_resultados):
+    time.sleep(LATENCIA)
+    return [{"title": "resultado", "body": "resultado da pesquisa", "href": "https://exemplo.com"}]
+
+
+async def _disparar(n: int) -> float:
+    servicer = server.GenAiServiceServicer()
+    inicio = time.perf_counter()
+    respostas = await asyncio.gather(*[
+        servicer.AskQuestion(genai_pb2.QuestionRequest(question=f"pergunta {i}"), None)
+        for i in range(n)
+    ])
+    decorrido = time.perf_counter() - inicio
+    assert all(r.answer == "resposta" for r in respostas)
+    return decorrido
+
+
+@pytest.mark.asyncio
+async def test_requisicoes_simultaneas_nao_se_bloqueiam(monkeypatch):
+    llm = LentoFakeLLM()
+    monkeypatch.setattr(server, "chain_registry", server.ChainRegistry(llm=llm))
+    monkeypatch.setattr(server, "guard_moderation_async", _aprovar)
+    monkeypatch.setattr(server, "response_cache", ResponseCache())
+
+    # Uma requisição = categorização + resposta = 2 chamadas ao LLM
+    latencia_unitaria = 2 * LATENCIA
+    decorrido = await _disparar(N_REQUISICOES)
+
+    assert decorrido < 2 * latencia_unitaria
+    assert decorrido < N_REQUISICOES * latencia_unitaria / 3
+
+
+@pytest.mark.asyncio
+async def test_pesquisa_web_executada_fora_do_event_loop(monkeypatch):
+    llm = LentoFakeLLM(categoria="complexa")
+    monkeypatch.setattr(server, "chain_registry", server.ChainRegistry(llm=llm))
+    monkeypatch.setattr(server, "guard_moderation_async", _aprovar)
+    monkeypatch.setattr(server, "response_cache", ResponseCache())
+    provedor = ThreadedSearchProvider("lento", _pesquisa_lenta, server.search_executor)
+    monkeypatch.setattr(server, "search_service", WebSearchService(provedor))
+
+    # Categorização + pesquisa + resposta
+    latencia_unitaria = 3 * LATENCIA
+    decorrido = await _disparar(server.SEARCH_MAX_WORKERS)
+
+    assert decorrido < 2 * latencia_unitaria
@@ -0,0 +1,56 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+import moderation
+from blocked_terms import BlockedTermsMatcher, check_blocked_terms
+
+
+def test_encontra_termos_sobrepostos_em_uma_passada():
+    matcher = BlockedTermsMatcher(["he", "she", "his", "hers"])
+    assert matcher.buscar("ushers he his") == ["he", "his"]
+    assert matcher.buscar("she hers") == ["she", "hers"]
+
+
+@pytest.mark.parametrize("texto, bloqueado", [
+    ("Me passe o CÓDIGO-FONTE proprietário, por favor", True),
+    ("isso é segredo   industrial!", True),
+    ("Meu computador não liga", False),
+    ("Qual a capital da França?", False),
+])
+def test_compara_palavras_inteiras_ignorando_caixa_acentos_e_pontuacao(texto, bloqueado):
+    matcher = BlockedTermsMatcher(["codigo fonte proprietario", "segredo industrial", "puta"])
+    assert matcher.contem(texto) is bloqueado
+
+
+def test_recarrega_termos_do_arquivo(tmp_path):
+    arquivo = tmp_path / "termos.txt"
+    arquivo.write_text("# comentário\nproibido\n", encoding="utf-8")
+    matcher = BlockedTermsMatcher.from_file(str(arquivo))
+    assert matcher.termos == ["proibido"]
+
+    arquivo.write_text("vedado\n", encoding="utf-8")
+    matcher.recarregar()
+    assert not matcher.contem("algo proibido")
+    assert matcher.contem("algo vedado")
+
+
+@pytest.mark.asyncio
+async def test_acao_registrada_nas_instancias_do_pool():
+    rails = moderation.criar_rails()
+    assert rails.runtime.action_dispatcher.has_registered("check_blocked_terms")
+    assert await check_blocked_terms({"bot_message": "Isso é segredo industrial."})
+    assert not await check_blocked_terms({"bot_message": "Paris é a capital da França."})
+
+
+@pytest.mark.asyncio
+async def test_prefiltro_rejeita_sem_acionar_os_rails(monkeypatch):
+    class PoolIndisponivel:
+        def checkout(self):
+            raise AssertionError("os rails não deveriam ser acionados")
+
+    monkeypatch.setattr(moderation, "rails_pool", PoolIndisponivel())
+
+    assert not await moderation.guard_moderation_async("Qual o segredo industrial de vocês?", bot=False)
@@ -0,0 +1,120 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import server
+from cache import HashingEmbedder, ResponseCache, TTLCache, chave_consulta, normalizar_texto
+from metrics import metrics
+
+
+async def _aprovar(consulta, bot, pergunta=""):
+    return True
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+def test_normalizar_texto_ignora_caixa_acentos_e_pontuacao():
+    assert normalizar_texto("Qual a capital da  França?") == normalizar_texto("qual a capital da franca")
+
+
+def test_chave_preserva_operadores_e_simbolos():
+    assert chave_consulta("Quanto é 2+2?") == chave_consulta("quanto e 2+2")
+    chaves = {chave_consulta(c) for c in (
+        "quanto é 2+2", "quanto é 2-2", "quanto é 2*2", "o que é C++", "o que é C#", "o que é C",
+        "juros de 5%", "juros de 5", "nota 2.5", "nota 25",
+    )}
+    assert len(chaves) == 10
+
+
+def test_ttl_cache_expira_e_descarta_lru():
+    relogio = Relogio()
+    cache = TTLCache(max_entries=2, ttl=10, relogio=relogio)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "a" passa a ser a mais recente
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    relogio.agora = 11
+    assert cache.get("a") is None
+    assert cache.evictions == 1
+
+
+def test_respostas_complexas_expiram_antes():
+    relogio = Relogio()
+    cache = ResponseCache(ttl_simples=100, ttl_complexa=10, relogio=relogio)
+    cache.set("Oi", "simples", "Olá!")
+    cache.set("Que horas são?", "complexa", "São 10h.")
+
+    relogio.agora = 50
+    assert cache.get("oi") == {"categoria": "simples", "resposta": "Olá!"}
+    assert cache.get("Que horas são?") is None
+
+
+def test_camada_semantica_reaproveita_consulta_parecida():
+    cache = ResponseCache(embedder=HashingEmbedder(), limiar_semantico=0.8)
+    cache.set("Qual a capital da França?", "simples", "Paris.")
+    assert cache.get("Qual é a capital da França") == {"categoria": "simples", "resposta": "Paris."}
+    assert cache.get("Quem descobriu o Brasil?") is None
+
+
+@pytest.mark.asyncio
+async def test_camada_semantica_exige_os_mesmos_numeros_e_simbolos():
+    cache = ResponseCache(embedder=HashingEmbedder())
+    cache.set("quanto é 2+2", "simples", "4")
+    cache.set("o que é C++", "simples", "Uma linguagem derivada do C.")
+
+    assert await cache.aget("quanto é 2+3") is None
+    assert await cache.aget("quanto é 2 + 2") is None
+    assert await cache.aget("o que é C#") is None
+    assert await cache.aget("Quanto é 2+2?") == {"categoria": "simples", "resposta": "4"}
+    assert await cache.aget("o que é o C++") == {
+        "categoria": "simples", "resposta": "Uma linguagem derivada do C."
+    }
+
+
+@pytest.mark.asyncio
+async def test_cache_com_historico():
+    cache = ResponseCache()
+    conversa = "Usuário: Qual a capital da França?\nAssistente: Paris."
+    cache.set("Obrigado!", "simples", "De nada!")
+    cache.set("Qual a capital da Itália?", "simples", "Roma.")
+    cache.set("E a população?", "complexa", "Cerca de 2 milhões.", historico=conversa)
+
+    # Conversa informal curta reaproveita a resposta gerada sem histórico
+    assert await cache.aget("obrigado", historico=conversa) == {"categoria": "simples", "resposta": "De nada!"}
+    # Perguntas que podem depender da conversa, não
+    assert await cache.aget("Qual a capital da Itália?", historico=conversa) is None
+    # Respostas geradas com histórico valem apenas para a mesma janela
+    assert await cache.aget("e a populacao", historico=conversa) == {
+        "categoria": "complexa", "resposta": "Cerca de 2 milhões."
+    }
+    assert await cache.aget("E a população?") is None
+    assert await cache.aget("E a população?", historico=conversa + "\nUsuário: oi") is None
+
+
+@pytest.mark.asyncio
+async def test_consulta_repetida_nao_executa_o_fluxo(monkeypatch):
+    llm = FakeListChatModel(responses=["simples", "Paris.", "não deveria ser usada"])
+    monkeypatch.setattr(server, "chain_registry", server.ChainRegistry(llm=llm))
+    monkeypatch.setattr(server, "response_cache", ResponseCache())
+    monkeypatch.setattr(server, "guard_moderation_async", _aprovar)
+    metrics.reset()
+
+    primeira = await server.executar_suporte_ao_cliente("Qual a capital da França?")
+    segunda = await server.executar_suporte_ao_cliente("qual a capital da franca")
+
+    assert primeira == segunda == {"categoria": "simples", "resposta": "Paris."}
+    assert llm.i == 2  # apenas categorização e resposta da primeira consulta
+    assert metrics.get("chat_x_response_cache_hits_total", {"tier": "exact", "categoria": "simples"}) == 1
@@ -0,0 +1,47 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import server
+from classifier import NaiveBayesClassifier, QueryPreClassifier
+
+
+@pytest.mark.parametrize("consulta, esperado", [
+    ("Oi, tudo bem?", "simples"),
+    ("Obrigado!", "simples"),
+    ("Que horas são?", "complexa"),
+    ("Qual a cotação do dólar hoje?", "complexa"),
+    ("Quem venceu a eleição de 2025?", "complexa"),
+    ("Qual a capital da França?", None),
+    ("Quem ganhou a Copa de 1970?", None),
+])
+def test_regras_decidem_apenas_casos_evidentes(consulta, esperado):
+    categoria, _ = QueryPreClassifier(ano_atual=2026).classificar(consulta)
+    assert categoria == esperado
+
+
+def test_modelo_local_so_decide_com_confianca():
+    modelo = NaiveBayesClassifier().treinar([
+        ("qual a capital da frança", "simples"),
+        ("qual a capital da itália", "simples"),
+        ("quem é o presidente do brasil", "complexa"),
+    ])
+    confiante = QueryPreClassifier(modelo=modelo, confianca_minima=0.6)
+    exigente = QueryPreClassifier(modelo=modelo, confianca_minima=0.999)
+    assert confiante.classificar("Qual a capital da Espanha?") == ("simples", "modelo")
+    assert exigente.classificar("Qual a capital da Espanha?") == (None, "indefinido")
+
+
+@pytest.mark.asyncio
+async def test_categorize_nao_chama_llm_quando_regra_decide(monkeypatch):
+    llm = FakeListChatModel(responses=["simples"])
+    monkeypatch.setattr(server, "chain_registry", server.ChainRegistry(llm=llm))
+
+    resultado = await server.categorize({"query": "Que dia é hoje?", "history": ""})
+
+    assert resultado == {"categoria": "complexa"}
+    assert llm.i == 0
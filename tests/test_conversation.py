@@ -0,0 +1,112 @@
+import pytest
+import sys
+import os
+import math
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+# O módulo cria um DatabaseManager na importação: mantém o banco e o log fora do repositório
+_TMP = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_FILE", os.path.join(_TMP, "database.db"))
+os.environ.setdefault("AUTH_LOG_FILE", os.path.join(_TMP, "autheticate.log"))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import genai_pb2
+import server
+from authenticate import DatabaseManager
+from cache import ResponseCache
+from conversation import ConversationStore, ConversationWindow
+
+
+def contar(texto):
+    """Contador determinístico (~4 caracteres por token), sem depender do tiktoken."""
+    return math.ceil(len(texto) / 4)
+
+
+def janela(orcamento=200):
+    return ConversationWindow(orcamento=orcamento, fracao_compactada=0.3,
+                              tokens_por_mensagem_compactada=10, contar=contar)
+
+
+def test_janela_limitada_ao_orcamento():
+    conversa = janela()
+    for i in range(200):
+        conversa.adicionar("user", f"pergunta {i} " + "detalhe " * 20)
+        conversa.adicionar("assistant", f"resposta {i} " + "explicação " * 30)
+        assert contar(conversa.texto()) <= 200
+
+    texto = conversa.texto()
+    # As mensagens mais recentes ficam na íntegra; as anteriores, compactadas
+    assert texto.endswith("Assistente: resposta 199 " + "explicação " * 30)
+    assert "Mensagens anteriores (resumidas):" in texto
+    assert "pergunta 0 " not in texto
+
+
+def test_conversa_curta_mantida_na_integra():
+    conversa = janela()
+    conversa.adicionar("user", "Qual a capital da França?")
+    conversa.adicionar("assistant", "Paris.")
+    assert conversa.texto() == "Usuário: Qual a capital da França?\nAssistente: Paris."
+
+
+def test_mensagem_maior_que_o_orcamento_truncada():
+    conversa = janela(orcamento=50)
+    conversa.adicionar("user", "x" * 10_000)
+    assert contar(conversa.texto()) <= 50
+    assert conversa.texto().endswith("…")
+
+
+@pytest.mark.asyncio
+async def test_conversas_separadas_por_usuario():
+    store = ConversationStore(criar_janela=janela)
+    await store.registrar_turno("c1", "pergunta de a", "resposta", "a@x.com")
+
+    assert "pergunta de a" in await store.historico("c1", "a@x.com")
+    assert await store.historico("c1", "b@x.com") == ""
+    assert await store.historico("", "a@x.com") == ""
+
+
+@pytest.mark.asyncio
+async def test_conversa_recarregada_do_armazenamento(tmp_path):
+    db = DatabaseManager(str(tmp_path / "chat.db"))
+    db.add_user("a@x.com")
+    db.initialize_message_limit("a@x.com")
+    db.record_turn("a@x.com", "Qual a capital da França?", "Paris.")
+
+    store = ConversationStore(storage=db, criar_janela=janela)
+    historico = await store.historico("c1", "a@x.com")
+
+    assert historico == "Usuário: Qual a capital da França?\nAssistente: Paris."
+
+
+@pytest.mark.asyncio
+async def test_historico_enviado_nos_prompts_e_tokens_reportados(monkeypatch):
+    async def aprovar(consulta, bot, pergunta=""):
+        return True
+
+    prompts = []
+
+    class RegistraPrompts(FakeListChatModel):
+        async def _agenerate(self, messages, *args, **kwargs):
+            prompts.append(messages[-1].content)
+            return await super()._agenerate(messages, *args, **kwargs)
+
+    llm = RegistraPrompts(responses=["simples", "Paris.", "simples", "Cerca de 2 milhões."])
+    monkeypatch.setattr(server, "chain_registry", server.ChainRegistry(llm=llm))
+    monkeypatch.setattr(server, "guard_moderation_async", aprovar)
+    monkeypatch.setattr(server, "response_cache", ResponseCache())
+    monkeypatch.setattr(server, "conversation_store", ConversationStore(criar_janela=janela))
+    monkeypatch.setattr(server, "pre_classificador", None)
+    monkeypatch.setattr(server, "OUTPUT_MODERATION_ENABLED", False)
+    servicer = server.GenAiServiceServicer()
+
+    primeira = await servicer.AskQuestion(genai_pb2.QuestionRequest(
+        question="Qual a capital da França?", user_email="a@x.com", conversation_id="c1"), None)
+    segunda = await servicer.AskQuestion(genai_pb2.QuestionRequest(
+        question="Quantos habitantes ela tem?", user_email="a@x.com", conversation_id="c1"), None)
+
+    assert (primeira.answer, segunda.answer) == ("Paris.", "Cerca de 2 milhões.")
+    assert "Usuário: Qual a capital da França?\nAssistente: Paris." in prompts[-1]
+    assert 0 < primeira.prompt_tokens < segunda.prompt_tokens
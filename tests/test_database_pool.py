@@ -0,0 +1,84 @@
+import pytest
+import sys
+import os
+import sqlite3
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+# O módulo cria um DatabaseManager na importação: mantém o banco e o log fora do repositório
+_TMP = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_FILE", os.path.join(_TMP, "database.db"))
+os.environ.setdefault("AUTH_LOG_FILE", os.path.join(_TMP, "autheticate.log"))
+
+from authenticate import ConnectionPool, DatabaseError, DatabaseManager
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / "chat.db")
+
+
+def test_conexoes_persistentes_em_wal_compartilhadas_entre_instancias(db_file):
+    primeiro = DatabaseManager(db_file)
+    segundo = DatabaseManager(db_file)
+    primeiro.add_user("a@x.com")
+    segundo.save_message("a@x.com", "user", "oi")
+
+    assert primeiro.pool is segundo.pool
+    assert primeiro.pool._criadas == 1
+    with primeiro.get_connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+
+def test_leitor_nao_bloqueia_durante_escrita(db_file):
+    db = DatabaseManager(db_file)
+    db.add_user("a@x.com")
+    db.save_message("a@x.com", "user", "oi")
+    escritor = sqlite3.connect(db_file)
+    escritor.execute("BEGIN IMMEDIATE")
+    escritor.execute("INSERT INTO messages (useremail, role, content) VALUES ('a@x.com', 'user', 'novo')")
+
+    resultado = []
+    leitor = threading.Thread(target=lambda: resultado.append(db.load_messages("a@x.com")))
+    leitor.start()
+    leitor.join(timeout=1)
+
+    assert [m["content"] for m in resultado[0]] == ["oi"]
+    escritor.rollback()
+    escritor.close()
+
+
+def test_erro_no_meio_da_transacao_nao_contamina_o_pool(db_file):
+    db = DatabaseManager(db_file)
+    with pytest.raises(DatabaseError):
+        with db.get_connection() as conn:
+            conn.execute("INSERT INTO users (useremail) VALUES ('a@x.com')")
+            conn.execute("INSERT INTO tabela_inexistente VALUES (1)")
+
+    assert not db.user_exists("a@x.com")
+    with db.get_connection() as conn:
+        assert not conn.in_transaction
+
+
+def test_pool_limita_conexoes_sob_concorrencia(db_file):
+    pool = ConnectionPool(db_file, tamanho=2)
+    barreira = threading.Barrier(6)
+
+    def usar():
+        barreira.wait()
+        for _ in range(20):
+            with pool.connection() as conn:
+                conn.execute("SELECT 1").fetchone()
+
+    threads = [threading.Thread(target=usar) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert pool._criadas <= 2
+    pool.close()
+    assert pool._criadas == 0
@@ -0,0 +1,98 @@
+import pytest
+import sys
+import os
+import asyncio
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+import grpc
+from grpc import aio
+
+import genai_pb2
+import genai_pb2_grpc
+import grpc_client
+from grpc_client import GRPCClient
+
+
+class EcoServicer(genai_pb2_grpc.GenAiServiceServicer):
+    """Servidor de teste: ecoa a pergunta; 'lenta' demora e 'instavel' falha uma vez."""
+
+    def __init__(self):
+        self.chamadas = 0
+        self.falhas = 0
+
+    async def AskQuestion(self, request, context):
+        self.chamadas += 1
+        if request.question == "lenta":
+            await asyncio.sleep(1)
+        if request.question == "instavel" and self.falhas == 0:
+            self.falhas += 1
+            await context.abort(grpc.StatusCode.UNAVAILABLE, "reiniciando")
+        return genai_pb2.AnswerResponse(answer=f"{request.user_email}: {request.question}")
+
+    async def AskQuestionStream(self, request, context):
+        self.chamadas += 1
+        for palavra in request.question.split():
+            yield genai_pb2.AnswerChunk(chunk=palavra + " ")
+
+
+@pytest.fixture(scope="module")
+def servidor():
+    """Servidor gRPC em um event loop próprio, como o processo do servidor real."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    servicer = EcoServicer()
+
+    async def iniciar():
+        server = aio.server()
+        genai_pb2_grpc.add_GenAiServiceServicer_to_server(servicer, server)
+        port = server.add_insecure_port("localhost:0")
+        await server.start()
+        return server, port
+
+    server, port = asyncio.run_coroutine_threadsafe(iniciar(), loop).result()
+    yield servicer, port
+    asyncio.run_coroutine_threadsafe(server.stop(grace=None), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def test_canais_persistentes_compartilhados(servidor):
+    _, port = servidor
+    clientes = [GRPCClient(port=port) for _ in range(3)]
+
+    respostas = [c.ask_question_sync("oi", "a@x.com") for c in clientes for _ in range(4)]
+
+    assert respostas == ["a@x.com: oi"] * 12
+    assert len({id(c.pool) for c in clientes}) == 1
+    assert len(clientes[0].pool._channels) == grpc_client.GRPC_CHANNEL_POOL_SIZE
+
+
+def test_stream_sincrono(servidor):
+    _, port = servidor
+    trechos = list(GRPCClient(port=port).ask_question_stream_sync("Paris é a capital"))
+    assert trechos == ["Paris ", "é ", "a ", "capital "]
+
+
+@pytest.mark.asyncio
+async def test_metodos_assincronos_em_outro_loop(servidor):
+    _, port = servidor
+    client = GRPCClient(port=port)
+    assert await client.ask_question("oi", "b@x.com") == "b@x.com: oi"
+    assert [t async for t in client.ask_question_stream("um dois")] == ["um ", "dois "]
+
+
+def test_prazo_da_chamada(servidor):
+    _, port = servidor
+    inicio = time.perf_counter()
+    resposta = GRPCClient(port=port, timeout=0.2).ask_question_sync("lenta")
+    assert resposta == grpc_client.MENSAGEM_ERRO
+    assert time.perf_counter() - inicio < 0.9
+
+
+def test_repeticao_de_chamada_indisponivel(servidor):
+    servicer, port = servidor
+    assert GRPCClient(port=port).ask_question_sync("instavel") == ": instavel"
+    assert servicer.falhas == 1
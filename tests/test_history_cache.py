@@ -0,0 +1,98 @@
+import pytest
+import sys
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+# O módulo cria um DatabaseManager na importação: mantém o banco e o log fora do repositório
+_TMP = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_FILE", os.path.join(_TMP, "database.db"))
+os.environ.setdefault("AUTH_LOG_FILE", os.path.join(_TMP, "autheticate.log"))
+
+import authenticate
+import message_handler
+from message_handler import MessageHandler
+
+
+@pytest.fixture
+def leituras(monkeypatch, tmp_path):
+    """Usa um banco isolado e registra as consultas à tabela de mensagens."""
+    monkeypatch.setattr(authenticate, "DATABASE_FILE", str(tmp_path / "chat.db"))
+    monkeypatch.setattr(message_handler, "history_cache", message_handler.TTLCache())
+    monkeypatch.setattr(message_handler, "HISTORY_PAGE_SIZE", 3)
+    consultas = []
+    original = authenticate.DatabaseManager.get_connection
+
+    def registrar(sql):
+        if sql.lstrip().upper().startswith("SELECT") and "FROM messages" in sql:
+            consultas.append(sql)
+
+    @contextmanager
+    def rastrear(self):
+        with original(self) as conn:
+            conn.set_trace_callback(registrar)
+            try:
+                yield conn
+            finally:
+                conn.set_trace_callback(None)
+
+    monkeypatch.setattr(authenticate.DatabaseManager, "get_connection", rastrear)
+    handler = MessageHandler("a@x.com")
+    handler.db_manager.add_user("a@x.com")
+    handler.db_manager.initialize_message_limit("a@x.com")
+    return consultas
+
+
+def test_rerun_sem_mudancas_nao_le_o_banco(leituras):
+    MessageHandler("a@x.com").save_user_message("oi")
+    MessageHandler("a@x.com").load_recent_messages()
+
+    leituras.clear()
+    for _ in range(5):
+        # Cada rerun do Streamlit cria um novo MessageHandler
+        historico = MessageHandler("a@x.com").load_recent_messages()
+
+    assert leituras == []
+    assert [m["content"] for m in historico] == ["oi"]
+
+
+def test_gravacao_de_outra_sessao_busca_apenas_linhas_novas(leituras):
+    sessao_a, sessao_b = MessageHandler("a@x.com"), MessageHandler("a@x.com")
+    sessao_a.save_user_message("pergunta")
+    assert [m["content"] for m in sessao_a.load_recent_messages()] == ["pergunta"]
+
+    sessao_b.save_assistant_message("resposta")
+    leituras.clear()
+
+    assert [m["content"] for m in sessao_a.load_recent_messages()] == ["pergunta", "resposta"]
+    assert len(leituras) == 1
+    assert "AND id > " in leituras[0]
+
+
+def test_gravacao_de_outro_processo_detectada_na_revalidacao(leituras, monkeypatch):
+    handler = MessageHandler("a@x.com")
+    handler.save_user_message("oi")
+    handler.load_recent_messages()
+
+    externo = sqlite3.connect(handler.db_manager.db_file)
+    externo.execute("INSERT INTO messages (useremail, role, content) VALUES ('a@x.com', 'user', 'externa')")
+    externo.commit()
+    externo.close()
+
+    assert [m["content"] for m in handler.load_recent_messages()] == ["oi"]
+    monkeypatch.setattr(message_handler, "HISTORY_REVALIDATE_SECONDS", 0)
+    assert [m["content"] for m in handler.load_recent_messages()] == ["oi", "externa"]
+
+
+def test_paginas_anteriores_sob_demanda(leituras):
+    handler = MessageHandler("a@x.com")
+    for i in range(5):
+        handler.save_user_message(f"m{i}")
+
+    assert [m["content"] for m in handler.load_recent_messages()] == ["m2", "m3", "m4"]
+    assert handler.has_older_messages()
+    assert [m["content"] for m in handler.load_older_messages()] == [f"m{i}" for i in range(5)]
+    assert not handler.has_older_messages()
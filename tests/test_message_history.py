@@ -0,0 +1,65 @@
+import pytest
+import sys
+import os
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+# O módulo cria um DatabaseManager na importação: mantém o banco e o log fora do repositório
+_TMP = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_FILE", os.path.join(_TMP, "database.db"))
+os.environ.setdefault("AUTH_LOG_FILE", os.path.join(_TMP, "autheticate.log"))
+
+from authenticate import SCHEMA_MIGRATIONS, DatabaseManager
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / "chat.db"))
+    db.add_user("a@x.com")
+    db.add_user("b@x.com")
+    for i in range(10):
+        db.save_message("a@x.com", "user", f"a{i}")
+        db.save_message("b@x.com", "user", f"b{i}")
+    return db
+
+
+def test_paginacao_por_id_do_mais_recente_ao_mais_antigo(db):
+    recentes = db.load_messages("a@x.com", limit=4)
+    assert [m["content"] for m in recentes] == ["a6", "a7", "a8", "a9"]
+
+    anteriores = db.load_messages("a@x.com", before_id=recentes[0]["id"], limit=4)
+    assert [m["content"] for m in anteriores] == ["a2", "a3", "a4", "a5"]
+
+    ultimas = db.load_messages("a@x.com", before_id=anteriores[0]["id"], limit=4)
+    assert [m["content"] for m in ultimas] == ["a0", "a1"]
+    assert len(db.load_messages("a@x.com")) == 10
+
+
+def test_consulta_paginada_usa_o_indice(db):
+    with db.get_connection() as conn:
+        plano = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id, role, content FROM messages "
+            "WHERE useremail = ? AND id < ? ORDER BY id DESC LIMIT ?", ("a@x.com", 100, 50)
+        ))
+    assert "idx_messages_useremail_id" in plano
+    assert "TEMP B-TREE" not in plano
+
+
+def test_migracao_de_banco_existente(tmp_path):
+    arquivo = str(tmp_path / "legado.db")
+    conn = sqlite3.connect(arquivo)
+    for query in SCHEMA_MIGRATIONS[0][1]:
+        conn.execute(query)
+    conn.execute("INSERT INTO messages (useremail, role, content) VALUES ('a@x.com', 'user', 'oi')")
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(arquivo)
+
+    with db.get_connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_MIGRATIONS[-1][0]
+        indices = [row[1] for row in conn.execute("PRAGMA index_list(messages)")]
+    assert "idx_messages_useremail_id" in indices
+    assert db.load_messages("a@x.com") == [{"id": 1, "role": "user", "content": "oi"}]
@@ -0,0 +1,110 @@
+import pytest
+import sys
+import os
+import asyncio
+import random
+import shutil
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from nemoguardrails import LLMRails
+
+import moderation
+
+
+class ModeradorFake(BaseChatModel):
+    """Responde ao self check input bloqueando mensagens com 'proibido', com latência aleatória."""
+
+    chamadas: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "moderador-fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.chamadas += 1
+        await asyncio.sleep(random.uniform(0.0, 0.05))
+        prompt = messages[-1].content
+        bloquear = "Should the user message be blocked" in prompt and "proibido" in prompt
+        texto = "Yes" if bloquear else "No"
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=texto))])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tamanho", [1, 4])
+async def test_vereditos_concorrentes_correspondem_a_cada_entrada(monkeypatch, tamanho):
+    llm = ModeradorFake()
+    pool = moderation.RailsPool(lambda: LLMRails(moderation.rails_config, llm=llm), tamanho=tamanho)
+    monkeypatch.setattr(moderation, "rails_pool", pool)
+    monkeypatch.setattr(moderation, "moderation_cache", moderation.ModerationCache(moderation.RAILS_CONFIG_PATH))
+
+    entradas = [f"mensagem proibido {i}" if i % 3 == 0 else f"mensagem comum {i}" for i in range(24)]
+    random.shuffle(entradas)
+
+    vereditos = await asyncio.gather(
+        *[moderation.guard_moderation_async(entrada, bot=False) for entrada in entradas]
+    )
+
+    for entrada, aprovado in zip(entradas, vereditos):
+        assert aprovado == ("proibido" not in entrada), entrada
+    assert pool._criadas <= tamanho
+
+
+@pytest.mark.asyncio
+async def test_falha_da_fabrica_nao_reduz_o_pool():
+    falhas = [True, True, True]
+
+    def fabrica():
+        if falhas and falhas.pop():
+            raise ConnectionError("configuração indisponível")
+        return object()
+
+    pool = moderation.RailsPool(fabrica, tamanho=2)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            async with pool.checkout():
+                pass
+    assert pool._criadas == 0
+
+    # Após as falhas, o pool ainda cria e empresta até `tamanho` instâncias
+    async with pool.checkout() as primeira, pool.checkout() as segunda:
+        assert primeira is not segunda
+    assert pool._criadas == 2
+
+
+@pytest.mark.asyncio
+async def test_vereditos_repetidos_vem_do_cache(monkeypatch):
+    llm = ModeradorFake()
+    pool = moderation.RailsPool(lambda: LLMRails(moderation.rails_config, llm=llm), tamanho=1)
+    monkeypatch.setattr(moderation, "rails_pool", pool)
+    monkeypatch.setattr(moderation, "moderation_cache", moderation.ModerationCache(moderation.RAILS_CONFIG_PATH))
+
+    assert await moderation.guard_moderation_async("Oi", bot=False)
+    assert not await moderation.guard_moderation_async("algo proibido", bot=False)
+    chamadas = llm.chamadas
+
+    assert await moderation.guard_moderation_async("  oi ", bot=False)
+    assert not await moderation.guard_moderation_async("algo proibido", bot=False)
+    assert llm.chamadas == chamadas
+
+
+def test_alteracao_da_configuracao_invalida_o_cache(tmp_path):
+    config = tmp_path / "config"
+    shutil.copytree(moderation.RAILS_CONFIG_PATH, config)
+    cache = moderation.ModerationCache(str(config), intervalo_verificacao=0)
+    cache.set("oi", bot=False, aprovado=True)
+
+    assert not cache.configuracao_alterada()
+    assert cache.get("oi", bot=False) is True
+    assert cache.get("oi", bot=True) is None
+
+    with open(config / "rails" / "blocked_terms.co", "a", encoding="utf-8") as arquivo:
+        arquivo.write("\n")
+    assert cache.configuracao_alterada()
+    assert cache.get("oi", bot=False) is None
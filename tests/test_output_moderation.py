@@ -0,0 +1,169 @@
+import pytest
+import sys
+import os
+import asyncio
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from nemoguardrails import LLMRails
+
+import genai_pb2
+import moderation
+import server
+from cache import ResponseCache
+from moderation import OutputModerator, SaidaBloqueadaError
+
+
+class Gerador:
+    """Emite tokens com latência artificial, contando quantos foram consumidos."""
+
+    def __init__(self, tokens, latencia=0.0):
+        self.tokens = tokens
+        self.latencia = latencia
+        self.consumidos = 0
+
+    async def __call__(self):
+        for token in self.tokens:
+            await asyncio.sleep(self.latencia)
+            self.consumidos += 1
+            yield token
+
+
+def moderador(latencia=0.0, proibido=None):
+    janelas = []
+
+    async def moderar(texto):
+        janelas.append(texto)
+        await asyncio.sleep(latencia)
+        return proibido is None or proibido not in texto
+    moderar.janelas = janelas
+    return moderar
+
+
+def tokens_de(texto):
+    return [texto[i:i + 3] for i in range(0, len(texto), 3)]
+
+
+@pytest.mark.asyncio
+async def test_resposta_aprovada_e_moderada_em_janelas():
+    texto = " ".join(f"palavra{i}" for i in range(60))
+    moderar = moderador()
+
+    trechos = [t async for t in OutputModerator(moderar, janela=100, sobreposicao=20)
+               .moderar(Gerador(tokens_de(texto))())]
+
+    assert "".join(trechos) == texto
+    assert 4 <= len(moderar.janelas) <= 7
+    assert all(palavra in " ".join(moderar.janelas) for palavra in texto.split())
+
+
+@pytest.mark.asyncio
+async def test_termo_bloqueado_dividido_entre_tokens_nao_e_emitido():
+    gerador = Gerador(["Este é um segredo ", "indus", "trial da ", "empresa."])
+    emitidos = []
+
+    with pytest.raises(SaidaBloqueadaError) as erro:
+        async for trecho in OutputModerator(moderador()).moderar(gerador()):
+            emitidos.append(trecho)
+
+    assert erro.value.motivo == "termos"
+    assert "industrial" not in "".join(emitidos)
+    assert gerador.consumidos < len(gerador.tokens)
+
+
+@pytest.mark.asyncio
+async def test_reprovacao_do_llm_interrompe_a_geracao():
+    texto = "texto comum " * 10 + "PROIBIDO " + "texto comum " * 200
+    gerador = Gerador(tokens_de(texto), latencia=0.005)
+
+    with pytest.raises(SaidaBloqueadaError) as erro:
+        async for _ in OutputModerator(moderador(0.02, "PROIBIDO"), janela=60).moderar(gerador()):
+            pass
+
+    assert erro.value.motivo == "llm"
+    assert gerador.consumidos < len(gerador.tokens) / 2
+
+
+@pytest.mark.asyncio
+async def test_caminho_feliz_espera_apenas_a_ultima_janela():
+    latencia_moderacao = 0.1
+    gerador = Gerador(tokens_de("resposta longa " * 40), latencia=0.005)
+    moderar = moderador(latencia_moderacao)
+
+    inicio = time.perf_counter()
+    async for _ in OutputModerator(moderar, janela=100).moderar(gerador()):
+        pass
+    decorrido = time.perf_counter() - inicio
+
+    geracao = len(gerador.tokens) * gerador.latencia
+    assert len(moderar.janelas) > 3
+    # Sequencial seria geração + uma moderação por janela
+    assert decorrido < geracao + 2 * latencia_moderacao
+
+
+@pytest.mark.asyncio
+async def test_stream_interrompido_nao_e_armazenado_no_cache(monkeypatch):
+    async def moderar(consulta, bot, pergunta=""):
+        return not (bot and "França" in consulta)
+
+    llm = FakeListChatModel(responses=["simples", "Paris é a capital da França."])
+    monkeypatch.setattr(server, "chain_registry", server.ChainRegistry(llm=llm))
+    monkeypatch.setattr(server, "guard_moderation_async", moderar)
+    monkeypatch.setattr(server, "response_cache", ResponseCache())
+
+    trechos = [c.chunk async for c in server.GenAiServiceServicer().AskQuestionStream(
+        genai_pb2.QuestionRequest(question="Qual a capital da França?"), None
+    )]
+
+    assert trechos[-1].endswith(server.MENSAGEM_SAIDA_BLOQUEADA)
+    assert server.response_cache.get("Qual a capital da França?") is None
+
+
+class ModeradorSaida(BaseChatModel):
+    """Responde ao 'self check output' bloqueando respostas com 'Lisboa'."""
+
+    prompts: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "moderador-saida-fake"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = messages[-1].content
+        self.prompts.append(prompt)
+        bloquear = "Should the message be blocked" in prompt and "Lisboa" in prompt
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="Yes" if bloquear else "No"))])
+
+
+@pytest.mark.asyncio
+async def test_moderacao_de_saida_pelos_rails_de_saida(monkeypatch):
+    moderador = ModeradorSaida()
+
+    def criar_rails():
+        rails = LLMRails(moderation.rails_config, llm=moderador)
+        rails.register_action(moderation.check_blocked_terms, name="check_blocked_terms")
+        return rails
+
+    monkeypatch.setattr(moderation, "rails_pool", moderation.RailsPool(criar_rails, tamanho=1))
+    monkeypatch.setattr(moderation, "moderation_cache", moderation.ModerationCache(moderation.RAILS_CONFIG_PATH))
+    monkeypatch.setattr(server, "chain_registry", server.ChainRegistry(llm=FakeListChatModel(
+        responses=["simples", "A capital da França é Paris.", "simples", "A capital de Portugal é Lisboa."]
+    )))
+    monkeypatch.setattr(server, "response_cache", ResponseCache())
+    monkeypatch.setattr(server, "pre_classificador", None)
+
+    # Apenas a moderação de saída passa pelos rails (sem stub de `guard_moderation_async`)
+    resposta = await server.executar_suporte_ao_cliente("Qual a capital da França?")
+    assert resposta["resposta"] == "A capital da França é Paris."
+    assert any("A capital da França é Paris." in p for p in moderador.prompts)
+
+    with pytest.raises(SaidaBloqueadaError):
+        await server.executar_suporte_ao_cliente("E a de Portugal?")
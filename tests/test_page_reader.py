@@ -0,0 +1,181 @@
+import pytest
+import sys
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from page_reader import PageReader, dividir_passagens
+from search_context import SearchContextBuilder
+
+ARTIGO = """<!DOCTYPE html>
+<html><head><title>Copom mantém a Selic</title>
+<style>body { color: red; }</style>
+<script>var rastreamento = "não deve aparecer no texto";</script></head>
+<body>
+<nav><a href="/">Início</a> <a href="/economia">Economia e mercados em tempo real</a></nav>
+<article>
+<h1>Copom mantém a taxa Selic em 10,5% ao ano</h1>
+<p>O Comitê de Política Monetária do Banco Central manteve nesta quarta-feira a taxa
+Selic em 10,5% ao ano, em decisão unânime.</p>
+<p>Segundo o comunicado, a inflação de serviços e as expectativas desancoradas
+justificam a cautela na condução da política de juros.</p>
+<p>Compartilhe</p>
+</article>
+<footer>Todos os direitos reservados a este portal de notícias de exemplo.</footer>
+</body></html>""".encode("utf-8")
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Servidor local que substitui os sites dos resultados de pesquisa."""
+
+    contagem = {}
+
+    def do_GET(self):
+        Handler.contagem[self.path] = Handler.contagem.get(self.path, 0) + 1
+        if self.path == "/artigo":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self._responder(ARTIGO, etag='"v1"')
+        elif self.path == "/lenta":
+            time.sleep(1)
+            self._responder(ARTIGO)
+        elif self.path == "/grande":
+            paragrafo = b"<p>" + b"palavra de texto longo repetida " * 20 + b"</p>"
+            self._responder(b"<html><body>" + paragrafo * 2000 + b"</body></html>")
+        elif self.path == "/arquivo.pdf":
+            self._responder(b"%PDF-1.4", tipo="application/pdf")
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def _responder(self, corpo, tipo="text/html; charset=utf-8", etag=None):
+        self.send_response(200)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        try:
+            self.wfile.write(corpo)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_address[1]}"
+    servidor.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def zerar_contagem():
+    Handler.contagem.clear()
+
+
+@pytest.mark.asyncio
+async def test_texto_extraido_sem_scripts_e_navegacao(base_url, tmp_path):
+    leitor = PageReader(diretorio_cache=str(tmp_path))
+
+    pagina = await leitor.ler(f"{base_url}/artigo")
+    await leitor.aclose()
+
+    assert pagina["titulo"] == "Copom mantém a Selic"
+    assert pagina["paragrafos"][0] == "Copom mantém a taxa Selic em 10,5% ao ano"
+    texto = " ".join(pagina["paragrafos"])
+    assert "inflação de serviços" in texto
+    for ausente in ("rastreamento", "color", "Economia e mercados", "direitos reservados", "Compartilhe"):
+        assert ausente not in texto
+
+
+@pytest.mark.asyncio
+async def test_cache_em_disco_revalidado_pelo_etag(base_url, tmp_path):
+    url = f"{base_url}/artigo"
+    primeira = await PageReader(diretorio_cache=str(tmp_path)).ler(url)
+
+    # Dentro da validade: outro processo usa o texto em disco sem acessar a rede
+    assert await PageReader(diretorio_cache=str(tmp_path)).ler(url) == primeira
+    assert Handler.contagem[url[len(base_url):]] == 1
+
+    # Expirado: requisição condicional com o ETag, respondida com 304
+    leitor = PageReader(diretorio_cache=str(tmp_path), validade_cache=0)
+    revalidada = await leitor.ler(url)
+    await leitor.aclose()
+    assert revalidada["paragrafos"] == primeira["paragrafos"]
+    assert Handler.contagem["/artigo"] == 2
+
+
+@pytest.mark.asyncio
+async def test_prazo_limite_de_bytes_e_tipos(base_url, tmp_path):
+    leitor = PageReader(prazo=0.3, max_bytes=20_000, diretorio_cache=str(tmp_path))
+    resultados = [
+        {"title": "Lenta", "body": "", "href": f"{base_url}/lenta"},
+        {"title": "Artigo", "body": "", "href": f"{base_url}/artigo"},
+        {"title": "PDF", "body": "", "href": f"{base_url}/arquivo.pdf"},
+        {"title": "Ausente", "body": "", "href": f"{base_url}/ausente"},
+    ]
+
+    inicio = time.perf_counter()
+    passagens = await leitor.passagens(resultados)
+    grande = await leitor.ler(f"{base_url}/grande")
+    await leitor.aclose()
+
+    # A página lenta, o PDF e o 404 não geram passagens nem atrasam as demais
+    assert time.perf_counter() - inicio < 0.9
+    assert {p["href"] for p in passagens} == {f"{base_url}/artigo"}
+    assert sum(len(p) for p in grande["paragrafos"]) < 20_000
+
+
+@pytest.mark.asyncio
+async def test_melhores_passagens_no_contexto(base_url, tmp_path):
+    leitor = PageReader(diretorio_cache=str(tmp_path), palavras_por_passagem=25)
+    passagens = await leitor.passagens([{"title": "Selic", "body": "", "href": f"{base_url}/artigo"}])
+    await leitor.aclose()
+
+    assert len(passagens) > 1
+    contexto = SearchContextBuilder(orcamento=60, min_tokens_trecho=10).construir(
+        "por que a inflação de serviços justifica cautela", passagens
+    )
+    assert "inflação de serviços" in contexto
+    assert contexto.count(f"{base_url}/artigo") == 1
+
+
+def test_passagens_limitadas_em_palavras():
+    paragrafos = ["um dois três quatro", "cinco seis sete", " ".join(["longo"] * 12)]
+    passagens = dividir_passagens(paragrafos, palavras_por_passagem=8)
+
+    assert passagens[0] == "um dois três quatro cinco seis sete"
+    assert all(len(p.split()) <= 8 for p in passagens)
+    assert sum(len(p.split()) for p in passagens) == 19
+
+
+@pytest.mark.asyncio
+async def test_pesquisa_com_leitura_de_paginas(base_url, tmp_path, monkeypatch):
+    import server
+    from search import OfflineIndexProvider, WebSearchService
+
+    indice = OfflineIndexProvider([
+        {"title": "Copom decide Selic", "body": "Copom decide a Selic hoje", "href": f"{base_url}/artigo"},
+        {"title": "Selic em pauta", "body": "Analistas comentam a Selic e o Copom", "href": f"{base_url}/lenta"},
+    ])
+    leitor = PageReader(prazo=0.3, diretorio_cache=str(tmp_path))
+    monkeypatch.setattr(server, "search_service", WebSearchService(indice))
+    monkeypatch.setattr(server, "page_reader", leitor)
+    monkeypatch.setattr(server, "search_context_builder", SearchContextBuilder())
+
+    contexto = await server.web_search_async("decisão do Copom sobre a Selic")
+    await leitor.aclose()
+
+    # A página lida substitui o trecho; a lenta mantém o trecho da pesquisa
+    assert "decisão unânime" in contexto
+    assert "Copom decide a Selic hoje" not in contexto
+    assert "Analistas comentam a Selic e o Copom" in contexto
@@ -0,0 +1,230 @@
+import pytest
+import sys
+import os
+import tempfile
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+# O módulo cria um DatabaseManager na importação: mantém o banco e o log fora do repositório
+_TMP = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_FILE", os.path.join(_TMP, "database.db"))
+os.environ.setdefault("AUTH_LOG_FILE", os.path.join(_TMP, "autheticate.log"))
+
+import genai_pb2
+import server
+from authenticate import DatabaseManager
+from quota import QuotaService
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / "chat.db"))
+    for email in ("a@x.com", "b@x.com"):
+        db.add_user(email)
+        db.initialize_message_limit(email)
+    return db
+
+
+@contextmanager
+def rastrear_consultas(db):
+    """Registra as instruções SQL executadas nas conexões do pool."""
+    instrucoes = []
+    conexoes = [db.pool._livres.get_nowait() for _ in range(db.pool._livres.qsize())]
+    for conn in conexoes:
+        conn.set_trace_callback(instrucoes.append)
+        db.pool._livres.put(conn)
+    try:
+        yield instrucoes
+    finally:
+        for conn in conexoes:
+            conn.set_trace_callback(None)
+
+
+def test_cota_verificada_em_memoria(db):
+    quota = QuotaService(limite=3, storage=db, lote_flush=1000)
+    assert quota.carregar("a@x.com")
+
+    with rastrear_consultas(db) as instrucoes:
+        resultados = [quota.consumir("a@x.com") for _ in range(5)]
+
+    assert resultados == [True, True, True, False, False]
+    assert instrucoes == []
+    assert quota.restante("a@x.com") == 0
+
+
+def test_flush_grava_lote_em_uma_transacao(db):
+    quota = QuotaService(limite=10, storage=db)
+    for email in ("a@x.com", "b@x.com"):
+        quota.carregar(email)
+    for _ in range(3):
+        quota.consumir("a@x.com")
+    quota.consumir("b@x.com")
+
+    with rastrear_consultas(db) as instrucoes:
+        assert quota.flush() == 2
+    assert sum(1 for sql in instrucoes if sql.strip().upper() == "COMMIT") == 1
+    assert db.get_message_limit("a@x.com") == (True, 3)
+    assert db.get_message_limit("b@x.com") == (True, 1)
+    assert quota.flush() == 0
+
+
+def test_contador_existente_carregado_do_banco(db):
+    db.update_message_counter("a@x.com", 9)
+    quota = QuotaService(limite=10, storage=db)
+    quota.carregar("a@x.com")
+
+    assert quota.consumir("a@x.com")
+    assert not quota.consumir("a@x.com")
+
+
+def test_recarga_devolve_mensagens_com_o_tempo(db):
+    relogio = Relogio()
+    quota = QuotaService(limite=2, recarga_por_hora=60, storage=db, relogio=relogio)
+    quota.carregar("a@x.com")
+    assert quota.consumir("a@x.com") and quota.consumir("a@x.com")
+    assert not quota.consumir("a@x.com")
+
+    relogio.agora += 60  # Uma mensagem por minuto
+    assert quota.consumir("a@x.com")
+    quota.flush()
+    assert db.get_message_limit("a@x.com")[1] == 2
+
+
+
+def test_baldes_ociosos_descartados_apos_flush(db):
+    relogio = Relogio()
+    quota = QuotaService(limite=10, storage=db, ociosidade=60, relogio=relogio)
+    for email in ("a@x.com", "b@x.com"):
+        quota.carregar(email)
+    quota.consumir("a@x.com")
+    relogio.agora += 120
+    quota.consumir("b@x.com")  # Uso recente: permanece em memória
+
+    assert quota.flush() == 2
+    assert not quota.carregado("a@x.com")
+    assert quota.carregado("b@x.com")
+
+    # A próxima requisição relê o contador gravado
+    db.update_message_counter("a@x.com", 4)  # Consumo de outro processo
+    assert quota.carregar("a@x.com")
+    assert quota.restante("a@x.com") == 5
+
+
+def test_baldes_pendentes_nao_sao_descartados(db):
+    quota = QuotaService(limite=10, storage=db, max_usuarios=1)
+    for email in ("a@x.com", "b@x.com"):
+        quota.carregar(email)
+    quota.consumir("a@x.com")
+    quota.consumir("b@x.com")
+    db.adjust_message_counters = lambda deltas: False  # Banco indisponível
+
+    assert quota.flush() == 0
+    assert quota.carregado("a@x.com") and quota.carregado("b@x.com")
+
+    del db.adjust_message_counters
+    assert quota.flush() == 2
+    # Limite de baldes em memória: descarta o usado há mais tempo
+    assert not quota.carregado("a@x.com")
+    assert quota.carregado("b@x.com")
+    assert db.get_message_limit("a@x.com") == (True, 1)
+
+
+@pytest.mark.asyncio
+async def test_usuario_nao_registrado_ou_vazio_negado(db):
+    quota = QuotaService(limite=5, storage=db)
+    assert not await quota.verificar("")
+    assert not await quota.verificar("desconhecido@x.com")
+    assert await quota.verificar("a@x.com")
+
+
+class ContextoFalso:
+    """Reproduz `ServicerContext.abort`, que encerra a chamada com o status informado."""
+
+    async def abort(self, codigo, detalhes):
+        raise RecusaGrpc(codigo, detalhes)
+
+
+class RecusaGrpc(Exception):
+    def __init__(self, codigo, detalhes):
+        super().__init__(detalhes)
+        self.codigo = codigo
+
+
+@pytest.mark.asyncio
+async def test_servidor_recusa_pergunta_sem_cota(db, monkeypatch):
+    chamadas = []
+
+    async def responder(consulta, historico="", resultados=None):
+        chamadas.append(consulta)
+        return {"categoria": "simples", "resposta": "ok"}
+
+    quota = QuotaService(limite=1, storage=db)
+    monkeypatch.setattr(server, "quota_service", quota)
+    monkeypatch.setattr(server, "responder_com_moderacao", responder)
+    servicer = server.GenAiServiceServicer()
+
+    respostas = [
+        (await servicer.AskQuestion(
+            genai_pb2.QuestionRequest(question="oi", user_email="a@x.com"), ContextoFalso())).answer
+        for _ in range(2)
+    ]
+    assert respostas == ["ok", server.MENSAGEM_COTA_ESGOTADA]
+    assert chamadas == ["oi"]
+
+    # Sem e-mail ou com e-mail desconhecido: status próprio, distinto da cota esgotada
+    for email in ("", "desconhecido@x.com"):
+        with pytest.raises(RecusaGrpc) as recusa:
+            await servicer.AskQuestion(genai_pb2.QuestionRequest(question="oi", user_email=email), ContextoFalso())
+        assert recusa.value.codigo == server.grpc.StatusCode.UNAUTHENTICATED
+        assert str(recusa.value) == server.MENSAGEM_NAO_AUTENTICADO
+
+    await quota.aclose()
+    assert db.get_message_limit("a@x.com")[1] == 1
+
+
+@pytest.mark.asyncio
+async def test_cota_devolvida_quando_a_requisicao_nao_e_concluida(db, monkeypatch):
+    async def bloquear(consulta, historico="", resultados=None):
+        raise server.ConteudoBloqueadoError()
+
+    async def falhar(consulta, historico="", resultados=None):
+        raise RuntimeError("LLM indisponível")
+        yield  # pragma: no cover
+
+    quota = QuotaService(limite=2, storage=db)
+    monkeypatch.setattr(server, "quota_service", quota)
+    monkeypatch.setattr(server, "responder_com_moderacao", bloquear)
+    monkeypatch.setattr(server, "responder_com_moderacao_stream", falhar)
+    servicer = server.GenAiServiceServicer()
+    pedido = genai_pb2.QuestionRequest(question="oi", user_email="a@x.com")
+
+    for _ in range(3):
+        resposta = await servicer.AskQuestion(pedido, ContextoFalso())
+        assert resposta.answer == server.MENSAGEM_BLOQUEIO
+        trechos = [t.chunk async for t in servicer.AskQuestionStream(pedido, ContextoFalso())]
+        assert trechos[0].startswith("Erro ao processar")
+    assert quota.restante("a@x.com") == 2
+
+    # Stream encerrado pelo cliente antes do fim também devolve a mensagem
+    async def lento(consulta, historico="", resultados=None):
+        yield "Olá"
+        yield "!"
+
+    monkeypatch.setattr(server, "responder_com_moderacao_stream", lento)
+    stream = servicer.AskQuestionStream(pedido, ContextoFalso())
+    assert (await stream.__anext__()).chunk == "Olá"
+    assert quota.restante("a@x.com") == 1
+    await stream.aclose()
+    assert quota.restante("a@x.com") == 2
+
+    await quota.aclose()
+    assert db.get_message_limit("a@x.com")[1] == 0
@@ -0,0 +1,63 @@
+import pytest
+import sys
+import os
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+# O módulo cria um DatabaseManager na importação: mantém o banco e o log fora do repositório
+_TMP = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_FILE", os.path.join(_TMP, "database.db"))
+os.environ.setdefault("AUTH_LOG_FILE", os.path.join(_TMP, "autheticate.log"))
+
+from authenticate import DatabaseManager, MessageService
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / "chat.db"))
+    db.add_user("a@x.com")
+    db.initialize_message_limit("a@x.com")
+    return db
+
+
+def test_turno_gravado_com_um_unico_commit(db):
+    instrucoes = []
+    with db.get_connection() as conn:
+        conn.set_trace_callback(instrucoes.append)
+    try:
+        assert db.record_turn("a@x.com", "pergunta", "resposta") == 1
+    finally:
+        with db.get_connection() as conn:
+            conn.set_trace_callback(None)
+
+    assert sum(1 for sql in instrucoes if sql.strip().upper() == "COMMIT") == 1
+    assert [m["content"] for m in db.load_messages("a@x.com")] == ["pergunta", "resposta"]
+    assert db.get_message_limit("a@x.com") == (True, 1)
+
+
+def test_usuario_sem_cota_nao_grava_nada(db):
+    db.add_user("b@x.com")
+    assert db.record_turn("b@x.com", "pergunta", "resposta") is None
+    assert db.load_messages("b@x.com") == []
+
+
+def test_contador_exato_com_sessoes_paralelas(db):
+    servico = MessageService(db)
+    n_sessoes, turnos = 8, 25
+    barreira = threading.Barrier(n_sessoes)
+
+    def sessao(n):
+        barreira.wait()
+        for i in range(turnos):
+            servico.record_turn("a@x.com", f"p{n}-{i}", f"r{n}-{i}")
+
+    threads = [threading.Thread(target=sessao, args=(n,)) for n in range(n_sessoes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert db.get_message_limit("a@x.com")[1] == n_sessoes * turnos
+    assert len(db.load_messages("a@x.com")) == 2 * n_sessoes * turnos
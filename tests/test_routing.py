@@ -0,0 +1,131 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import server
+from metrics import metrics
+from routing import ModelRouter
+
+CONFIG = {
+    "default": {"model": "grande", "temperature": 0},
+    "providers": {"local": {"base_url": "http://localhost:11434/v1"}},
+    "categories": {
+        "simples": {"provider": "local", "model": "pequeno", "fallback": True},
+        "complexa": {"model": "maior", "temperature": 0.3},
+    },
+    "nodes": {"categorize": {"model": "pequeno-nuvem", "max_tokens": 5}},
+    "prices": {"grande": {"input": 1.0, "output": 2.0}},
+}
+
+
+class ModeloFalso(FakeListChatModel):
+    """Modelo falso que pode simular um endpoint indisponível."""
+
+    falhar: bool = False
+
+    async def _agenerate(self, *args, **kwargs):
+        if self.falhar:
+            raise ConnectionError("endpoint local indisponível")
+        return await super()._agenerate(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        if self.falhar:
+            raise ConnectionError("endpoint local indisponível")
+        async for trecho in super()._astream(*args, **kwargs):
+            yield trecho
+
+
+async def _aprovar(consulta, bot, pergunta=""):
+    return True
+
+
+class RegistroFalso(server.ChainRegistry):
+    """Cria modelos falsos no lugar do ChatOpenAI."""
+
+    def __init__(self, roteador, respostas, local_indisponivel=False):
+        super().__init__(roteador=roteador)
+        self.respostas = respostas
+        self.local_indisponivel = local_indisponivel
+
+    def _criar_modelo(self, rota, callbacks):
+        return ModeloFalso(responses=self.respostas[rota["model"]], callbacks=callbacks,
+                           falhar=self.local_indisponivel and rota["provider"] == "local")
+
+
+def test_rota_por_no_e_categoria(monkeypatch):
+    roteador = ModelRouter(CONFIG)
+
+    assert roteador.resolver("summarize")["model"] == "grande"
+    assert roteador.resolver("categorize") == {
+        "provider": "openai", "model": "pequeno-nuvem", "temperature": 0, "max_tokens": 5,
+    }
+    simples = roteador.resolver("handle_technical", "simples")
+    assert (simples["model"], simples["base_url"]) == ("pequeno", "http://localhost:11434/v1")
+    assert roteador.resolver("handle_web_search", "complexa")["temperature"] == 0.3
+
+    # Variáveis de ambiente sobrescrevem o arquivo, com o provedor opcional
+    monkeypatch.setenv("LLM_ROUTE_SIMPLES", "openai/gpt-4o-mini")
+    monkeypatch.setenv("LLM_ROUTE_SUMMARIZE", "outro")
+    assert roteador.resolver("handle_technical", "simples")["provider"] == "openai"
+    assert roteador.resolver("summarize")["model"] == "outro"
+
+    with pytest.raises(ValueError):
+        ModelRouter({"nodes": {"categorize": {"provider": "inexistente"}}})
+    with pytest.raises(ValueError):
+        ModelRouter({"nodes": {"categorize": {"modelo": "errado"}}})
+
+
+def test_sem_arquivo_usa_o_modelo_padrao(tmp_path):
+    roteador = ModelRouter.from_yaml(str(tmp_path / "ausente.yml"), modelo_padrao="gpt-4o-mini")
+    assert {roteador.resolver(no)["model"] for no in server.ChainRegistry.PROMPTS} == {"gpt-4o-mini"}
+
+    arquivo = os.path.join(os.path.dirname(__file__), "..", "model_routes.yml")
+    roteador = ModelRouter.from_yaml(arquivo, modelo_padrao="gpt-4o-mini")
+    assert roteador.resolver("handle_web_search", "complexa")["model"] == "gpt-4o"
+
+
+def test_registro_cria_modelos_por_rota():
+    registro = server.ChainRegistry(roteador=ModelRouter(CONFIG))
+
+    local = registro.get("handle_technical", "simples").last.runnable
+    assert (local.model_name, str(local.openai_api_base)) == ("pequeno", "http://localhost:11434/v1")
+    assert registro.get("categorize").last.max_tokens == 5
+    # Categoria inesperada do LLM usa a rota do nó
+    assert registro.get("handle_web_search", "complexa.") is registro.get("handle_web_search")
+    assert set(registro._http_clients) == {"openai", "local"}
+
+
+@pytest.mark.asyncio
+async def test_contabilizacao_e_reserva_por_rota(monkeypatch):
+    registro = RegistroFalso(ModelRouter(CONFIG), {
+        "pequeno-nuvem": ["simples"],
+        "pequeno": ["Olá! Tudo bem por aqui."],
+        "grande": ["Olá! Tudo bem por aqui, e com você?"],
+        "maior": ["resposta com pesquisa"],
+    }, local_indisponivel=True)
+    monkeypatch.setattr(server, "chain_registry", registro)
+    monkeypatch.setattr(server, "guard_moderation_async", _aprovar)
+    monkeypatch.setattr(server, "pre_classificador", None)
+    rota_local = {"rota": "handle_technical:simples", "modelo": "pequeno"}
+    rota_reserva = {"rota": "handle_technical:simples", "modelo": "grande"}
+    rota_categorize = {"rota": "categorize", "modelo": "pequeno-nuvem"}
+    series = [
+        ("chat_x_llm_requests_total", rota_categorize),
+        ("chat_x_llm_errors_total", rota_local),
+        ("chat_x_llm_requests_total", rota_reserva),
+        ("chat_x_llm_streamed_requests_total", rota_reserva),
+    ]
+    antes = [metrics.get(nome, labels) for nome, labels in series]
+    custo = metrics.get("chat_x_llm_cost_usd_total", rota_reserva)
+
+    trechos = [t async for t in server.gerar_resposta("oi, tudo bem?", None, {})]
+
+    # O endpoint local falhou e o modelo padrão respondeu, com a resposta em streaming
+    assert "".join(trechos) == "Olá! Tudo bem por aqui, e com você?"
+    assert [metrics.get(nome, labels) for nome, labels in series] == [n + 1 for n in antes]
+    assert metrics.get("chat_x_llm_prompt_tokens_total", rota_reserva) > 0
+    assert metrics.get("chat_x_llm_cost_usd_total", rota_reserva) > custo
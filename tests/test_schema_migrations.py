@@ -0,0 +1,105 @@
+import pytest
+import sys
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+# O módulo cria um DatabaseManager na importação: mantém o banco e o log fora do repositório
+_TMP = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_FILE", os.path.join(_TMP, "database.db"))
+os.environ.setdefault("AUTH_LOG_FILE", os.path.join(_TMP, "autheticate.log"))
+
+import authenticate
+from auth import AuthManager
+from message_handler import MessageHandler
+
+DDL = ("CREATE", "ALTER", "DROP", "PRAGMA USER_VERSION =")
+
+
+@pytest.fixture
+def instrucoes(monkeypatch, tmp_path):
+    """Usa um banco isolado e registra as instruções de esquema executadas."""
+    monkeypatch.setattr(authenticate, "DATABASE_FILE", str(tmp_path / "chat.db"))
+    executadas = []
+    original = authenticate.DatabaseManager.get_connection
+
+    def registrar(sql):
+        if sql.lstrip().upper().startswith(DDL):
+            executadas.append(sql)
+
+    @contextmanager
+    def rastrear(self):
+        with original(self) as conn:
+            conn.set_trace_callback(registrar)
+            try:
+                yield conn
+            finally:
+                conn.set_trace_callback(None)
+
+    monkeypatch.setattr(authenticate.DatabaseManager, "get_connection", rastrear)
+    return executadas
+
+
+def test_migracoes_executadas_uma_vez_em_100_reruns(instrucoes):
+    for _ in range(100):
+        # Cada rerun do Streamlit constrói um AuthManager e um MessageHandler
+        auth_manager = AuthManager()
+        handler = MessageHandler("a@x.com")
+
+    # Uma instrução por tabela/índice e um registro de versão por migração
+    esperadas = sum(len(queries) + 1 for _, queries in authenticate.SCHEMA_MIGRATIONS)
+    assert len(instrucoes) == esperadas
+    assert auth_manager.db_manager is handler.db_manager
+
+
+def test_versao_registrada_evita_ddl_em_novo_processo(instrucoes, tmp_path):
+    authenticate.DatabaseManager(str(tmp_path / "chat.db"))
+    instrucoes.clear()
+
+    # Simula outro processo: o banco já está na versão atual e não recebe DDL
+    authenticate._migrated_databases.discard(str(tmp_path / "chat.db"))
+    manager = authenticate.DatabaseManager(str(tmp_path / "chat.db"))
+
+    assert instrucoes == []
+    with manager.get_connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == authenticate.SCHEMA_VERSION
+
+
+def test_migracao_pendente_aplicada_sobre_esquema_antigo(tmp_path):
+    db_file = str(tmp_path / "antigo.db")
+    conn = sqlite3.connect(db_file)
+    for query in authenticate.SCHEMA_MIGRATIONS[0][1]:
+        conn.execute(query)
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    conn.close()
+
+    manager = authenticate.DatabaseManager(db_file)
+
+    with manager.get_connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == authenticate.SCHEMA_VERSION
+        indices = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+    assert "idx_messages_useremail_id" in indices
+
+
+def test_migracao_com_falha_e_desfeita_por_inteiro(monkeypatch, tmp_path):
+    db_file = str(tmp_path / "falha.db")
+    authenticate.DatabaseManager(db_file)
+    monkeypatch.setattr(authenticate, "SCHEMA_MIGRATIONS", authenticate.SCHEMA_MIGRATIONS + [
+        (authenticate.SCHEMA_VERSION + 1, [
+            "CREATE TABLE parcial (id INTEGER)",
+            "ALTER TABLE inexistente ADD COLUMN x TEXT",
+        ]),
+    ])
+    manager = authenticate.DatabaseManager.__new__(authenticate.DatabaseManager)
+    manager.db_file, manager.logger, manager.pool = db_file, authenticate.logging.getLogger("teste"), None
+
+    assert manager.initialize_database() is False
+
+    # Nem a tabela criada antes da falha nem a nova versão foram confirmadas
+    with manager.get_connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == authenticate.SCHEMA_VERSION
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'parcial'").fetchone() is None
@@ -0,0 +1,214 @@
+import pytest
+import sys
+import os
+import asyncio
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import server
+from metrics import metrics
+from search import (
+    HedgedSearchProvider,
+    OfflineIndexProvider,
+    SearchError,
+    SearchProvider,
+    ThreadedSearchProvider,
+    WebSearchService,
+)
+
+DOCUMENTOS = [
+    {"title": "Eleições 2026", "body": "Resultado da eleição presidencial", "href": "https://a.com"},
+    {"title": "Previsão do tempo", "body": "Chuva em São Paulo amanhã", "href": "https://b.com"},
+    {"title": "Cotação", "body": "Dólar fecha em alta; euro estável", "href": "https://c.com"},
+]
+
+
+class ProvedorFalso(SearchProvider):
+    """Provedor de pesquisa falso, com latência e contagem de chamadas."""
+
+    def __init__(self, nome="falso", latencia=0.1, falhar=False, resultados=None, prazo=5.0):
+        super().__init__(nome, prazo)
+        self.latencia = latencia
+        self.falhar = falhar
+        self.resultados = resultados
+        self.chamadas = []
+
+    async def buscar(self, consulta, max_resultados=10):
+        self.chamadas.append(consulta)
+        await asyncio.sleep(self.latencia)
+        if self.falhar:
+            raise RuntimeError("provedor indisponível")
+        if self.resultados is not None:
+            return self.resultados
+        return [{"title": self.nome, "body": f"resultados para {consulta}", "href": "https://x.com"}]
+
+
+@pytest.mark.asyncio
+async def test_consultas_simultaneas_compartilham_uma_chamada():
+    provedor = ProvedorFalso()
+    servico = WebSearchService(provedor)
+    poupadas = metrics.get("chat_x_search_upstream_saved_total")
+
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(*[
+        servico.buscar("Resultado da eleição" if i % 2 else "resultado da eleicao?")
+        for i in range(20)
+    ])
+
+    assert len(provedor.chamadas) == 1
+    assert all(r == resultados[0] for r in resultados)
+    assert time.perf_counter() - inicio < 2 * provedor.latencia
+    assert metrics.get("chat_x_search_upstream_saved_total") == poupadas + 19
+
+
+@pytest.mark.asyncio
+async def test_resultado_reaproveitado_ate_expirar():
+    provedor = ProvedorFalso(latencia=0)
+    servico = WebSearchService(provedor, ttl=0.2)
+
+    await servico.buscar("cotação do dólar")
+    await servico.buscar("Cotação do  dólar")
+    assert len(provedor.chamadas) == 1
+
+    await asyncio.sleep(0.25)
+    await servico.buscar("cotação do dólar")
+    assert len(provedor.chamadas) == 2
+
+    await servico.buscar("cotação do euro")
+    assert len(provedor.chamadas) == 3
+
+
+@pytest.mark.asyncio
+async def test_falha_repassada_e_nao_armazenada():
+    provedor = ProvedorFalso(latencia=0.05, falhar=True)
+    servico = WebSearchService(provedor)
+
+    resultados = await asyncio.gather(
+        *[servico.buscar("notícias de hoje") for _ in range(5)], return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in resultados)
+    assert len(provedor.chamadas) == 1
+
+    provedor.falhar = False
+    assert (await servico.buscar("notícias de hoje"))[0]["body"] == "resultados para notícias de hoje"
+    assert len(provedor.chamadas) == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelamento_nao_interrompe_chamada_compartilhada():
+    provedor = ProvedorFalso(latencia=0.1)
+    servico = WebSearchService(provedor)
+
+    primeira = asyncio.create_task(servico.buscar("previsão do tempo"))
+    await asyncio.sleep(0.01)
+    segunda = asyncio.create_task(servico.buscar("previsão do tempo"))
+    await asyncio.sleep(0.01)
+    primeira.cancel()
+
+    assert (await segunda)[0]["body"] == "resultados para previsão do tempo"
+    assert len(provedor.chamadas) == 1
+
+
+@pytest.mark.asyncio
+async def test_indice_offline():
+    indice = OfflineIndexProvider(DOCUMENTOS)
+
+    resultados = await indice.buscar("qual a cotação do dólar hoje?")
+    assert resultados[0]["href"] == "https://c.com"
+    assert len(await indice.buscar("cotação do dólar", max_resultados=1)) == 1
+    assert await indice.buscar("futebol") == []
+
+
+@pytest.mark.asyncio
+async def test_provedor_lento_dispara_reserva():
+    lento = ProvedorFalso("lento", latencia=1.0)
+    rapido = ProvedorFalso("rapido", latencia=0.01)
+    combinado = HedgedSearchProvider([lento, rapido], atraso_hedge=0.05)
+
+    inicio = time.perf_counter()
+    resultados = await combinado.buscar("eleição")
+
+    assert resultados[0]["title"] == "rapido"
+    assert time.perf_counter() - inicio < 0.5
+    assert len(lento.chamadas) == len(rapido.chamadas) == 1
+
+
+@pytest.mark.asyncio
+async def test_falha_ou_prazo_aciona_o_proximo_provedor():
+    com_falha = ProvedorFalso("falha", latencia=0, falhar=True)
+    sem_prazo = ProvedorFalso("lento", latencia=1.0, prazo=0.05)
+    vazio = ProvedorFalso("vazio", latencia=0, resultados=[])
+    reserva = ProvedorFalso("reserva", latencia=0)
+    combinado = HedgedSearchProvider([com_falha, sem_prazo, vazio, reserva], atraso_hedge=10)
+
+    inicio = time.perf_counter()
+    assert (await combinado.buscar("eleição"))[0]["title"] == "reserva"
+    assert time.perf_counter() - inicio < 0.5
+
+    with pytest.raises(SearchError):
+        await HedgedSearchProvider([com_falha, sem_prazo], atraso_hedge=10).buscar("eleição")
+    assert await HedgedSearchProvider([com_falha, vazio]).buscar("eleição") == []
+
+
+@pytest.mark.asyncio
+async def test_provedor_bloqueante_saturado_nao_acumula_chamadas():
+    liberar = threading.Event()
+    chamadas = []
+
+    def travada(consulta, max_resultados):
+        chamadas.append(consulta)
+        liberar.wait(5)
+        return [{"title": "travada", "body": consulta, "href": "https://x.com"}]
+
+    bloqueante = ThreadedSearchProvider("travado", travada, prazo=0.05, max_simultaneas=1)
+    reserva = ProvedorFalso("reserva", latencia=0.2)
+    combinado = HedgedSearchProvider([bloqueante, reserva], atraso_hedge=10)
+    try:
+        # A chamada abandonada após o prazo continua ocupando a única thread
+        assert (await combinado.buscar("eleição"))[0]["title"] == "reserva"
+        assert bloqueante.saturado
+
+        # Novas chamadas são recusadas na hora, sem fila no executor
+        inicio = time.perf_counter()
+        assert (await combinado.buscar("previsão"))[0]["title"] == "reserva"
+        assert time.perf_counter() - inicio < 0.3
+        assert chamadas == ["eleição"]
+
+        # Com a reserva saturada, o provedor lento não é duplicado (sem hedging)
+        pulados = metrics.get("chat_x_search_hedges_skipped_total")
+        lento_primeiro = HedgedSearchProvider([reserva, bloqueante], atraso_hedge=0.05)
+        assert (await lento_primeiro.buscar("cotação"))[0]["title"] == "reserva"
+        assert metrics.get("chat_x_search_hedges_skipped_total") > pulados
+        assert chamadas == ["eleição"]
+    finally:
+        liberar.set()
+    await asyncio.sleep(0.05)
+    assert not bloqueante.saturado
+
+
+@pytest.mark.asyncio
+async def test_pesquisa_lenta_responde_sem_pesquisa(monkeypatch):
+    prompts = []
+
+    class RegistraPrompts(FakeListChatModel):
+        async def _agenerate(self, messages, *args, **kwargs):
+            prompts.append(messages[-1].content)
+            return await super()._agenerate(messages, *args, **kwargs)
+
+    servico = WebSearchService(ProvedorFalso("lento", latencia=5.0))
+    monkeypatch.setattr(server, "search_service", servico)
+    monkeypatch.setattr(server, "SEARCH_LATENCY_BUDGET", 0.1)
+    monkeypatch.setattr(server, "chain_registry",
+                        server.ChainRegistry(llm=RegistraPrompts(responses=["resposta"])))
+
+    inicio = time.perf_counter()
+    estado = await server.handle_web_search({"query": "eleição", "history": ""})
+    await servico.aclose()
+
+    assert estado["resposta"] == "resposta"
+    assert time.perf_counter() - inicio < 1
+    assert server.SEM_RESULTADOS_PESQUISA in prompts[0]
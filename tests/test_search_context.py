@@ -0,0 +1,72 @@
+import pytest
+import sys
+import os
+import math
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from search_context import SearchContextBuilder
+
+
+def contar(texto):
+    """Contador determinístico (~4 caracteres por token), sem depender do tiktoken."""
+    return math.ceil(len(texto) / 4)
+
+
+def resultado(titulo, corpo, href):
+    return {"title": titulo, "body": corpo, "href": href}
+
+
+NOTICIA = ("O Banco Central manteve a taxa Selic em 10,5% ao ano nesta quarta-feira, "
+           "em decisão unânime do Copom, citando a inflação de serviços.")
+
+
+def test_duplicatas_removidas():
+    builder = SearchContextBuilder(contar=contar)
+    resultados = [
+        resultado("Copom mantém Selic", NOTICIA, "https://www.g1.com/selic"),
+        resultado("Copom mantém Selic", "Outro texto", "http://g1.com/selic/"),
+        resultado("Selic fica em 10,5%", NOTICIA.replace("nesta quarta-feira", "ontem"), "https://b.com"),
+        resultado("Dólar cai", "O dólar recuou após a decisão do Copom.", "https://c.com"),
+    ]
+
+    assert [r["href"] for r in builder.deduplicar(resultados)] == ["https://www.g1.com/selic", "https://c.com"]
+
+
+def test_resultados_ordenados_por_relevancia():
+    builder = SearchContextBuilder(contar=contar)
+    resultados = [
+        resultado("Receita de bolo", "Bolo de cenoura com cobertura de chocolate.", "https://a.com"),
+        resultado("Dólar cai", "O dólar recuou após a decisão do Copom.", "https://c.com"),
+        resultado("Copom mantém Selic", NOTICIA, "https://b.com"),
+    ]
+
+    contexto = builder.construir("qual a taxa Selic definida pelo Copom?", resultados)
+
+    assert contexto.index("https://b.com") < contexto.index("https://c.com")
+    assert "bolo" not in contexto.lower()
+
+
+def test_contexto_limitado_ao_orcamento():
+    builder = SearchContextBuilder(orcamento=120, min_tokens_trecho=10, contar=contar)
+    resultados = [
+        resultado(f"Selic {i}", f"Notícia {i} sobre a Selic: " + " ".join(
+            f"termo{i}x{j}" for j in range(20 + i)), f"https://site{i}.com")
+        for i in range(10)
+    ]
+
+    contexto = builder.construir("Selic", resultados)
+
+    assert contar(contexto) <= 120
+    assert contexto.count("https://") >= 2
+    assert contexto.rstrip().split("\n")[-2].endswith("…")
+
+
+def test_sem_termos_da_consulta_mantem_a_ordem():
+    builder = SearchContextBuilder(contar=contar)
+    resultados = [resultado("A", "primeiro texto", "https://a.com"),
+                  resultado("B", "segundo texto", "https://b.com")]
+
+    contexto = builder.construir("futebol", resultados)
+
+    assert contexto == "A\nprimeiro texto\nhttps://a.com\n---\nB\nsegundo texto\nhttps://b.com"
@@ -0,0 +1,115 @@
+import pytest
+import sys
+import os
+import asyncio
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import genai_pb2
+import server
+from cache import ResponseCache
+
+LATENCIA_MODERACAO = 0.2
+
+
+class LentoFakeLLM(FakeListChatModel):
+    """FakeListChatModel com latência artificial nas chamadas assíncronas."""
+
+    latencia: float = 0.2
+
+    async def _agenerate(self, *args, **kwargs):
+        await asyncio.sleep(self.latencia)
+        return await super()._agenerate(*args, **kwargs)
+
+
+def moderacao_lenta(aprovado: bool):
+    async def moderar(consulta, bot, pergunta=""):
+        if bot:
+            return True  # Moderação de saída fora da medição
+        await asyncio.sleep(LATENCIA_MODERACAO)
+        return aprovado
+    return moderar
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    llm = LentoFakeLLM(responses=["simples", "Paris."])
+    monkeypatch.setattr(server, "chain_registry", server.ChainRegistry(llm=llm))
+    monkeypatch.setattr(server, "response_cache", ResponseCache())
+    return llm
+
+
+async def _perguntar(pergunta="Qual a capital da França?"):
+    inicio = time.perf_counter()
+    resposta = await server.GenAiServiceServicer().AskQuestion(
+        genai_pb2.QuestionRequest(question=pergunta), None
+    )
+    return resposta.answer, time.perf_counter() - inicio
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("modo", ["categorize", "full"])
+async def test_categorizacao_sobrepoe_a_moderacao(monkeypatch, llm, modo):
+    monkeypatch.setattr(server, "SPECULATION_MODE", modo)
+    monkeypatch.setattr(server, "guard_moderation_async", moderacao_lenta(True))
+
+    resposta, decorrido = await _perguntar()
+
+    assert resposta == "Paris."
+    # Sequencial seriam moderação + categorização + resposta = 0.6 s
+    assert decorrido < LATENCIA_MODERACAO + 2 * llm.latencia - 0.1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("modo", ["categorize", "full"])
+async def test_reprovacao_cancela_e_descarta_especulacao(monkeypatch, llm, modo):
+    monkeypatch.setattr(server, "SPECULATION_MODE", modo)
+    monkeypatch.setattr(server, "guard_moderation_async", moderacao_lenta(False))
+    llm.latencia = 1.0
+
+    resposta, decorrido = await _perguntar()
+
+    assert resposta == server.MENSAGEM_BLOQUEIO
+    assert decorrido < llm.latencia
+    assert server.response_cache.get("Qual a capital da França?") is None
+
+
+@pytest.mark.asyncio
+async def test_stream_especulativo_so_emite_apos_aprovacao(monkeypatch, llm):
+    monkeypatch.setattr(server, "SPECULATION_MODE", "full")
+    monkeypatch.setattr(server, "guard_moderation_async", moderacao_lenta(False))
+    llm.latencia = 0.0
+
+    trechos = [c.chunk async for c in server.GenAiServiceServicer().AskQuestionStream(
+        genai_pb2.QuestionRequest(question="Qual a capital da França?"), None
+    )]
+
+    assert trechos == [server.MENSAGEM_BLOQUEIO]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("modo", ["categorize", "full"])
+async def test_falha_na_moderacao_encerra_especulacao(monkeypatch, modo):
+    monkeypatch.setattr(server, "SPECULATION_MODE", modo)
+    especulacao = {}
+
+    async def moderar(consulta, bot, pergunta=""):
+        await asyncio.sleep(0.05)
+        raise RuntimeError("falha no guardrail")
+
+    async def executar(consulta, moderacao=None, historico="", resultados=None):
+        especulacao["tarefa"] = asyncio.current_task()
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(server, "guard_moderation_async", moderar)
+    monkeypatch.setattr(server, "executar_suporte_ao_cliente", executar)
+
+    with pytest.raises(RuntimeError):
+        await server.responder_com_moderacao("Qual a capital da França?")
+
+    # Sem ceder o loop: a execução especulativa já terminou ao propagar o erro
+    assert especulacao["tarefa"].done()
+    assert especulacao["tarefa"].cancelled()
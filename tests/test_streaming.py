@@ -0,0 +1,50 @@
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+from grpc import aio
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import genai_pb2_grpc
+import server
+from cache import ResponseCache
+from grpc_client import GRPCClient
+
+
+async def _aprovar(consulta, bot, pergunta=""):
+    return True
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    # Um único modelo compartilhado: a 1ª chamada categoriza, a 2ª responde
+    llm = FakeListChatModel(responses=["simples", "Paris é a capital da França."])
+    monkeypatch.setattr(server, "chain_registry", server.ChainRegistry(llm=llm))
+    monkeypatch.setattr(server, "guard_moderation_async", _aprovar)
+    monkeypatch.setattr(server, "response_cache", ResponseCache())
+    return llm
+
+
+@pytest.mark.asyncio
+async def test_stream_emite_apenas_tokens_da_resposta(fake_llm):
+    trechos = [t async for t in server.executar_suporte_ao_cliente_stream("Qual a capital da França?")]
+    assert len(trechos) > 1
+    assert "".join(trechos) == "Paris é a capital da França."
+
+
+@pytest.mark.asyncio
+async def test_ask_question_stream_via_grpc(fake_llm):
+    grpc_server = aio.server()
+    genai_pb2_grpc.add_GenAiServiceServicer_to_server(server.GenAiServiceServicer(), grpc_server)
+    port = grpc_server.add_insecure_port("localhost:0")
+    await grpc_server.start()
+    try:
+        client = GRPCClient(port=port)
+        trechos = [t async for t in client.ask_question_stream("Qual a capital da França?")]
+    finally:
+        await grpc_server.stop(grace=None)
+
+    assert len(trechos) > 1
+    assert "".join(trechos) == "Paris é a capital da França."
@@ -0,0 +1,176 @@
+import pytest
+import sys
+import os
+import math
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/app/')))
+
+# O módulo cria um DatabaseManager na importação: mantém o banco e o log fora do repositório
+_TMP = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_FILE", os.path.join(_TMP, "database.db"))
+os.environ.setdefault("AUTH_LOG_FILE", os.path.join(_TMP, "autheticate.log"))
+
+from authenticate import DatabaseManager
+from conversation import (
+    CABECALHO_RESUMO,
+    ConversationStore,
+    ConversationSummarizer,
+    ConversationWindow,
+)
+from metrics import metrics
+
+USUARIO = "a@x.com"
+
+
+def contar(texto):
+    """Contador determinístico (~4 caracteres por token), sem depender do tiktoken."""
+    return math.ceil(len(texto) / 4)
+
+
+class ResumidorFalso:
+    """LLM de resumo falso: registra as chamadas e acumula a contagem de mensagens."""
+
+    def __init__(self):
+        self.chamadas = []
+
+    async def __call__(self, resumo, mensagens):
+        self.chamadas.append((resumo, mensagens))
+        return f"{resumo}+{len(mensagens.splitlines())}" if resumo else str(len(mensagens.splitlines()))
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / "chat.db"))
+    db.add_user(USUARIO)
+    db.initialize_message_limit(USUARIO)
+    return db
+
+
+def gravar_turnos(db, inicio, fim):
+    for i in range(inicio, fim):
+        db.record_turn(USUARIO, f"pergunta {i}", f"resposta {i}")
+
+
+def janela():
+    return ConversationWindow(orcamento=300, fracao_compactada=0.3, tokens_por_mensagem_compactada=10,
+                              contar=contar, max_mensagens_recentes=4)
+
+
+@pytest.mark.asyncio
+async def test_resumo_atualizado_apenas_com_mensagens_novas(db):
+    resumir = ResumidorFalso()
+    resumidor = ConversationSummarizer(resumir, db, turnos_recentes=2, minimo_mensagens=2)
+    gravar_turnos(db, 0, 6)
+
+    assert await resumidor.atualizar(USUARIO)
+    # Os 2 últimos turnos (4 mensagens) ficam fora do resumo
+    assert resumir.chamadas == [("", "\n".join(
+        f"Usuário: pergunta {i}\nAssistente: resposta {i}" for i in range(4)))]
+    ids = [m["id"] for m in db.load_messages(USUARIO)]
+    assert db.get_thread_summary(USUARIO) == ("8", ids[7])
+
+    gravar_turnos(db, 6, 8)
+    assert await resumidor.atualizar(USUARIO)
+    # Só as mensagens que deixaram os turnos recentes são enviadas, com o resumo anterior
+    assert resumir.chamadas[-1] == ("8", "Usuário: pergunta 4\nAssistente: resposta 4\n"
+                                         "Usuário: pergunta 5\nAssistente: resposta 5")
+    assert db.get_thread_summary(USUARIO) == ("8+4", ids[7] + 4)
+
+
+@pytest.mark.asyncio
+async def test_resumo_aguarda_mensagens_suficientes(db):
+    resumir = ResumidorFalso()
+    resumidor = ConversationSummarizer(resumir, db, turnos_recentes=2, minimo_mensagens=4)
+    gravar_turnos(db, 0, 3)
+
+    assert not await resumidor.atualizar(USUARIO)
+    assert resumir.chamadas == []
+    assert await resumidor.resumo(USUARIO) == ""
+
+
+@pytest.mark.asyncio
+async def test_historico_longo_resumido_com_custo_limitado(db):
+    resumir = ResumidorFalso()
+    resumidor = ConversationSummarizer(resumir, db, turnos_recentes=2, minimo_mensagens=2,
+                                       lote=10, max_pendentes=30)
+    gravar_turnos(db, 0, 200)
+
+    assert await resumidor.atualizar(USUARIO)
+    # 400 mensagens pendentes, mas só as 30 mais recentes (fora dos turnos recentes) são resumidas
+    assert len(resumir.chamadas) == 3
+    assert resumir.chamadas[0][1].startswith("Usuário: pergunta 183\n")
+    ids = [m["id"] for m in db.load_messages(USUARIO)]
+    assert db.get_thread_summary(USUARIO) == ("10+10+10", ids[395])
+
+
+@pytest.mark.asyncio
+async def test_historico_com_resumo_e_turnos_recentes(db):
+    resumir = ResumidorFalso()
+    resumidor = ConversationSummarizer(resumir, db, turnos_recentes=2, minimo_mensagens=2)
+    store = ConversationStore(storage=db, criar_janela=janela, resumidor=resumidor)
+    gravar_turnos(db, 0, 10)
+
+    # Pergunta 10: o histórico agenda o resumo dos turnos já gravados
+    await store.historico("c1", USUARIO)
+    await resumidor._tarefas[USUARIO]
+    # O turno é registrado no servidor antes de a interface gravá-lo
+    await store.registrar_turno("c1", "pergunta 10", "resposta 10", USUARIO)
+    assert USUARIO not in resumidor._tarefas
+    gravar_turnos(db, 10, 11)
+    historico = await store.historico("c1", USUARIO)
+
+    # O histórico traz o resumo (16 mensagens) e os 2 últimos turnos, sem compactadas
+    assert historico == "\n".join([
+        CABECALHO_RESUMO, "16", "",
+        "Usuário: pergunta 9", "Assistente: resposta 9",
+        "Usuário: pergunta 10", "Assistente: resposta 10",
+    ])
+    await resumidor.aclose()
+
+
+@pytest.mark.asyncio
+async def test_resumo_persistido_entre_reinicios(db):
+    resumir = ResumidorFalso()
+    gravar_turnos(db, 0, 10)
+    await ConversationSummarizer(resumir, db, turnos_recentes=2).atualizar(USUARIO)
+
+    # Novo processo: o resumo é lido do banco, sem chamar o LLM
+    outro = ResumidorFalso()
+    resumidor = ConversationSummarizer(outro, db, turnos_recentes=2)
+    store = ConversationStore(storage=db, criar_janela=janela, resumidor=resumidor)
+    historico = await store.historico("c1", USUARIO)
+    await resumidor.aclose()
+
+    assert historico.startswith(f"{CABECALHO_RESUMO}\n16\n")
+    assert "pergunta 0" not in historico
+    assert outro.chamadas == []
+
+
+@pytest.mark.asyncio
+async def test_falha_do_llm_mantem_resumo_anterior(db):
+    async def falhar(resumo, mensagens):
+        raise RuntimeError("indisponível")
+
+    db.set_thread_summary(USUARIO, "anterior", 0)
+    gravar_turnos(db, 0, 10)
+    antes = metrics.get("chat_x_summary_failures_total")
+
+    assert not await ConversationSummarizer(falhar, db, turnos_recentes=2).atualizar(USUARIO)
+    assert db.get_thread_summary(USUARIO) == ("anterior", 0)
+    assert metrics.get("chat_x_summary_failures_total") == antes + 1
+
+
+def test_resumo_respeita_o_orcamento_da_janela():
+    conversa = ConversationWindow(orcamento=200, fracao_compactada=0.3, tokens_por_mensagem_compactada=10,
+                                  contar=contar, max_mensagens_recentes=4)
+    for i in range(20):
+        conversa.adicionar("user", f"pergunta {i} " + "detalhe " * 10)
+        conversa.adicionar("assistant", f"resposta {i}")
+    conversa.definir_resumo("fato importante " * 200)
+
+    texto = conversa.texto()
+    assert contar(texto) <= 200
+    assert texto.startswith(CABECALHO_RESUMO)
+    assert "Mensagens anteriores" not in texto
+    assert len(conversa.recentes) == 4